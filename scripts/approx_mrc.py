@@ -0,0 +1,655 @@
+"""
+approximate the LRU miss ratio curve of a trace in one sampled pass (SHARDS and AET)
+
+SHARDS (Waldspurger et al., FAST'15) samples the objects whose hash is below a threshold
+(spatial sampling, see lcs_reader.obj_sample_mask), computes the exact stack distance of the
+sampled requests (lcs_reuse_distance.StackDistance) and scales the distances by 1 / R,
+where R is the sampling rate, a sampled stack distance d estimates a stack distance of d / R
+in the full trace
+    fixed-rate: R is constant
+    fixed-size: at most max_obj objects are sampled, when there are more, the threshold is
+        lowered to the hash of the max_obj + 1th smallest object, the objects above it are
+        removed and the histograms are scaled by R_new / R_old
+the difference between the expected (R * n_req) and the actual number of sampled requests
+(e.g., whether a popular object is sampled) is added to the smallest distance (SHARDS_adj),
+the histograms are in log buckets (BUCKET_PER_OCTAVE buckets per power of 2), so they stay small
+for any rate, the error of the cache size is less than 1%
+
+AET (Hu et al., ATC'16) models the LRU miss ratio from the reuse time (the number of requests
+since the last request to the object), with the sampled reuse time distribution,
+an object stays in the cache for T requests after its last request, the cache holds
+c(T) = integral of P(reuse time > t) for t in [0, T] objects and the miss ratio is P(reuse time > T)
+
+usage:
+    python3 approx_mrc.py trace.lcs.zst --sample-ratio 0.01
+    python3 approx_mrc.py trace.oracleGeneral.zst --trace-format oracleGeneral --max-obj 8192 --aet
+    python3 approx_mrc.py ../data/twitter_cluster52.csv --trace-format csv \\
+        --trace-format-params="time-col=1,obj-id-col=2,obj-size-col=3,delimiter=,,obj-id-is-num=1" \\
+        --byte --sizes 0.01,0.1,1GiB --plot twitter_lru
+
+    from approx_mrc import approx_mrc
+    shards = approx_mrc("trace.lcs.zst", sample_ratio=0.01)
+    mrc_dict = {"LRU": shards.mrc([0.001, 0.01, 0.1])}
+
+"""
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from lcs_reader import (
+    DEFAULT_CHUNK_ROWS,
+    iter_raw_chunks,
+    obj_id_hash,
+    open_trace,
+    read_lcs,
+)
+from lcs_analyzer import AccessTracker
+from lcs_reuse_distance import DEFAULT_CACHE_SIZES, StackDistance, mrc_at_sizes
+from utils.str_utils import conv_size_str_to_int
+
+DEFAULT_SAMPLE_RATIO = 0.01
+
+# the number of histogram buckets per power of 2
+BUCKET_PER_OCTAVE = 64
+
+# the record of an oracleGeneral trace (no header)
+ORACLE_GENERAL_DTYPE = np.dtype(
+    [
+        ("clock_time", "<u4"),
+        ("obj_id", "<u8"),
+        ("obj_size", "<u4"),
+        ("next_access_vtime", "<i8"),
+    ]
+)
+
+# the bytes of csv read at a time
+CSV_BLOCK_SIZE = 64 * 1024 * 1024
+
+
+def _import_pyarrow_csv():
+    try:
+        import pyarrow.csv
+    except ImportError:
+        raise RuntimeError(
+            "csv traces need pyarrow, install it with pip install pyarrow"
+        )
+
+    return pyarrow.csv
+
+
+def parse_trace_format_params(params):
+    """parse the csv parameters of cachesim, e.g.,
+    "time-col=1,obj-id-col=2,obj-size-col=3,delimiter=,,has-header=1,obj-id-is-num=1",
+    the columns start from 1, "delimiter=," is followed by the separator
+
+    Returns:
+        dict: obj_id_col, obj_size_col (0-based, None if missing), delimiter, has_header
+            and obj_id_is_num
+    """
+
+    spec = {
+        "obj_id_col": 0,
+        "obj_size_col": None,
+        "delimiter": ",",
+        "has_header": False,
+        "obj_id_is_num": False,
+    }
+    fields = params.split(",") if params else []
+    i = 0
+    while i < len(fields):
+        field = fields[i].strip()
+        i += 1
+        if not field:
+            continue
+        key, _, value = field.partition("=")
+        if key == "delimiter":
+            if value == "":
+                # the delimiter is the comma, the next field is empty
+                value = ","
+                i += 1
+            spec["delimiter"] = "\t" if value == "\\t" else value
+        elif key == "obj-id-col":
+            spec["obj_id_col"] = int(value) - 1
+        elif key == "obj-size-col":
+            spec["obj_size_col"] = int(value) - 1
+        elif key == "has-header":
+            spec["has_header"] = value.lower() in ("1", "true")
+        elif key == "obj-id-is-num":
+            spec["obj_id_is_num"] = value.lower() in ("1", "true")
+        elif key not in ("time-col", "op-col", "ttl-col", "cnt-col", "tenant-col"):
+            raise ValueError(f"unknown trace format param {key}")
+
+    return spec
+
+
+def str_obj_id(arr):
+    """map a pyarrow string array to uint64 object ids (a polynomial hash of the bytes and
+    the length), vectorized over the offsets and the data buffers of the array
+
+    Returns:
+        np.ndarray: uint64 ids
+    """
+
+    import pyarrow as pa
+
+    n = len(arr)
+    if n == 0:
+        return np.empty(0, dtype=np.uint64)
+    arr = arr.cast(pa.large_string()) if not pa.types.is_large_string(arr.type) else arr
+    _, offset_buf, data_buf = arr.buffers()
+    offsets = np.frombuffer(offset_buf, dtype=np.int64)[arr.offset : arr.offset + n + 1]
+    start = offsets[0]
+    data = np.frombuffer(data_buf, dtype=np.uint8)[start : offsets[-1]]
+    offsets = offsets - start
+    length = np.diff(offsets)
+
+    # byte j of a string of length L has the weight P ** (L - 1 - j) (mod 2**64)
+    max_len = int(length.max())
+    power = np.full(max(max_len, 1), 0x100000001B3, dtype=np.uint64)
+    power[0] = 1
+    power = np.cumprod(power, dtype=np.uint64)
+    end = np.repeat(offsets[1:], length)
+    weighted = data.astype(np.uint64) * power[end - 1 - np.arange(len(data))]
+    cum = np.zeros(len(data) + 1, dtype=np.uint64)
+    np.cumsum(weighted, out=cum[1:])
+
+    return obj_id_hash(
+        (cum[offsets[1:]] - cum[offsets[:-1]]) ^ length.astype(np.uint64)
+    )
+
+
+def _iter_csv(tracepath, trace_format_params, chunk_rows):
+    csv = _import_pyarrow_csv()
+    import pyarrow as pa
+
+    spec = parse_trace_format_params(trace_format_params)
+    id_name = f"f{spec['obj_id_col']}"
+    columns = [id_name]
+    column_types = {id_name: pa.uint64() if spec["obj_id_is_num"] else pa.string()}
+    if spec["obj_size_col"] is not None:
+        size_name = f"f{spec['obj_size_col']}"
+        columns.append(size_name)
+        column_types[size_name] = pa.int64()
+
+    source = open_trace(tracepath) if tracepath.endswith(".zst") else tracepath
+    reader = csv.open_csv(
+        source,
+        read_options=csv.ReadOptions(
+            autogenerate_column_names=True,
+            skip_rows=1 if spec["has_header"] else 0,
+            block_size=CSV_BLOCK_SIZE,
+        ),
+        parse_options=csv.ParseOptions(delimiter=spec["delimiter"]),
+        convert_options=csv.ConvertOptions(
+            include_columns=columns, column_types=column_types
+        ),
+    )
+    for batch in reader:
+        for start in range(0, batch.num_rows, chunk_rows):
+            b = batch.slice(start, chunk_rows)
+            obj_id = b.column(id_name)
+            if spec["obj_id_is_num"]:
+                obj_id = obj_id.to_numpy(zero_copy_only=False)
+            else:
+                obj_id = str_obj_id(obj_id)
+            if spec["obj_size_col"] is None:
+                obj_size = np.ones(len(obj_id), dtype=np.int64)
+            else:
+                obj_size = b.column(size_name).to_numpy(zero_copy_only=False)
+            yield obj_id, obj_size
+
+
+def iter_trace(
+    tracepath, trace_format="lcs", trace_format_params="", chunk_rows=DEFAULT_CHUNK_ROWS
+):
+    """read the obj_id and obj_size of a trace in chunks
+
+    Args:
+        tracepath (str): the path of the trace, lcs and oracleGeneral traces can be zstd compressed
+        trace_format (str, optional): lcs, oracleGeneral, csv or txt (one object id per line)
+        trace_format_params (str, optional): the csv parameters of cachesim
+        chunk_rows (int, optional): the number of requests in each chunk
+
+    Yields:
+        tuple: (obj_id, obj_size) arrays
+    """
+
+    if trace_format == "lcs":
+        for records in read_lcs(tracepath, chunk_rows=chunk_rows):
+            yield records["obj_id"], records["obj_size"]
+    elif trace_format == "oracleGeneral":
+        with open_trace(tracepath) as reader:
+            for records in iter_raw_chunks(reader, ORACLE_GENERAL_DTYPE, chunk_rows):
+                yield records["obj_id"], records["obj_size"]
+    elif trace_format in ("csv", "txt"):
+        if trace_format == "txt" and not trace_format_params:
+            trace_format_params = "obj-id-col=1,delimiter=\\t"
+        yield from _iter_csv(tracepath, trace_format_params, chunk_rows)
+    else:
+        raise ValueError(f"unsupported trace format {trace_format}")
+
+
+def _log_bucket(value):
+    """the bucket of each value >= 1, bucket b > 0 is (2 ** ((b - 2) / k), 2 ** ((b - 1) / k)],
+    bucket 0 is empty, it is the cache size 0
+    """
+
+    return 1 + np.ceil(np.log2(value) * BUCKET_PER_OCTAVE).astype(np.int64)
+
+
+def _bucket_size(n_bucket):
+    """the upper bound of each bucket"""
+
+    size = np.exp2((np.arange(n_bucket) - 1) / BUCKET_PER_OCTAVE)
+    size[0] = 0
+    return size
+
+
+def _add_weights(hist, bucket, weights):
+    """add np.bincount(bucket, weights) to the float histogram, it grows if needed"""
+
+    new_hist = np.bincount(bucket, weights=weights).astype(np.float64)
+    if len(new_hist) < len(hist):
+        new_hist, hist = hist, new_hist
+    new_hist[: len(hist)] += hist
+    return new_hist
+
+
+class Shards:
+    """the approximate LRU miss ratio curve of a stream of requests with SHARDS,
+    and optionally AET, requests are added in chunks of the full trace and sampled here
+
+    req_cnt[b] and req_byte[b] are the (scaled) number and bytes of the sampled requests
+    whose stack distance divided by the rate is in log bucket b, byte_req_cnt and byte_req_byte
+    are the same for the byte stack distance, rt_cnt and rt_byte for the reuse time (AET),
+    requests to new objects are counted in n_cold_req and n_cold_byte
+
+    Args:
+        sample_ratio (float, optional): the sampling rate of fixed-rate SHARDS, in (0, 1],
+            the initial rate if max_obj is set, DEFAULT_SAMPLE_RATIO (1 if max_obj is set) if None
+        max_obj (int, optional): the number of sampled objects of fixed-size SHARDS
+        byte_weighted (bool, optional): whether to compute the byte stack distance
+        aet (bool, optional): whether to compute the reuse time histogram for AET
+    """
+
+    def __init__(
+        self,
+        sample_ratio=None,
+        max_obj=None,
+        byte_weighted=False,
+        aet=False,
+    ):
+        if sample_ratio is None:
+            sample_ratio = DEFAULT_SAMPLE_RATIO if max_obj is None else 1.0
+        if not 0 < sample_ratio <= 1:
+            raise ValueError(f"sample_ratio must be in (0, 1], got {sample_ratio}")
+        self.max_obj = max_obj
+        self.byte_weighted = byte_weighted
+        self.aet = aet
+
+        # an object is sampled if obj_id_hash(obj_id) < threshold, rate = threshold / 2 ** 64
+        self.threshold = min(int(sample_ratio * 2**64), 2**64)
+        # the requests of the full trace
+        self.n_req, self.n_byte = 0, 0
+        # the (scaled) sampled requests
+        self.n_sampled_req, self.n_sampled_byte = 0.0, 0.0
+        self.n_cold_req, self.n_cold_byte = 0.0, 0.0
+        self.req_cnt, self.req_byte = np.zeros(1), np.zeros(1)
+        self.byte_req_cnt, self.byte_req_byte = np.zeros(1), np.zeros(1)
+        self.rt_cnt, self.rt_byte = np.zeros(1), np.zeros(1)
+
+        self._sd = StackDistance(byte_weighted)
+        self._rt_tracker = AccessTracker() if aet else None
+        # the sampled objects sorted by their hash, for fixed-size SHARDS
+        self._obj_hash = np.empty(0, dtype=np.uint64)
+        self._obj_id = np.empty(0, dtype=np.uint64)
+
+    @property
+    def rate(self):
+        """the current sampling rate"""
+
+        return self.threshold / 2**64
+
+    @property
+    def n_obj(self):
+        """the estimated number of objects"""
+
+        return self._sd.n_obj / self.rate
+
+    @property
+    def working_set_byte(self):
+        """the estimated bytes of the objects"""
+
+        return self._sd.working_set_byte / self.rate
+
+    def add(self, obj_id, obj_size):
+        """sample a chunk of requests and add the sampled requests to the histograms
+
+        Args:
+            obj_id (np.ndarray): the object of each request
+            obj_size (np.ndarray): the size of each request
+        """
+
+        obj_id = np.asarray(obj_id, dtype=np.uint64)
+        obj_size = np.asarray(obj_size, dtype=np.int64)
+        vtime = np.arange(self.n_req, self.n_req + len(obj_id), dtype=np.int64)
+        self.n_req += len(obj_id)
+        self.n_byte += int(obj_size.sum())
+
+        obj_hash = obj_id_hash(obj_id)
+        if self.threshold < 2**64:
+            sampled = obj_hash < np.uint64(self.threshold)
+            obj_id, obj_size = obj_id[sampled], obj_size[sampled]
+            vtime, obj_hash = vtime[sampled], obj_hash[sampled]
+
+        if self.max_obj is None:
+            self._add_sampled(obj_id, obj_size, vtime)
+            return
+
+        # a batch adds at most batch_size objects before the sample is shrunk
+        batch_size = max(self.max_obj // 8, 1)
+        while len(obj_id) > 0:
+            self._add_sampled(
+                obj_id[:batch_size], obj_size[:batch_size], vtime[:batch_size]
+            )
+            self._add_obj(obj_id[:batch_size], obj_hash[:batch_size])
+            obj_id, obj_size = obj_id[batch_size:], obj_size[batch_size:]
+            vtime, obj_hash = vtime[batch_size:], obj_hash[batch_size:]
+            if len(self._obj_hash) > self.max_obj:
+                self._lower_threshold()
+                sampled = obj_hash < np.uint64(self.threshold)
+                obj_id, obj_size = obj_id[sampled], obj_size[sampled]
+                vtime, obj_hash = vtime[sampled], obj_hash[sampled]
+
+    def _add_sampled(self, obj_id, obj_size, vtime):
+        if len(obj_id) == 0:
+            return
+
+        rate = self.rate
+        dist, byte_dist = self._sd.add(obj_id, obj_size)
+        reuse = dist > 0
+        size = obj_size[reuse].astype(np.float64)
+        self.n_sampled_req += len(obj_id)
+        self.n_sampled_byte += float(obj_size.sum())
+        self.n_cold_req += float(np.sum(~reuse))
+        self.n_cold_byte += float(np.sum(obj_size[~reuse]))
+
+        bucket = _log_bucket(dist[reuse] / rate)
+        self.req_cnt = _add_weights(self.req_cnt, bucket, None)
+        self.req_byte = _add_weights(self.req_byte, bucket, size)
+        if self.byte_weighted:
+            bucket = _log_bucket(byte_dist[reuse] / rate)
+            self.byte_req_cnt = _add_weights(self.byte_req_cnt, bucket, None)
+            self.byte_req_byte = _add_weights(self.byte_req_byte, bucket, size)
+
+        if self.aet:
+            # the reuse time in the full trace, it does not depend on the rate
+            _, last_vtime, _ = self._rt_tracker.update(obj_id, vtime, vtime)
+            bucket = _log_bucket(vtime[reuse] - last_vtime[reuse])
+            self.rt_cnt = _add_weights(self.rt_cnt, bucket, None)
+            self.rt_byte = _add_weights(self.rt_byte, bucket, size)
+
+    def _add_obj(self, obj_id, obj_hash):
+        """add the objects to the sampled objects sorted by hash"""
+
+        obj_hash = np.concatenate([self._obj_hash, obj_hash])
+        obj_id = np.concatenate([self._obj_id, obj_id])
+        self._obj_hash, idx = np.unique(obj_hash, return_index=True)
+        self._obj_id = obj_id[idx]
+
+    def _lower_threshold(self):
+        """keep the max_obj objects with the smallest hash and rescale the histograms"""
+
+        old_rate = self.rate
+        self.threshold = int(self._obj_hash[self.max_obj])
+        evicted = np.sort(self._obj_id[self.max_obj :])
+        self._obj_hash = self._obj_hash[: self.max_obj]
+        self._obj_id = self._obj_id[: self.max_obj]
+        self._sd.remove(evicted)
+        if self.aet:
+            self._rt_tracker.remove(evicted)
+
+        scale = self.rate / old_rate
+        for name in (
+            "n_sampled_req",
+            "n_sampled_byte",
+            "n_cold_req",
+            "n_cold_byte",
+            "req_cnt",
+            "req_byte",
+            "byte_req_cnt",
+            "byte_req_byte",
+            "rt_cnt",
+            "rt_byte",
+        ):
+            setattr(self, name, getattr(self, name) * scale)
+
+    def _adjust(self, req_cnt, req_byte):
+        """the histograms and the number and bytes of the sampled requests they sum to,
+        the sampled requests can be more or fewer than expected (e.g., a popular object
+        is sampled or not), the difference is put in the first bucket (SHARDS_adj),
+        so the total is the expected rate * n_req, the scaled histograms of fixed-size
+        SHARDS are in the unit of the current rate
+
+        Returns:
+            tuple: (req_cnt, req_byte, n_req, n_byte)
+        """
+
+        n_req, n_byte = self.n_sampled_req, self.n_sampled_byte
+        req_cnt = np.pad(req_cnt, (0, max(2 - len(req_cnt), 0)))
+        req_byte = np.pad(req_byte, (0, max(2 - len(req_byte), 0)))
+        req_cnt[1] += self.n_req * self.rate - n_req
+        req_byte[1] += self.n_byte * self.rate - n_byte
+        return req_cnt, req_byte, self.n_req * self.rate, self.n_byte * self.rate
+
+    def miss_ratio_curve(self, ignore_obj_size=True):
+        """the approximate miss ratio of LRU at the upper bound of every histogram bucket
+
+        Args:
+            ignore_obj_size (bool, optional): the cache size is the number of objects if True,
+                otherwise bytes, which needs byte_weighted
+
+        Returns:
+            tuple: (cache_size, miss_ratio, byte_miss_ratio) arrays
+        """
+
+        if ignore_obj_size:
+            req_cnt, req_byte = self.req_cnt, self.req_byte
+        else:
+            assert self.byte_weighted, "byte stack distance is not computed"
+            req_cnt, req_byte = self.byte_req_cnt, self.byte_req_byte
+
+        req_cnt, req_byte, n_req, n_byte = self._adjust(req_cnt, req_byte)
+        n_miss = n_req - np.cumsum(req_cnt)
+        n_miss_byte = n_byte - np.cumsum(req_byte)
+
+        return (
+            _bucket_size(len(req_cnt)),
+            np.clip(n_miss / max(n_req, 1e-9), 0, 1),
+            np.clip(n_miss_byte / max(n_byte, 1e-9), 0, 1),
+        )
+
+    def aet_miss_ratio_curve(self, ignore_obj_size=True):
+        """the miss ratio of LRU modeled by AET at the upper bound of every reuse time bucket
+
+        Args:
+            ignore_obj_size (bool, optional): the cache size is the number of objects if True,
+                otherwise bytes (the average bytes of the requests not reused within t requests)
+
+        Returns:
+            tuple: (cache_size, miss_ratio, byte_miss_ratio) arrays
+        """
+
+        assert self.aet, "reuse time is not computed"
+        rt_cnt, rt_byte, n_req, n_byte = self._adjust(self.rt_cnt, self.rt_byte)
+        n_req, n_byte = max(n_req, 1e-9), max(n_byte, 1e-9)
+        # P(reuse time > t) at the upper bound of each bucket, the cold misses never reuse
+        tail = (n_req - np.cumsum(rt_cnt)) / n_req
+        tail_byte = (n_byte - np.cumsum(rt_byte)) / n_byte
+        rt = _bucket_size(len(rt_cnt))
+
+        # the integral of the tail from 0 to rt (trapezoid in each bucket), the tail is 1 at 0
+        occupancy = tail if ignore_obj_size else tail_byte * n_byte / n_req
+        prev = np.concatenate([[occupancy[0]], occupancy[:-1]])
+        cache_size = np.cumsum(np.diff(rt, prepend=0) * (occupancy + prev) / 2)
+
+        return cache_size, np.clip(tail, 0, 1), np.clip(tail_byte, 0, 1)
+
+    def mrc(self, cache_sizes, ignore_obj_size=True):
+        """the approximate LRU miss ratio at the cache sizes in the mrc_dict format of
+        plot_mrc_size, a size smaller than 1 is a fraction of the estimated working set
+
+        Returns:
+            list: [(cache_size, miss_ratio, byte_miss_ratio)]
+        """
+
+        working_set = self.n_obj if ignore_obj_size else self.working_set_byte
+        return mrc_at_sizes(
+            self.miss_ratio_curve(ignore_obj_size), working_set, cache_sizes
+        )
+
+    def aet_mrc(self, cache_sizes, ignore_obj_size=True):
+        """the LRU miss ratio modeled by AET at the cache sizes, the same format as mrc"""
+
+        working_set = self.n_obj if ignore_obj_size else self.working_set_byte
+        return mrc_at_sizes(
+            self.aet_miss_ratio_curve(ignore_obj_size), working_set, cache_sizes
+        )
+
+
+def approx_mrc(
+    tracepath,
+    trace_format="lcs",
+    trace_format_params="",
+    sample_ratio=None,
+    max_obj=None,
+    byte_weighted=False,
+    aet=False,
+    n_req=-1,
+    chunk_rows=DEFAULT_CHUNK_ROWS,
+):
+    """sample a trace and compute the histograms of the approximate LRU miss ratio curve
+
+    Args:
+        tracepath (str): the path of the trace
+        trace_format (str, optional): lcs, oracleGeneral, csv or txt
+        trace_format_params (str, optional): the csv parameters of cachesim
+        sample_ratio (float, optional): the sampling rate (the initial rate if max_obj is set),
+            DEFAULT_SAMPLE_RATIO (1 if max_obj is set) if None
+        max_obj (int, optional): the number of sampled objects of fixed-size SHARDS
+        byte_weighted (bool, optional): whether to compute the byte stack distance
+        aet (bool, optional): whether to compute the reuse time histogram for AET
+        n_req (int, optional): the number of requests to use, -1 means all
+        chunk_rows (int, optional): the number of requests read at a time
+
+    Returns:
+        Shards: the histograms
+    """
+
+    shards = Shards(sample_ratio, max_obj, byte_weighted, aet)
+    for obj_id, obj_size in iter_trace(
+        tracepath, trace_format, trace_format_params, chunk_rows
+    ):
+        if n_req >= 0:
+            obj_id, obj_size = (
+                obj_id[: n_req - shards.n_req],
+                obj_size[: n_req - shards.n_req],
+            )
+        if len(obj_id) == 0:
+            break
+        shards.add(obj_id, obj_size)
+
+    return shards
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    p = ArgumentParser(
+        description="approximate the LRU miss ratio curve of a trace with SHARDS"
+    )
+    p.add_argument(
+        "tracepath", help="the trace, lcs and oracleGeneral can be zstd compressed"
+    )
+    p.add_argument(
+        "--trace-format",
+        help="lcs, oracleGeneral, csv or txt",
+        default="lcs",
+    )
+    p.add_argument(
+        "--trace-format-params",
+        help="the csv parameters of cachesim, e.g., obj-id-col=2,obj-size-col=3,delimiter=,",
+        default="",
+    )
+    p.add_argument(
+        "--sizes",
+        help="comma separated cache sizes, a size smaller than 1 is a fraction of the working set",
+        default=DEFAULT_CACHE_SIZES,
+    )
+    p.add_argument(
+        "--byte",
+        action="store_true",
+        help="the cache size is in bytes (the byte stack distance)",
+    )
+    p.add_argument(
+        "--sample-ratio",
+        type=float,
+        help=f"the sampling rate of fixed-rate SHARDS (the initial rate of fixed-size), "
+        f"{DEFAULT_SAMPLE_RATIO} by default (1 with --max-obj)",
+        default=None,
+    )
+    p.add_argument(
+        "--max-obj",
+        type=int,
+        help="use fixed-size SHARDS with this number of sampled objects",
+        default=None,
+    )
+    p.add_argument("--aet", action="store_true", help="also model the mrc with AET")
+    p.add_argument(
+        "--num-req", type=int, help="the number of requests to use", default=-1
+    )
+    p.add_argument("--plot", help="plot the mrc to {plot}.pdf", default=None)
+    args = p.parse_args()
+
+    shards = approx_mrc(
+        args.tracepath,
+        args.trace_format,
+        args.trace_format_params,
+        sample_ratio=args.sample_ratio,
+        max_obj=args.max_obj,
+        byte_weighted=args.byte,
+        aet=args.aet,
+        n_req=args.num_req,
+    )
+    # 0.01 is a fraction of the working set, 1GiB and 1000 are sizes
+    sizes = [
+        conv_size_str_to_int(s) if s.endswith("B") else float(s)
+        for s in args.sizes.split(",")
+    ]
+    mrc_dict = {"LRU (SHARDS)": shards.mrc(sizes, ignore_obj_size=not args.byte)}
+    if args.aet:
+        mrc_dict["LRU (AET)"] = shards.aet_mrc(sizes, ignore_obj_size=not args.byte)
+
+    print(
+        f"{shards.n_req} req, sampling rate {shards.rate:.6f}, "
+        f"{shards.n_sampled_req:.0f} sampled req, estimated {shards.n_obj:.0f} obj, "
+        f"working set {shards.working_set_byte:.0f} bytes"
+    )
+    for algo, mrc in mrc_dict.items():
+        for cache_size, miss_ratio, byte_miss_ratio in mrc:
+            print(
+                f"{algo} cache size {cache_size:16}, miss ratio {miss_ratio:.4f}, "
+                f"byte miss ratio {byte_miss_ratio:.4f}"
+            )
+
+    if args.plot:
+        from plot_mrc_size import plot_mrc_size
+
+        plot_mrc_size(
+            mrc_dict,
+            cache_size_has_unit=args.byte,
+            use_byte_miss_ratio=False,
+            name=args.plot,
+        )
@@ -0,0 +1,757 @@
+"""
+compute the distributions of traceAnalyzer (reuse, size, popularity, reqRate, reuseWindow
+and popularityDecay) from a lcs trace in Python, without building or running the C++ binary
+
+the trace is read in one pass, each chunk of records is annotated with the per-request information
+that traceAnalyzer computes (time since the first request, time window, the last access of the object,
+whether the object is new) by an AccessTracker and fed to all the enabled analyzers,
+the results are numpy arrays, and dump() writes the same text files as traceAnalyzer,
+so the plot scripts in traceAnalysis work on them, the reuse, reuseWindow, popularity and
+popularityDecay data are also saved as npz (see utils/plot_data_utils.py), which the plot scripts load much faster
+
+the time windows are aligned to the first request, traceAnalyzer counts the request that closes
+a window in the closing window and drops the last window, so the per-window results can differ
+slightly at window boundaries
+
+usage:
+    python3 lcs_analyzer.py trace.lcs.zst
+    python3 lcs_analyzer.py trace.lcs.zst --analyzers reuse,popularity --time-window 600
+    python3 traceAnalysis/reuse.py trace.lcs.zst.reuse
+
+    from lcs_analyzer import analyze
+    result = analyze("trace.lcs.zst", ["reuse", "reqRate"])
+    rtime, cnt = result["reuse"].rtime_distribution()
+    result["reqRate"].req_rate
+
+"""
+
+import os
+import sys
+import numpy as np
+from collections import namedtuple
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from lcs_reader import DEFAULT_CHUNK_ROWS, obj_id_hash, read_lcs
+from lcs_writer import zipf_alpha
+from utils.plot_data_utils import rows_to_csr, save_plot_data
+
+# the defaults of traceAnalyzer
+DEFAULT_TIME_WINDOW = 300
+DEFAULT_WARMUP_SEC = 86400
+DEFAULT_RTIME_GRANULARITY = 5
+DEFAULT_LOG_BASE = 1.5
+
+# a chunk of records with the per-request information used by the analyzers
+#   rtime: the time since the first request of the trace
+#   vtime: the index of the request in the trace, starting from 1
+#   window: the time window of the request, i.e., rtime // time_window
+#   last_rtime, last_vtime: the rtime and vtime of the last access to the object, -1 for a new object
+#   create_rtime: the rtime of the first access to the object
+#   compulsory: whether this is the first access to the object
+#   first_seen_in_window: whether this is the first access to the object in the window
+AnnotatedChunk = namedtuple(
+    "AnnotatedChunk",
+    [
+        "records",
+        "rtime",
+        "vtime",
+        "window",
+        "last_rtime",
+        "last_vtime",
+        "create_rtime",
+        "compulsory",
+        "first_seen_in_window",
+    ],
+)
+
+
+def _add_counts(cnt, values, weights=None):
+    """add np.bincount(values, weights) to the counts in cnt, cnt grows if needed"""
+
+    new_cnt = np.bincount(values, weights=weights).astype(np.int64)
+    if len(new_cnt) < len(cnt):
+        new_cnt, cnt = cnt, new_cnt
+    new_cnt[: len(cnt)] += cnt
+    return new_cnt
+
+
+def _split_windows(window):
+    """(window, start, end) of each run of the same window in a sorted window array"""
+
+    if len(window) == 0:
+        return iter(())
+    bounds = np.flatnonzero(np.diff(window)) + 1
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [len(window)]])
+    return zip(window[starts].tolist(), starts.tolist(), ends.tolist())
+
+
+class ValueCounter:
+    """the count of each value of a stream of integer arrays"""
+
+    def __init__(self):
+        self.values = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def add(self, values):
+        values, counts = np.unique(values, return_counts=True)
+        values, inverse = np.unique(
+            np.concatenate([self.values, values]), return_inverse=True
+        )
+        self.counts = np.bincount(
+            inverse, weights=np.concatenate([self.counts, counts])
+        ).astype(np.int64)
+        self.values = values
+
+
+class AccessTracker:
+    """the last access of each object, updated a chunk of requests at a time
+
+    the objects are kept in arrays in the order they are first seen, and found by an open
+    addressing hash table (linear probing, at most half full) of their indexes in the arrays,
+    so that a chunk costs O(chunk size) no matter how many objects have been seen
+    """
+
+    FIELDS = ("obj_id", "last_rtime", "last_vtime", "create_rtime", "freq")
+
+    def __init__(self):
+        self._n_obj = 0
+        # the index of the object in each slot, -1 for an empty slot
+        self._table = np.full(1024, -1, dtype=np.int64)
+        self._arrays = {
+            name: np.empty(1024, dtype=np.uint64 if name == "obj_id" else np.int64)
+            for name in AccessTracker.FIELDS
+        }
+
+    def __len__(self):
+        return self._n_obj
+
+    def __getattr__(self, name):
+        # obj_id, last_rtime, last_vtime, create_rtime and freq of the objects in the order
+        # they are first seen
+        if name not in AccessTracker.FIELDS:
+            raise AttributeError(name)
+        return self._arrays[name][: self._n_obj]
+
+    def _find(self, obj_id):
+        """the index of each object in the arrays, -1 if the object is not tracked"""
+
+        mask = len(self._table) - 1
+        pos = (obj_id_hash(obj_id) & np.uint64(mask)).astype(np.int64)
+        idx = np.full(len(obj_id), -1, dtype=np.int64)
+        tracked_id = self._arrays["obj_id"]
+        probing = np.arange(len(obj_id))
+        while len(probing) > 0:
+            slot_idx = self._table[pos[probing]]
+            occupied = slot_idx >= 0
+            hit = np.zeros(len(probing), dtype=bool)
+            hit[occupied] = tracked_id[slot_idx[occupied]] == obj_id[probing[occupied]]
+            idx[probing[hit]] = slot_idx[hit]
+            probing = probing[occupied & ~hit]
+            pos[probing] = (pos[probing] + 1) & mask
+
+        return idx
+
+    def _insert_slots(self, obj_id, idx):
+        """put idx of the objects (not in the table) into the table"""
+
+        mask = len(self._table) - 1
+        pos = (obj_id_hash(obj_id) & np.uint64(mask)).astype(np.int64)
+        probing = np.arange(len(obj_id))
+        while len(probing) > 0:
+            slot = pos[probing]
+            empty = self._table[slot] < 0
+            # one of the objects probing the same empty slot takes it, the others go on
+            self._table[slot[empty]] = idx[probing[empty]]
+            taken = empty & (self._table[slot] == idx[probing])
+            probing = probing[~taken]
+            pos[probing] = (pos[probing] + 1) & mask
+
+    def _add(self, **columns):
+        """append new objects to the arrays and the table"""
+
+        n, n_new = self._n_obj, len(columns["obj_id"])
+        capacity = len(self._arrays["obj_id"])
+        if n + n_new > capacity:
+            capacity = max(capacity * 2, n + n_new)
+            for name, array in self._arrays.items():
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:n] = array[:n]
+                self._arrays[name] = grown
+        for name, values in columns.items():
+            self._arrays[name][n : n + n_new] = values
+        self._n_obj += n_new
+
+        if self._n_obj * 2 > len(self._table):
+            self._rebuild_table(len(self._table) * 2)
+        else:
+            self._insert_slots(columns["obj_id"], np.arange(n, n + n_new))
+
+    def _rebuild_table(self, size):
+        while self._n_obj * 2 > size:
+            size *= 2
+        self._table = np.full(size, -1, dtype=np.int64)
+        self._insert_slots(self.obj_id, np.arange(self._n_obj))
+
+    def update(self, obj_id, rtime, vtime):
+        """record a chunk of requests
+
+        Args:
+            obj_id (np.ndarray): the object of each request
+            rtime (np.ndarray): the time of each request
+            vtime (np.ndarray): the index of each request
+
+        Returns:
+            tuple: last_rtime, last_vtime (-1 for a new object) and create_rtime of each request
+        """
+
+        n = len(obj_id)
+        order = np.argsort(obj_id, kind="stable")
+        sorted_id = obj_id[order]
+        sorted_rtime, sorted_vtime = rtime[order], vtime[order]
+
+        # each group is the requests to one object in the chunk
+        first = np.empty(n, dtype=bool)
+        first[0] = True
+        np.not_equal(sorted_id[1:], sorted_id[:-1], out=first[1:])
+        group_start = np.flatnonzero(first)
+        group_end = np.append(group_start[1:], n)
+        group_size = group_end - group_start
+        uniq_id = sorted_id[group_start]
+
+        idx = self._find(uniq_id)
+        found = idx >= 0
+        found_idx = idx[found]
+
+        # the last access before the chunk, then the previous request in the group
+        sorted_last_rtime = np.empty(n, dtype=np.int64)
+        sorted_last_vtime = np.empty(n, dtype=np.int64)
+        sorted_last_rtime[1:] = sorted_rtime[:-1]
+        sorted_last_vtime[1:] = sorted_vtime[:-1]
+        group_last_rtime = np.full(len(uniq_id), -1, dtype=np.int64)
+        group_last_vtime = np.full(len(uniq_id), -1, dtype=np.int64)
+        group_last_rtime[found] = self.last_rtime[found_idx]
+        group_last_vtime[found] = self.last_vtime[found_idx]
+        sorted_last_rtime[group_start] = group_last_rtime
+        sorted_last_vtime[group_start] = group_last_vtime
+
+        group_create_rtime = sorted_rtime[group_start]
+        group_create_rtime[found] = self.create_rtime[found_idx]
+        sorted_create_rtime = np.repeat(group_create_rtime, group_size)
+
+        # update the objects seen before, then add the new objects
+        last_pos = group_end - 1
+        self.last_rtime[found_idx] = sorted_rtime[last_pos[found]]
+        self.last_vtime[found_idx] = sorted_vtime[last_pos[found]]
+        self.freq[found_idx] += group_size[found]
+        new = ~found
+        if new.any():
+            self._add(
+                obj_id=uniq_id[new],
+                last_rtime=sorted_rtime[last_pos[new]],
+                last_vtime=sorted_vtime[last_pos[new]],
+                create_rtime=group_create_rtime[new],
+                freq=group_size[new],
+            )
+
+        last_rtime = np.empty(n, dtype=np.int64)
+        last_vtime = np.empty(n, dtype=np.int64)
+        create_rtime = np.empty(n, dtype=np.int64)
+        last_rtime[order] = sorted_last_rtime
+        last_vtime[order] = sorted_last_vtime
+        create_rtime[order] = sorted_create_rtime
+        return last_rtime, last_vtime, create_rtime
+
+    def remove(self, obj_id):
+        """forget a set of tracked objects, the arrays and the table are rebuilt,
+        so it is meant to be called once in a while with many objects
+
+        Args:
+            obj_id (np.ndarray): distinct objects that have been updated
+
+        Returns:
+            np.ndarray: the last_vtime of each object
+        """
+
+        idx = self._find(obj_id)
+        assert np.all(idx >= 0), "removing untracked objects"
+        last_vtime = self.last_vtime[idx]
+
+        keep = np.ones(self._n_obj, dtype=bool)
+        keep[idx] = False
+        n_keep = int(np.sum(keep))
+        for array in self._arrays.values():
+            array[:n_keep] = array[: self._n_obj][keep]
+        self._n_obj = n_keep
+        self._rebuild_table(1024)
+
+        return last_vtime
+
+
+class ReqRate:
+    """the number of requests, bytes, objects and new objects in each time window"""
+
+    PARAMS = ("time_window",)
+
+    def __init__(self, time_window=DEFAULT_TIME_WINDOW):
+        self.time_window = time_window
+        self.n_req = np.empty(0, dtype=np.int64)
+        self.n_byte = np.empty(0, dtype=np.int64)
+        self.n_obj = np.empty(0, dtype=np.int64)
+        self.n_new_obj = np.empty(0, dtype=np.int64)
+
+    def add(self, chunk):
+        window = chunk.window
+        self.n_req = _add_counts(self.n_req, window)
+        self.n_byte = _add_counts(self.n_byte, window, chunk.records["obj_size"])
+        self.n_obj = _add_counts(self.n_obj, window[chunk.first_seen_in_window])
+        self.n_new_obj = _add_counts(self.n_new_obj, window[chunk.compulsory])
+
+    def finish(self, tracker, n_window):
+        # the windows without requests at the end of the counts
+        for name in ("n_req", "n_byte", "n_obj", "n_new_obj"):
+            cnt = getattr(self, name)
+            setattr(self, name, np.pad(cnt, (0, n_window - len(cnt))))
+
+    @property
+    def req_rate(self):
+        return self.n_req / self.time_window
+
+    @property
+    def byte_rate(self):
+        return self.n_byte / self.time_window
+
+    @property
+    def obj_rate(self):
+        return self.n_obj / self.time_window
+
+    @property
+    def new_obj_rate(self):
+        return self.n_new_obj / self.time_window
+
+    def dump(self, path_base):
+        tw = self.time_window
+        with open(f"{path_base}.reqRate_w{tw}", "w") as f:
+            f.write(f"# {path_base}\n")
+            for desc, cnt in (
+                ("req rate", self.n_req),
+                ("byte rate", self.n_byte),
+                ("obj rate", self.n_obj),
+                ("first seen obj (cold miss) rate", self.n_new_obj),
+            ):
+                f.write(f"# {desc} - time window {tw} second\n")
+                f.write("".join(f"{v}," for v in (cnt // tw).tolist()) + "\n")
+
+
+class SizeDistribution:
+    """the number of requests and objects of each object size,
+    the size of an object is the size of its first request
+    """
+
+    PARAMS = ()
+
+    def __init__(self):
+        self.req_cnt = ValueCounter()
+        self.obj_cnt = ValueCounter()
+
+    def add(self, chunk):
+        obj_size = chunk.records["obj_size"].astype(np.int64)
+        self.req_cnt.add(obj_size)
+        self.obj_cnt.add(obj_size[chunk.compulsory])
+
+    def finish(self, tracker, n_window):
+        pass
+
+    def dump(self, path_base):
+        with open(f"{path_base}.size", "w") as f:
+            f.write(f"# {path_base}\n")
+            f.write("# object_size: req_cnt\n")
+            for size, cnt in zip(self.req_cnt.values.tolist(), self.req_cnt.counts):
+                f.write(f"{size}:{cnt}\n")
+            f.write("# object_size: obj_cnt\n")
+            for size, cnt in zip(self.obj_cnt.values.tolist(), self.obj_cnt.counts):
+                f.write(f"{size}:{cnt}\n")
+
+
+class ReuseDistribution:
+    """the distribution of the time since the last access to the object (reuse time),
+    in real time buckets of rtime_granularity seconds and in virtual time (the number of requests)
+    buckets of log_base, and the same distributions in each time window (reuseWindow),
+    bucket -1 is the requests to new objects
+
+    window_rtime_cnt[w][b] and window_vtime_cnt[w][b] are the number of requests in window w
+    with reuse time in bucket b, requests to new objects are not counted
+    """
+
+    PARAMS = ("time_window", "rtime_granularity", "log_base")
+
+    def __init__(
+        self,
+        time_window=DEFAULT_TIME_WINDOW,
+        rtime_granularity=DEFAULT_RTIME_GRANULARITY,
+        log_base=DEFAULT_LOG_BASE,
+    ):
+        self.time_window = time_window
+        self.rtime_granularity = rtime_granularity
+        self.log_base = log_base
+        # index 0 is bucket -1
+        self._rtime_cnt = np.empty(0, dtype=np.int64)
+        self._vtime_cnt = np.empty(0, dtype=np.int64)
+        self.window_rtime_cnt = []
+        self.window_vtime_cnt = []
+
+    def add(self, chunk):
+        reuse = ~chunk.compulsory
+        rtime_bucket = np.full(len(reuse), -1, dtype=np.int64)
+        vtime_bucket = np.full(len(reuse), -1, dtype=np.int64)
+        rtime_bucket[reuse] = (
+            chunk.rtime[reuse] - chunk.last_rtime[reuse]
+        ) // self.rtime_granularity
+        vtime_bucket[reuse] = (
+            np.log((chunk.vtime[reuse] - chunk.last_vtime[reuse]).astype(np.float64))
+            / np.log(self.log_base)
+        ).astype(np.int64)
+        self._rtime_cnt = _add_counts(self._rtime_cnt, rtime_bucket + 1)
+        self._vtime_cnt = _add_counts(self._vtime_cnt, vtime_bucket + 1)
+
+        window = chunk.window[reuse]
+        rtime_bucket, vtime_bucket = rtime_bucket[reuse], vtime_bucket[reuse]
+        for w, start, end in _split_windows(window):
+            while len(self.window_rtime_cnt) <= w:
+                self.window_rtime_cnt.append(np.empty(0, dtype=np.int64))
+                self.window_vtime_cnt.append(np.empty(0, dtype=np.int64))
+            self.window_rtime_cnt[w] = _add_counts(
+                self.window_rtime_cnt[w], rtime_bucket[start:end]
+            )
+            self.window_vtime_cnt[w] = _add_counts(
+                self.window_vtime_cnt[w], vtime_bucket[start:end]
+            )
+
+    def finish(self, tracker, n_window):
+        # the windows at the end of the trace without reuse
+        while len(self.window_rtime_cnt) < n_window:
+            self.window_rtime_cnt.append(np.empty(0, dtype=np.int64))
+            self.window_vtime_cnt.append(np.empty(0, dtype=np.int64))
+
+    @staticmethod
+    def _distribution(cnt):
+        buckets = np.flatnonzero(cnt)
+        return buckets - 1, cnt[buckets]
+
+    def rtime_distribution(self):
+        """
+        Returns:
+            tuple: (bucket, cnt), the reuse time of bucket b is in
+                [b * rtime_granularity, (b + 1) * rtime_granularity) seconds
+        """
+
+        return self._distribution(self._rtime_cnt)
+
+    def vtime_distribution(self):
+        """
+        Returns:
+            tuple: (bucket, cnt), the reuse time of bucket b is in
+                [log_base ** b, log_base ** (b + 1)) requests
+        """
+
+        return self._distribution(self._vtime_cnt)
+
+    def dump(self, path_base):
+        with open(f"{path_base}.reuse", "w") as f:
+            f.write(f"# {path_base}\n")
+            f.write(
+                f"# reuse real time: freq (time granularity {self.rtime_granularity})\n"
+            )
+            for bucket, cnt in zip(*self.rtime_distribution()):
+                f.write(f"{bucket}:{cnt}\n")
+            f.write(f"# reuse virtual time: freq (log base {self.log_base})\n")
+            for bucket, cnt in zip(*self.vtime_distribution()):
+                f.write(f"{bucket}:{cnt}\n")
+        rtime_bucket, rtime_cnt = self.rtime_distribution()
+        vtime_bucket, vtime_cnt = self.vtime_distribution()
+        save_plot_data(
+            f"{path_base}.reuse",
+            "reuse",
+            {
+                "rtime_bucket": rtime_bucket,
+                "rtime_cnt": rtime_cnt,
+                "vtime_bucket": vtime_bucket,
+                "vtime_cnt": vtime_cnt,
+            },
+            time_granularity=self.rtime_granularity,
+            log_base=self.log_base,
+        )
+
+        tw = self.time_window
+        for suffix, desc, window_cnt, metadata in (
+            (
+                "rt",
+                f"reuse real time distribution per window "
+                f"(time granularity {self.rtime_granularity}, time window {tw})",
+                self.window_rtime_cnt,
+                {
+                    "time": "real",
+                    "time_granularity": self.rtime_granularity,
+                    "log_base": 0,
+                },
+            ),
+            (
+                "vt",
+                f"reuse virtual time distribution per window "
+                f"(log base {self.log_base}, time window {tw})",
+                self.window_vtime_cnt,
+                {"time": "virtual", "time_granularity": 0, "log_base": self.log_base},
+            ),
+        ):
+            with open(f"{path_base}.reuseWindow_w{tw}_{suffix}", "w") as f:
+                f.write(f"# {path_base}\n# {desc}\n")
+                for cnt in window_cnt:
+                    f.write("".join(f"{v}," for v in cnt.tolist()) + "\n")
+            cnt, offsets = rows_to_csr(window_cnt)
+            save_plot_data(
+                f"{path_base}.reuseWindow_w{tw}_{suffix}",
+                "reuseWindow",
+                {"cnt": cnt, "offsets": offsets},
+                time_window=tw,
+                **metadata,
+            )
+
+
+class Popularity:
+    """the request count (frequency) of the objects and the Zipf alpha of the trace,
+    n_obj[i] objects are requested freq[i] times, freq is in descending order
+    """
+
+    PARAMS = ()
+
+    def __init__(self):
+        self.freq = np.empty(0, dtype=np.int64)
+        self.n_obj = np.empty(0, dtype=np.int64)
+        self.alpha = 0.0
+
+    def add(self, chunk):
+        pass
+
+    def finish(self, tracker, n_window):
+        freq, n_obj = np.unique(tracker.freq, return_counts=True)
+        self.freq, self.n_obj = freq[::-1], n_obj[::-1]
+        self.alpha = zipf_alpha(self.freq, self.n_obj)
+
+    def sorted_freq(self):
+        """the frequency of each object in descending order, i.e., the Zipf plot"""
+
+        return np.repeat(self.freq, self.n_obj)
+
+    def dump(self, path_base):
+        with open(f"{path_base}.popularity", "w") as f:
+            f.write(f"# {path_base}\n")
+            f.write("# freq (sorted):cnt - for Zipf plot\n")
+            for freq, cnt in zip(self.freq.tolist(), self.n_obj.tolist()):
+                f.write(f"{freq}:{cnt}\n")
+        save_plot_data(
+            f"{path_base}.popularity",
+            "popularity",
+            {"freq": self.freq, "n_obj": self.n_obj},
+        )
+
+
+class PopularityDecay:
+    """how the objects created (first requested) in a time window are requested in the later windows,
+    the first warmup_sec of the trace is skipped
+
+    n_req[i][j] and n_obj[i][j] are the number of requests and objects in window i (after warmup)
+    to the objects created in window j (after warmup), j <= i
+    """
+
+    PARAMS = ("time_window", "warmup_sec")
+
+    def __init__(self, time_window=DEFAULT_TIME_WINDOW, warmup_sec=DEFAULT_WARMUP_SEC):
+        if warmup_sec % time_window != 0:
+            raise ValueError("warmup_sec needs to be a multiple of time_window")
+        self.time_window = time_window
+        self.warmup_sec = warmup_sec
+        self.shift = warmup_sec // time_window
+        self._req_cnt = ValueCounter()
+        self._obj_cnt = ValueCounter()
+        self.n_req = np.zeros((0, 0), dtype=np.int64)
+        self.n_obj = np.zeros((0, 0), dtype=np.int64)
+
+    def add(self, chunk):
+        create_window = chunk.create_rtime // self.time_window
+        mask = (chunk.rtime >= self.warmup_sec) & (create_window >= self.shift)
+        key = ((chunk.window[mask] - self.shift) << 32) | (
+            create_window[mask] - self.shift
+        )
+        self._req_cnt.add(key)
+        self._obj_cnt.add(key[chunk.first_seen_in_window[mask]])
+
+    def finish(self, tracker, n_window):
+        n_window = max(n_window - self.shift, 0)
+        for name, counter in (("n_req", self._req_cnt), ("n_obj", self._obj_cnt)):
+            matrix = np.zeros((n_window, n_window), dtype=np.int64)
+            matrix[counter.values >> 32, counter.values & 0xFFFFFFFF] = counter.counts
+            setattr(self, name, matrix)
+
+    def dump(self, path_base):
+        tw = self.time_window
+        with open(f"{path_base}.popularityDecay_w{tw}_obj", "w") as f:
+            f.write(f"# {path_base}\n")
+            f.write(f"# obj_cnt for new object in prev N windows (time window {tw})\n")
+            # each line ends with 0 and the first line is 0 as traceAnalyzer does
+            f.write("0,\n")
+            for i, row in enumerate(self.n_obj):
+                f.write("".join(f"{v}," for v in row[: i + 1].tolist()) + "0,\n")
+        save_plot_data(
+            f"{path_base}.popularityDecay_w{tw}_obj",
+            "popularityDecay",
+            {"n_obj": self.n_obj},
+            time_window=tw,
+            warmup_sec=self.warmup_sec,
+        )
+
+
+ANALYZERS = {
+    "reqRate": ReqRate,
+    "size": SizeDistribution,
+    "reuse": ReuseDistribution,
+    "popularity": Popularity,
+    "popularityDecay": PopularityDecay,
+}
+
+# the same as traceAnalyzer --common
+DEFAULT_ANALYZERS = ("reqRate", "size", "reuse", "popularity")
+
+
+def analyze(
+    ifilepath,
+    analyzers=DEFAULT_ANALYZERS,
+    time_window=DEFAULT_TIME_WINDOW,
+    warmup_sec=DEFAULT_WARMUP_SEC,
+    rtime_granularity=DEFAULT_RTIME_GRANULARITY,
+    log_base=DEFAULT_LOG_BASE,
+    n_req=-1,
+    chunk_rows=DEFAULT_CHUNK_ROWS,
+):
+    """analyze a lcs trace in one pass with the analyzers
+
+    Args:
+        ifilepath (str): the path of the lcs trace
+        analyzers (Iterable[str], optional): the names of the analyzers in ANALYZERS
+        time_window (int, optional): the time window in seconds
+        warmup_sec (int, optional): the warmup time of popularityDecay
+        rtime_granularity (int, optional): the real time bucket of reuse
+        log_base (float, optional): the virtual time log bucket of reuse
+        n_req (int, optional): the number of requests to analyze, -1 means all
+        chunk_rows (int, optional): the number of requests read at a time
+
+    Returns:
+        dict: {name: analyzer}
+    """
+
+    params = {
+        "time_window": time_window,
+        "warmup_sec": warmup_sec,
+        "rtime_granularity": rtime_granularity,
+        "log_base": log_base,
+    }
+    analyzers = {
+        name: ANALYZERS[name](**{k: params[k] for k in ANALYZERS[name].PARAMS})
+        for name in analyzers
+    }
+
+    tracker = AccessTracker()
+    start_ts, last_rtime = None, 0
+    n_seen, n_window = 0, 0
+    for records in read_lcs(ifilepath, chunk_rows=chunk_rows):
+        if n_req >= 0:
+            records = records[: n_req - n_seen]
+        if len(records) == 0:
+            break
+
+        clock_time = records["clock_time"].astype(np.int64)
+        if start_ts is None:
+            start_ts = clock_time[0]
+        rtime = clock_time - start_ts
+        if rtime[0] < last_rtime or np.any(rtime[1:] < rtime[:-1]):
+            raise RuntimeError(
+                "The data is not ordered by time, please sort the trace first!"
+            )
+        last_rtime = rtime[-1]
+
+        vtime = np.arange(n_seen + 1, n_seen + len(records) + 1, dtype=np.int64)
+        window = rtime // time_window
+        last_access_rtime, last_access_vtime, create_rtime = tracker.update(
+            records["obj_id"], rtime, vtime
+        )
+        compulsory = last_access_vtime < 0
+        first_seen_in_window = compulsory | (last_access_rtime // time_window != window)
+        chunk = AnnotatedChunk(
+            records,
+            rtime,
+            vtime,
+            window,
+            last_access_rtime,
+            last_access_vtime,
+            create_rtime,
+            compulsory,
+            first_seen_in_window,
+        )
+        for analyzer in analyzers.values():
+            analyzer.add(chunk)
+
+        n_window = int(window[-1]) + 1
+        n_seen += len(records)
+
+    for analyzer in analyzers.values():
+        analyzer.finish(tracker, n_window)
+
+    return analyzers
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    p = ArgumentParser(
+        description="compute the traceAnalyzer distributions of a lcs trace"
+    )
+    p.add_argument("ifilepath", help="lcs trace, can be zstd compressed")
+    p.add_argument(
+        "--analyzers",
+        help=f"comma separated analyzers in {list(ANALYZERS)}",
+        default=",".join(DEFAULT_ANALYZERS),
+    )
+    p.add_argument(
+        "--time-window",
+        type=int,
+        help="time window in seconds",
+        default=DEFAULT_TIME_WINDOW,
+    )
+    p.add_argument(
+        "--warmup-sec",
+        type=int,
+        help="warmup time of popularityDecay",
+        default=DEFAULT_WARMUP_SEC,
+    )
+    p.add_argument(
+        "--num-req", type=int, help="the number of requests to analyze", default=-1
+    )
+    p.add_argument(
+        "--output-path-base",
+        help="the prefix of the output files, default: the trace name",
+        default=None,
+    )
+    args = p.parse_args()
+
+    path_base = args.output_path_base or os.path.basename(args.ifilepath)
+    result = analyze(
+        args.ifilepath,
+        args.analyzers.split(","),
+        time_window=args.time_window,
+        warmup_sec=args.warmup_sec,
+        n_req=args.num_req,
+    )
+    for name, analyzer in result.items():
+        analyzer.dump(path_base)
+    if "popularity" in result:
+        print(f"Zipf alpha {result['popularity'].alpha:.4f}")
+    print(f"the results are saved to {path_base}.*")
@@ -0,0 +1,256 @@
+"""
+convert lcs traces to columnar Parquet or Arrow IPC files
+
+every lcs record is decoded into the columns in LCS_REQUEST_HEADER, so an analysis that
+only needs obj_id and obj_size reads only these two columns instead of decoding full records
+
+Parquet files are written in row groups of row_group_rows requests,
+clock_time uses delta encoding, op, tenant and ttl use dictionary encoding,
+and each column can use a different compression codec;
+Arrow IPC files are written in record batches compressed with zstd or lz4
+
+the lcs version and the header stat are stored in the schema metadata
+
+usage:
+    python3 lcs_columnar.py trace.lcs.zst
+    python3 lcs_columnar.py trace.lcs.zst --format arrow -o trace.arrow
+    python3 lcs_columnar.py trace.lcs.zst --columns clock_time,obj_id,obj_size
+
+    from lcs_columnar import read_columns
+    cols = read_columns("trace.parquet", ["obj_id", "obj_size"])
+
+"""
+
+import os
+import sys
+import json
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from lcs_reader import LCS_REQUEST_HEADER, read_lcs, read_stat
+
+# 1M requests per row group
+DEFAULT_ROW_GROUP_ROWS = 1024 * 1024
+
+# the timestamps are sorted, which delta encoding compresses well
+DELTA_ENCODED_COLUMNS = ("clock_time",)
+# columns with few distinct values
+DICTIONARY_ENCODED_COLUMNS = ("op", "tenant", "ttl")
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise RuntimeError(
+            "columnar export needs pyarrow, install it with pip install pyarrow"
+        )
+
+    return pyarrow
+
+
+def _strip_zst(ifilepath):
+    return ifilepath[: -len(".zst")] if ifilepath.endswith(".zst") else ifilepath
+
+
+def _check_columns(version, columns):
+    if columns is None:
+        return list(LCS_REQUEST_HEADER[version])
+
+    unknown = set(columns) - set(LCS_REQUEST_HEADER[version])
+    if unknown:
+        raise ValueError(
+            f"lcs_v{version} does not have column {sorted(unknown)}, "
+            f"available columns {LCS_REQUEST_HEADER[version]}"
+        )
+
+    return list(columns)
+
+
+def _schema_metadata(stat):
+    return {
+        b"lcs_version": str(stat["lcs_version"]).encode(),
+        b"lcs_stat": json.dumps(stat).encode(),
+    }
+
+
+def _iter_tables(ifilepath, columns, chunk_rows):
+    pa = _import_pyarrow()
+
+    stat = read_stat(ifilepath)
+    columns = _check_columns(stat["lcs_version"], columns)
+    schema = None
+    for records in read_lcs(ifilepath, chunk_rows=chunk_rows):
+        table = pa.table({name: records[name] for name in columns})
+        if schema is None:
+            schema = table.schema.with_metadata(_schema_metadata(stat))
+        yield table.cast(schema)
+
+
+def lcs_to_parquet(
+    ifilepath,
+    ofilepath=None,
+    columns=None,
+    row_group_rows=DEFAULT_ROW_GROUP_ROWS,
+    compression="zstd",
+    compression_level=None,
+):
+    """convert a lcs trace to a Parquet file
+
+    Args:
+        ifilepath (str): the path of the lcs trace
+        ofilepath (str, optional): the output path, default: trace.lcs(.zst) -> trace.lcs.parquet
+        columns (List[str], optional): the columns to write, default: all the columns
+        row_group_rows (int, optional): the number of requests in each row group
+        compression (Union[str, Dict[str, str]], optional): the codec of all columns,
+            or a dict of per-column codecs, e.g., {"obj_id": "zstd", "op": "snappy"}
+        compression_level (Union[int, Dict[str, int]], optional): the codec level
+
+    Returns:
+        str: the output path
+    """
+
+    _import_pyarrow()
+    import pyarrow.parquet as pq
+
+    if ofilepath is None:
+        ofilepath = _strip_zst(ifilepath) + ".parquet"
+
+    writer = None
+    n_req = 0
+    for table in _iter_tables(ifilepath, columns, row_group_rows):
+        if writer is None:
+            names = table.schema.names
+            writer = pq.ParquetWriter(
+                ofilepath,
+                table.schema,
+                compression=compression,
+                compression_level=compression_level,
+                use_dictionary=[c for c in names if c in DICTIONARY_ENCODED_COLUMNS],
+                column_encoding={
+                    c: "DELTA_BINARY_PACKED"
+                    for c in names
+                    if c in DELTA_ENCODED_COLUMNS
+                },
+            )
+        writer.write_table(table, row_group_size=row_group_rows)
+        n_req += table.num_rows
+
+    if writer is None:
+        raise RuntimeError(f"{ifilepath} has no request")
+    writer.close()
+
+    print(f"{n_req} requests are saved to {ofilepath}")
+    return ofilepath
+
+
+def lcs_to_arrow(
+    ifilepath,
+    ofilepath=None,
+    columns=None,
+    batch_rows=DEFAULT_ROW_GROUP_ROWS,
+    compression="zstd",
+):
+    """convert a lcs trace to an Arrow IPC file, which can be memory-mapped by readers
+
+    Args:
+        ifilepath (str): the path of the lcs trace
+        ofilepath (str, optional): the output path, default: trace.lcs(.zst) -> trace.lcs.arrow
+        columns (List[str], optional): the columns to write, default: all the columns
+        batch_rows (int, optional): the number of requests in each record batch
+        compression (str, optional): zstd, lz4 or None
+
+    Returns:
+        str: the output path
+    """
+
+    pa = _import_pyarrow()
+
+    if ofilepath is None:
+        ofilepath = _strip_zst(ifilepath) + ".arrow"
+
+    writer = None
+    n_req = 0
+    for table in _iter_tables(ifilepath, columns, batch_rows):
+        if writer is None:
+            writer = pa.ipc.new_file(
+                ofilepath,
+                table.schema,
+                options=pa.ipc.IpcWriteOptions(compression=compression),
+            )
+        writer.write_table(table, max_chunksize=batch_rows)
+        n_req += table.num_rows
+
+    if writer is None:
+        raise RuntimeError(f"{ifilepath} has no request")
+    writer.close()
+
+    print(f"{n_req} requests are saved to {ofilepath}")
+    return ofilepath
+
+
+def read_columns(ifilepath, columns=None):
+    """read columns from a Parquet or Arrow IPC file written by this module
+
+    Returns:
+        Dict[str, np.ndarray]: column name -> values
+    """
+
+    pa = _import_pyarrow()
+
+    if ifilepath.endswith(".arrow"):
+        with pa.memory_map(ifilepath) as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(columns)
+    else:
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(ifilepath, columns=columns)
+
+    return {name: table.column(name).to_numpy() for name in table.column_names}
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    p = ArgumentParser(description="convert a lcs trace to Parquet or Arrow IPC")
+    p.add_argument("trace", help="trace file path")
+    p.add_argument("-o", "--ofilepath", help="output file path", default=None)
+    p.add_argument(
+        "--format",
+        choices=["parquet", "arrow"],
+        help="output format",
+        default="parquet",
+    )
+    p.add_argument(
+        "--columns",
+        type=str,
+        help="columns to write, separated by comma, default: all",
+        default=None,
+    )
+    p.add_argument(
+        "--row-group-rows",
+        type=int,
+        help="number of requests per row group (record batch)",
+        default=DEFAULT_ROW_GROUP_ROWS,
+    )
+    p.add_argument("--compression", type=str, help="compression codec", default="zstd")
+    args = p.parse_args()
+
+    columns = args.columns.split(",") if args.columns else None
+    if args.format == "parquet":
+        lcs_to_parquet(
+            args.trace,
+            args.ofilepath,
+            columns,
+            args.row_group_rows,
+            args.compression,
+        )
+    else:
+        lcs_to_arrow(
+            args.trace,
+            args.ofilepath,
+            columns,
+            args.row_group_rows,
+            args.compression,
+        )
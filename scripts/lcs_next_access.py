@@ -0,0 +1,294 @@
+"""
+compute the next_access_vtime of every request in a lcs trace with bounded memory
+
+traceConv keeps a hash table of all objects in memory, which does not work when the
+objects of a trace do not fit in memory, this module computes the same field in three passes
+    1. scan the trace and spill (obj_id, vtime) to n_partition files partitioned by obj_id hash,
+       every object goes to one partition and each partition is in trace order
+    2. for each partition, sort by obj_id (stable), the next access of a request is the next
+       entry of the same object, and scatter the result into an on-disk int64 array indexed by vtime
+    3. scan the trace again and write the records with next_access_vtime filled
+
+only one partition is in memory at a time, so the memory usage is about
+16 bytes * n_req / n_partition, a partition larger than max_mem_rows (the objects are skewed)
+is split again with another hash until it fits, except that all the requests of an object
+are in one partition, so an object with more than max_mem_rows requests is loaded at once
+
+next_access_vtime follows traceConv: the (1-based) index of the next request to the same object,
+or INT64_MAX if the object is not requested again
+
+usage:
+    python3 lcs_next_access.py trace.lcs.zst -o trace.lcs
+    python3 lcs_next_access.py trace.lcs --max-mem-rows 100000000 -o trace.lcs.zst
+
+"""
+
+import os
+import sys
+import math
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from lcs_reader import (
+    LCS_HEADER_SIZE,
+    LCS_RAW_DTYPE,
+    DEFAULT_CHUNK_ROWS,
+    open_trace,
+    parse_header,
+    iter_raw_chunks,
+    obj_id_hash,
+    _read_full,
+)
+
+INT64_MAX = np.iinfo(np.int64).max
+# the number of (obj_id, vtime) rows sorted in memory at a time
+DEFAULT_MAX_MEM_ROWS = 128 * 1024 * 1024
+DEFAULT_N_PARTITION = 64
+# the max number of times a partition is split again
+MAX_SPLIT_LEVEL = 4
+
+_ACCESS_DTYPE = np.dtype([("obj_id", "<u8"), ("vtime", "<i8")])
+
+
+def _partition_of(obj_id, n_partition, level):
+    """the partition of each object, each level hashes the hash of the previous level"""
+
+    h = obj_id_hash(obj_id)
+    for _ in range(level):
+        h = obj_id_hash(h)
+
+    return h % np.uint64(n_partition)
+
+
+def _spill(chunks, pathbase, n_partition, level):
+    """partition the (obj_id, vtime) chunks to pathbase{i}, each partition keeps the order
+
+    Returns:
+        Tuple[List[str], np.ndarray]: the paths and the number of rows of the partitions
+    """
+
+    paths = [f"{pathbase}{i}" for i in range(n_partition)]
+    n_rows = np.zeros(n_partition, dtype=np.int64)
+    files = [open(path, "wb") for path in paths]
+    for access in chunks:
+        partition = _partition_of(access["obj_id"], n_partition, level)
+        # stable sort keeps each partition in trace order
+        order = np.argsort(partition, kind="stable")
+        access, partition = access[order], partition[order]
+        bounds = np.searchsorted(partition, np.arange(n_partition + 1))
+        for i in range(n_partition):
+            if bounds[i] < bounds[i + 1]:
+                files[i].write(access[bounds[i] : bounds[i + 1]].tobytes())
+        n_rows += np.diff(bounds)
+
+    for f in files:
+        f.close()
+
+    return paths, n_rows
+
+
+def _iter_trace_access(ifilepath, chunk_rows):
+    reader = open_trace(ifilepath)
+    version, _ = parse_header(_read_full(reader, LCS_HEADER_SIZE))
+    n_req = 0
+    for raw in iter_raw_chunks(reader, LCS_RAW_DTYPE[version], chunk_rows):
+        access = np.empty(len(raw), dtype=_ACCESS_DTYPE)
+        access["obj_id"] = raw["obj_id"]
+        access["vtime"] = np.arange(n_req, n_req + len(raw), dtype=np.int64)
+        n_req += len(raw)
+        yield access
+    reader.close()
+
+
+def _iter_partition(path, chunk_rows):
+    with open(path, "rb") as f:
+        while True:
+            access = np.fromfile(f, dtype=_ACCESS_DTYPE, count=chunk_rows)
+            if len(access) == 0:
+                break
+            yield access
+
+
+def _spill_partitions(ifilepath, spill_dir, n_partition, chunk_rows):
+    """pass 1, returns the paths and the number of rows of the partitions"""
+
+    return _spill(
+        _iter_trace_access(ifilepath, chunk_rows),
+        os.path.join(spill_dir, "part"),
+        n_partition,
+        0,
+    )
+
+
+def _iter_bounded_partitions(paths, n_rows, max_mem_rows, chunk_rows):
+    """load the partitions one by one, a partition with more than max_mem_rows rows
+    is split again into smaller partitions before it is loaded
+
+    Yields:
+        np.ndarray: the (obj_id, vtime) of a partition in trace order
+    """
+
+    stack = [(path, n, 0) for path, n in zip(paths, n_rows)]
+    # the partitions loaded with more than max_mem_rows rows
+    n_unsplit, n_unsplit_rows = 0, 0
+    while stack:
+        path, n, level = stack.pop()
+        if n > max_mem_rows and level < MAX_SPLIT_LEVEL:
+            n_sub = math.ceil(n / max_mem_rows) + 1
+            sub_paths, sub_n_rows = _spill(
+                _iter_partition(path, chunk_rows), f"{path}_", n_sub, level + 1
+            )
+            os.remove(path)
+            if sub_n_rows.max() == n:
+                # the rows cannot be split, e.g., they are the requests of one object
+                level = MAX_SPLIT_LEVEL
+            for sub_path, sub_n in zip(sub_paths, sub_n_rows):
+                if sub_n > 0:
+                    stack.append((sub_path, sub_n, level + 1))
+                else:
+                    os.remove(sub_path)
+            continue
+
+        access = np.fromfile(path, dtype=_ACCESS_DTYPE)
+        os.remove(path)
+        if len(access) > max_mem_rows:
+            n_unsplit += 1
+            n_unsplit_rows += len(access)
+        yield access
+
+    if n_unsplit > 0:
+        print(
+            f"{n_unsplit} partitions ({n_unsplit_rows} requests) cannot be split "
+            f"below {max_mem_rows} requests and are loaded at once"
+        )
+
+
+def _next_access_of_partition(access):
+    """the next_access_vtime of the requests in a partition (in trace order)
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: vtime, next_access_vtime
+    """
+
+    access = access[np.argsort(access["obj_id"], kind="stable")]
+    next_access_vtime = np.full(len(access), INT64_MAX, dtype=np.int64)
+    same_obj = access["obj_id"][1:] == access["obj_id"][:-1]
+    next_access_vtime[:-1][same_obj] = access["vtime"][1:][same_obj] + 1
+
+    return access["vtime"], next_access_vtime
+
+
+def _open_output(ofilepath, level):
+    if ofilepath.endswith(".zst"):
+        import zstandard as zstd
+
+        return zstd.ZstdCompressor(level=level, threads=-1).stream_writer(
+            open(ofilepath, "wb"), closefd=True
+        )
+
+    return open(ofilepath, "wb")
+
+
+def annotate_next_access(
+    ifilepath,
+    ofilepath,
+    max_mem_rows=DEFAULT_MAX_MEM_ROWS,
+    tmp_dir=None,
+    chunk_rows=DEFAULT_CHUNK_ROWS,
+    level=16,
+):
+    """write a copy of the trace with next_access_vtime computed
+
+    Args:
+        ifilepath (str): the path of the lcs trace
+        ofilepath (str): the output path, compressed with zstd if it ends with .zst
+        max_mem_rows (int, optional): the max number of requests in a partition,
+            the number of partitions is n_req / max_mem_rows, a larger partition
+            is split again (see _iter_bounded_partitions)
+        tmp_dir (str, optional): the directory of the spill files (about 24 bytes per request),
+            default: the directory of ofilepath
+        chunk_rows (int, optional): the number of requests read at a time
+        level (int, optional): the zstd level if ofilepath ends with .zst
+
+    Returns:
+        int: the number of requests
+    """
+
+    if os.path.abspath(ifilepath) == os.path.abspath(ofilepath):
+        raise ValueError("the output cannot overwrite the input trace")
+
+    reader = open_trace(ifilepath)
+    header = _read_full(reader, LCS_HEADER_SIZE)
+    reader.close()
+    version, stat = parse_header(header)
+    raw_dtype = LCS_RAW_DTYPE[version]
+
+    # the header may not have the stat, e.g., the trace is written without it
+    if stat["n_req"] > 0:
+        n_partition = max(1, math.ceil(stat["n_req"] / max_mem_rows))
+    else:
+        n_partition = DEFAULT_N_PARTITION
+
+    if tmp_dir is None:
+        tmp_dir = os.path.dirname(os.path.abspath(ofilepath))
+    spill_dir = tempfile.mkdtemp(prefix="lcs_next_access_", dir=tmp_dir)
+    try:
+        paths, n_rows = _spill_partitions(ifilepath, spill_dir, n_partition, chunk_rows)
+        n_req = int(n_rows.sum())
+
+        next_access_path = os.path.join(spill_dir, "next_access_vtime")
+        next_access = np.lib.format.open_memmap(
+            next_access_path, mode="w+", dtype=np.int64, shape=(n_req,)
+        )
+        for access in _iter_bounded_partitions(paths, n_rows, max_mem_rows, chunk_rows):
+            vtime, next_access_vtime = _next_access_of_partition(access)
+            next_access[vtime] = next_access_vtime
+        next_access.flush()
+
+        reader = open_trace(ifilepath)
+        _read_full(reader, LCS_HEADER_SIZE)
+        with _open_output(ofilepath, level) as ofile:
+            ofile.write(header)
+            pos = 0
+            for raw in iter_raw_chunks(reader, raw_dtype, chunk_rows):
+                raw = raw.copy()
+                raw["next_access_vtime"] = next_access[pos : pos + len(raw)]
+                pos += len(raw)
+                ofile.write(raw.tobytes())
+        reader.close()
+
+        del next_access
+        os.remove(next_access_path)
+    finally:
+        for name in os.listdir(spill_dir):
+            os.remove(os.path.join(spill_dir, name))
+        os.rmdir(spill_dir)
+
+    print(f"{n_req} requests are saved to {ofilepath}")
+    return n_req
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    p = ArgumentParser(description="compute next_access_vtime of a lcs trace")
+    p.add_argument("trace", help="trace file path")
+    p.add_argument("-o", "--ofilepath", help="output file path", required=True)
+    p.add_argument(
+        "--max-mem-rows",
+        type=int,
+        help="max number of requests sorted in memory at a time",
+        default=DEFAULT_MAX_MEM_ROWS,
+    )
+    p.add_argument("--tmp-dir", type=str, help="directory of spill files", default=None)
+    p.add_argument("--level", type=int, help="zstd level", default=16)
+    args = p.parse_args()
+
+    annotate_next_access(
+        args.trace,
+        args.ofilepath,
+        args.max_mem_rows,
+        args.tmp_dir,
+        level=args.level,
+    )
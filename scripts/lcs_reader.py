@@ -82,8 +82,12 @@
 # } lcs_req_v3_t;
 
 
+import io
+import os
+import sys
 import struct
-from utils.const import OP_NAMES
+import bisect
+import numpy as np
 
 LCS_FORMAT_NAME = [None] + [f"lcs_v{i}" for i in range(1, 9)]
 
@@ -129,6 +133,84 @@ LCS_END_MAGIC = 0x123456789ABCDEF0
 N_MOST_COMMON = 16
 N_MOST_COMMON_PRINT = 4
 
+# the number of requests per chunk returned by read_lcs,
+# 1M requests is 24 MB for lcs_v2 and 28 MB for lcs_v3
+DEFAULT_CHUNK_ROWS = 1024 * 1024
+
+_STRUCT_CODE_TO_DTYPE = {"I": "<u4", "i": "<i4", "Q": "<u8", "q": "<i8"}
+
+
+def _lcs_raw_fields(version):
+    """the on-disk fields of a lcs record, op and tenant share one uint32 (op_tenant)
+    and the features are stored after next_access_vtime"""
+
+    fmt = LCS_FORMAT_STR[version][1:]
+    names = ["clock_time", "obj_id", "obj_size"]
+    if version >= 2:
+        names.append("op_tenant")
+    if version >= 3:
+        names.append("ttl")
+    names.append("next_access_vtime")
+    names += [f"feature_{i}" for i in range(len(fmt) - len(names))]
+
+    return [(name, _STRUCT_CODE_TO_DTYPE[c]) for name, c in zip(names, fmt)]
+
+
+def _lcs_fields(version):
+    """the decoded fields of a lcs record, in the order of LCS_REQUEST_HEADER"""
+
+    raw_fields = dict(_lcs_raw_fields(version))
+    raw_fields["op"] = "u1"
+    raw_fields["tenant"] = "<u4"
+
+    return [(name, raw_fields[name]) for name in LCS_REQUEST_HEADER[version]]
+
+
+# packed numpy dtype of the records on disk, can be used with np.frombuffer
+LCS_RAW_DTYPE = [None] + [np.dtype(_lcs_raw_fields(v)) for v in range(1, 9)]
+# numpy dtype of the decoded records with op and tenant split
+LCS_DTYPE = [None] + [np.dtype(_lcs_fields(v)) for v in range(1, 9)]
+
+
+def obj_id_hash(obj_id):
+    """a fixed 64-bit mixing hash (splitmix64) of obj_id,
+    unlike hash(), it does not depend on PYTHONHASHSEED and is vectorized
+
+    Args:
+        obj_id (Union[int, np.ndarray]): object ids
+
+    Returns:
+        np.ndarray: uint64 hash values
+    """
+
+    z = np.array(obj_id, dtype=np.uint64, ndmin=1) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def obj_sample_mask(obj_id, sample_ratio):
+    """spatial sampling: select an object if its obj_id_hash is in the lowest sample_ratio
+    of the hash space, so all requests of a selected object are selected,
+    and the objects selected with a smaller ratio are a subset of those with a larger ratio
+
+    Args:
+        obj_id (np.ndarray): object ids
+        sample_ratio (float): the fraction of objects to select, in (0, 1]
+
+    Returns:
+        np.ndarray: bool mask
+    """
+
+    if not 0 < sample_ratio <= 1:
+        raise ValueError(f"sample_ratio must be in (0, 1], got {sample_ratio}")
+    if sample_ratio == 1:
+        return np.ones(len(obj_id), dtype=bool)
+
+    threshold = np.uint64(min(int(sample_ratio * 2**64), 2**64 - 1))
+    return obj_id_hash(obj_id) < threshold
+
+
 def parse_stat(b, print_stat=True):
     # basic info
     (
@@ -236,9 +318,46 @@ def parse_stat(b, print_stat=True):
             print("....")
         print("###########################################################")
 
+    return {
+        "version": ver,
+        "n_req": n_req,
+        "n_obj": n_obj,
+        "n_req_byte": n_req_byte,
+        "n_obj_byte": n_obj_byte,
+        "start_timestamp": start_ts,
+        "end_timestamp": end_ts,
+        "n_read": n_read,
+        "n_write": n_write,
+        "n_delete": n_delete,
+        "smallest_obj_size": smallest_obj_size,
+        "largest_obj_size": largest_obj_size,
+        "most_common_obj_sizes": list(most_common_obj_sizes),
+        "most_common_obj_size_ratio": list(most_common_obj_size_ratio),
+        "highest_freq": list(highest_freq),
+        "most_common_freq": list(most_common_freq),
+        "most_common_freq_ratio": list(most_common_freq_ratio),
+        "skewness": skewness,
+        "n_tenant": n_tenant,
+        "most_common_tenants": list(most_common_tenant),
+        "most_common_tenant_ratio": list(most_common_tenant_ratio),
+        "n_ttl": n_ttl,
+        "smallest_ttl": smallest_ttl,
+        "largest_ttl": largest_ttl,
+        "most_common_ttls": list(most_common_ttl),
+        "most_common_ttl_ratio": list(most_common_ttl_ratio),
+    }
+
+
+def parse_header(header, print_stat=False):
+    """parse the lcs header (LCS_HEADER_SIZE bytes)
+
+    Returns:
+        Tuple[int, dict]: the lcs version and the trace stat
+    """
+
+    if len(header) != LCS_HEADER_SIZE:
+        raise RuntimeError(f"Invalid trace file, header has only {len(header)} bytes")
 
-def read_header(ifile, print_stat=True):
-    header = ifile.read(LCS_HEADER_SIZE)
     start_magic, version = struct.unpack("<QQ", header[:16])
     end_magic = struct.unpack("<Q", header[-8:])[0]
     if start_magic != LCS_STRAT_MAGIC:
@@ -246,61 +365,550 @@ def read_header(ifile, print_stat=True):
     if end_magic != LCS_END_MAGIC:
         raise RuntimeError(f"Invalid trace file end magic {end_magic:016x}")
 
-    print("lcs format version:", version)
-    parse_stat(header[16:-176], print_stat=print_stat)
+    if print_stat:
+        print("lcs format version:", version)
+    stat = parse_stat(header[16:-176], print_stat=print_stat)
+
+    return version, stat
+
+
+def read_header(ifile, print_stat=True):
+    version, _ = parse_header(_read_full(ifile, LCS_HEADER_SIZE), print_stat)
 
     return version
 
 
-def print_trace(ifilepath, n_max_req=-1, print_stat=True, print_header=True):
+def read_stat(ifilepath):
+    """read the lcs version and the trace stat without touching the requests,
+    for .zst traces, only the beginning of the first frame is decompressed
+
+    Returns:
+        dict: the trace stat (see parse_stat) with lcs_version
+    """
+
+    reader = open_trace(ifilepath)
+    try:
+        version, stat = parse_header(_read_full(reader, LCS_HEADER_SIZE))
+    finally:
+        reader.close()
+
+    return {"lcs_version": version, **stat}
+
+
+def open_trace(ifilepath):
+    """open a lcs trace and return a file-like reader positioned at the header,
+    .zst traces are decompressed on the fly"""
+
     if ifilepath.endswith(".zst"):
         import zstandard as zstd
 
         decompressor = zstd.ZstdDecompressor()
-        reader = decompressor.stream_reader(open(ifilepath, "rb"))
+        return decompressor.stream_reader(
+            open(ifilepath, "rb"), read_across_frames=True
+        )
     else:
-        ifile = open(ifilepath, "rb")
-        reader = ifile
+        return open(ifilepath, "rb")
 
-    version = read_header(reader, print_stat)
-    s = struct.Struct(LCS_FORMAT_STR[version])
 
-    if print_header:
-        print(",".join(LCS_REQUEST_HEADER[version]))
+def _read_full(reader, size):
+    """read size bytes unless EOF is reached, stream readers may return short reads"""
 
-    n_req = 0
-    while True:
-        b = reader.read(s.size)
+    buf = reader.read(size)
+    if not buf or len(buf) == size:
+        return buf
+
+    parts = [buf]
+    n_read = len(buf)
+    while n_read < size:
+        b = reader.read(size - n_read)
         if not b:
             break
-        req = s.unpack(b)
-        ts, obj, size = req[:3]
-        print(f"{ts},{obj},{size}", end="")
-        if version == 1:
-            next_access_vtime = req[3]
-        elif version == 2:
-            op = OP_NAMES[req[3] & 0xFF]
-            tenant = (req[3]>>8) & 0xFFFFFF
-            next_access_vtime = req[4]
-            print(f",{op},{tenant}", end="")
-        elif version >= 3:
-            op = OP_NAMES[req[3] & 0xFF]
-            tenant = (req[3]>>8) & 0xFFFFFF
-            ttl = req[4]
-            next_access_vtime = req[5]
-            features = req[6:]
-            print(f",{ttl},{op},{tenant}", end="")
-            for f in features:
-                print(f",{f}", end="")
-
-        print(f",{next_access_vtime}")
-
-        n_req += 1
-        if n_max_req > 0 and n_req >= n_max_req:
+        parts.append(b)
+        n_read += len(b)
+
+    return b"".join(parts)
+
+
+def decode_records(raw, version):
+    """convert on-disk records (LCS_RAW_DTYPE) to decoded records (LCS_DTYPE)
+
+    Args:
+        raw (np.ndarray): records with dtype LCS_RAW_DTYPE[version]
+        version (int): the lcs version
+
+    Returns:
+        np.ndarray: a new array with dtype LCS_DTYPE[version]
+    """
+
+    records = np.empty(len(raw), dtype=LCS_DTYPE[version])
+    for name in records.dtype.names:
+        if name == "op":
+            records["op"] = raw["op_tenant"] & 0xFF
+        elif name == "tenant":
+            records["tenant"] = raw["op_tenant"] >> 8
+        else:
+            records[name] = raw[name]
+
+    return records
+
+
+def iter_raw_chunks(reader, raw_dtype, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """read on-disk records (not decoded) from a reader positioned after the header
+
+    Yields:
+        np.ndarray: read-only records with dtype raw_dtype
+    """
+
+    while True:
+        b = _read_full(reader, raw_dtype.itemsize * chunk_rows)
+        if not b:
             break
+        if len(b) % raw_dtype.itemsize != 0:
+            raise RuntimeError(
+                f"truncated lcs trace, {len(b) % raw_dtype.itemsize} trailing bytes"
+            )
+
+        yield np.frombuffer(b, dtype=raw_dtype)
+
+
+def read_lcs(ifilepath, version=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """read a lcs trace (optionally zstd compressed) in chunks of numpy structured arrays
+
+    Args:
+        ifilepath (str): the path of the lcs trace
+        version (int, optional): the expected lcs version, read from the header if None
+        chunk_rows (int, optional): the number of requests in each chunk
+
+    Yields:
+        np.ndarray: records with dtype LCS_DTYPE[version], the last chunk can be shorter
+    """
+
+    reader = open_trace(ifilepath)
+    try:
+        trace_version = read_header(reader, print_stat=False)
+        if version is not None and version != trace_version:
+            raise RuntimeError(
+                f"lcs version mismatch, expect {version} but the trace is {trace_version}"
+            )
+
+        raw_dtype = LCS_RAW_DTYPE[trace_version]
+        for raw in iter_raw_chunks(reader, raw_dtype, chunk_rows):
+            yield decode_records(raw, trace_version)
+    finally:
+        reader.close()
+
+
+# a seekable .zst lcs trace is a sequence of independent zstd frames,
+# the first frame holds the header and each following frame holds a fixed number of records,
+# the frame index of the record frames is stored next to the trace in trace.lcs.zst.idx
+LCS_FRAME_INDEX_SUFFIX = ".idx"
+LCS_FRAME_INDEX_DTYPE = np.dtype(
+    [
+        ("offset", "<u8"),  # the offset of the compressed frame in the file
+        ("size", "<u8"),  # the compressed size of the frame
+        ("first_req", "<u8"),  # the index of the first request in the frame
+        ("n_req", "<u8"),  # the number of requests in the frame
+        ("start_ts", "<u8"),  # the clock_time of the first request in the frame
+        ("end_ts", "<u8"),  # the clock_time of the last request in the frame
+    ]
+)
+
+
+def load_frame_index(ifilepath):
+    """load the frame index of a seekable .zst lcs trace
+
+    Returns:
+        np.ndarray: the frame index with dtype LCS_FRAME_INDEX_DTYPE, None if the trace has no index
+    """
+
+    index_path = ifilepath + LCS_FRAME_INDEX_SUFFIX
+    if not os.path.exists(index_path):
+        return None
+
+    frame_index = np.load(index_path)
+    if frame_index.dtype != LCS_FRAME_INDEX_DTYPE:
+        raise RuntimeError(f"{index_path} is not a lcs frame index")
+
+    return frame_index
+
+
+class LcsTrace:
+    """random access to a lcs trace without reading the prefix
+
+    for uncompressed traces, the records after the header are memory-mapped
+    so only the pages being accessed are read from disk;
+    for seekable .zst traces (see LCS_FRAME_INDEX_SUFFIX), only the frames
+    covering the requested records are decompressed, in parallel if there are many
+
+    usage:
+        trace = LcsTrace("trace.lcs")
+        len(trace)                          # number of requests
+        trace[1000:2000]                    # decoded records by request index
+        trace.time_range(3600, 7200)        # decoded records with 3600 <= clock_time < 7200
+
+    """
+
+    def __init__(self, ifilepath, n_thread=4):
+        self.path = ifilepath
+        self.n_thread = n_thread
+        self.raw = None
+        self.frame_index = None
+
+        if ifilepath.endswith(".zst"):
+            self.frame_index = load_frame_index(ifilepath)
+            if self.frame_index is None:
+                raise RuntimeError(
+                    f"{ifilepath} has no frame index, random access needs an uncompressed "
+                    "or seekable lcs trace, use read_lcs to stream it"
+                )
+            self.version = read_header(self._open_header_frame(), print_stat=False)
+            self._ifile = open(ifilepath, "rb")
+            self._frame_first_req = self.frame_index["first_req"].astype(np.int64)
+            self._cached_frame = (-1, None)
+            n_req = int(self.frame_index["n_req"].sum())
+        else:
+            with open(ifilepath, "rb") as f:
+                self.version = read_header(f, print_stat=False)
+
+            raw_dtype = LCS_RAW_DTYPE[self.version]
+            n_byte = os.path.getsize(ifilepath) - LCS_HEADER_SIZE
+            if n_byte % raw_dtype.itemsize != 0:
+                raise RuntimeError(
+                    f"truncated lcs trace {ifilepath}, {n_byte % raw_dtype.itemsize} trailing bytes"
+                )
+
+            n_req = n_byte // raw_dtype.itemsize
+            if n_req == 0:
+                # mmap does not support empty mapping
+                self.raw = np.empty(0, dtype=raw_dtype)
+            else:
+                self.raw = np.memmap(
+                    ifilepath,
+                    dtype=raw_dtype,
+                    mode="r",
+                    offset=LCS_HEADER_SIZE,
+                    shape=(n_req,),
+                )
+
+        self.raw_dtype = LCS_RAW_DTYPE[self.version]
+        self.dtype = LCS_DTYPE[self.version]
+        self.n_req = n_req
+
+    def _open_header_frame(self):
+        import zstandard as zstd
+
+        with open(self.path, "rb") as f:
+            if len(self.frame_index) > 0:
+                b = f.read(int(self.frame_index[0]["offset"]))
+            else:
+                b = f.read()
+
+        return io.BytesIO(zstd.ZstdDecompressor().decompress(b))
+
+    @property
+    def n_frame(self):
+        return 0 if self.frame_index is None else len(self.frame_index)
+
+    def read_frame(self, frame_id):
+        """decompress one record frame of a seekable trace, returns raw records"""
+
+        import zstandard as zstd
+
+        if self._cached_frame[0] == frame_id:
+            return self._cached_frame[1]
+
+        frame = self.frame_index[frame_id]
+        b = os.pread(self._ifile.fileno(), int(frame["size"]), int(frame["offset"]))
+        b = zstd.ZstdDecompressor().decompress(
+            b, max_output_size=int(frame["n_req"]) * self.raw_dtype.itemsize
+        )
+        raw = np.frombuffer(b, dtype=self.raw_dtype)
+        assert len(raw) == frame["n_req"], f"corrupted frame {frame_id} in {self.path}"
+
+        self._cached_frame = (frame_id, raw)
+        return raw
+
+    def _read_frames(self, frame_ids):
+        if len(frame_ids) <= 1 or self.n_thread <= 1:
+            return [self.read_frame(i) for i in frame_ids]
+
+        # zstd releases the GIL during decompression
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(self.n_thread) as executor:
+            return list(executor.map(self.read_frame, frame_ids))
+
+    def _raw_range(self, start, end):
+        """raw records of [start, end)"""
+
+        if self.raw is not None:
+            return self.raw[start:end]
+
+        if start >= end:
+            return np.empty(0, dtype=self.raw_dtype)
+
+        first_frame = bisect.bisect_right(self._frame_first_req, start) - 1
+        last_frame = bisect.bisect_right(self._frame_first_req, end - 1) - 1
+        frames = self._read_frames(list(range(first_frame, last_frame + 1)))
+        offset = start - self._frame_first_req[first_frame]
+        if len(frames) == 1:
+            return frames[0][offset : offset + end - start]
+
+        return np.concatenate(frames)[offset : offset + end - start]
+
+    def _raw_take(self, indices):
+        """raw records at the given (non-negative) indices"""
+
+        if self.raw is not None:
+            return self.raw[indices]
+
+        frame_ids = np.searchsorted(self._frame_first_req, indices, side="right") - 1
+        uniq_frame_ids = np.unique(frame_ids)
+        frames = dict(zip(uniq_frame_ids, self._read_frames(list(uniq_frame_ids))))
+        raw = np.empty(len(indices), dtype=self.raw_dtype)
+        for frame_id in uniq_frame_ids:
+            mask = frame_ids == frame_id
+            raw[mask] = frames[frame_id][indices[mask] - self._frame_first_req[frame_id]]
+
+        return raw
+
+    def __len__(self):
+        return self.n_req
+
+    def __getitem__(self, key):
+        """index, slice or index array of requests, returns decoded records"""
+
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += self.n_req
+            if not 0 <= key < self.n_req:
+                raise IndexError(f"request index {key} out of range")
+            return decode_records(self._raw_range(key, key + 1), self.version)[0]
+
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.n_req)
+            if step > 0:
+                raw = self._raw_range(start, max(start, stop))[::step]
+            else:
+                raw = self._raw_take(np.arange(start, stop, step))
+        else:
+            indices = np.asarray(key, dtype=np.int64)
+            indices = np.where(indices < 0, indices + self.n_req, indices)
+            raw = self._raw_take(indices)
+
+        return decode_records(raw, self.version)
+
+    def find_time(self, ts, side="left"):
+        """find the index of the first request with clock_time >= ts (side="left")
+        or clock_time > ts (side="right"), requests are sorted by clock_time
+
+        np.searchsorted copies the (strided) clock_time column into a contiguous array,
+        so we use bisect which only touches O(log n) records
+        """
+
+        if side == "left":
+            _bisect = bisect.bisect_left
+        elif side == "right":
+            _bisect = bisect.bisect_right
+        else:
+            raise ValueError(f"unknown side {side}")
+
+        if self.raw is not None:
+            return _bisect(self.raw["clock_time"], ts)
+
+        # find the frame that holds the answer using the index, then search in the frame
+        frame_id = _bisect(self.frame_index["end_ts"], ts)
+        if frame_id >= self.n_frame:
+            return self.n_req
+
+        return int(self._frame_first_req[frame_id]) + _bisect(
+            self.read_frame(frame_id)["clock_time"], ts
+        )
+
+    def time_slice(self, start_ts=None, end_ts=None):
+        """the slice of requests with start_ts <= clock_time < end_ts"""
+
+        start = 0 if start_ts is None else self.find_time(start_ts)
+        end = len(self) if end_ts is None else self.find_time(end_ts)
+
+        return slice(start, max(start, end))
 
+    def time_range(self, start_ts=None, end_ts=None):
+        """decoded records with start_ts <= clock_time < end_ts"""
+
+        return self[self.time_slice(start_ts, end_ts)]
+
+
+def _raw_request_mask(
+    raw, tenants=None, ops=None, start_ts=None, end_ts=None, sample_ratio=1
+):
+    """the requests selected by the filters, evaluated on the raw records"""
+
+    mask = np.ones(len(raw), dtype=bool)
+    if start_ts is not None:
+        mask &= raw["clock_time"] >= start_ts
+    if end_ts is not None:
+        mask &= raw["clock_time"] < end_ts
+    if ops is not None:
+        mask &= np.isin(raw["op_tenant"] & 0xFF, ops)
+    if tenants is not None:
+        mask &= np.isin(raw["op_tenant"] >> 8, tenants)
+    if sample_ratio < 1:
+        mask &= obj_sample_mask(raw["obj_id"], sample_ratio)
+
+    return mask
+
+
+def _iter_raw_time_range(ifilepath, start_ts, end_ts, chunk_rows):
+    """raw records that may be in [start_ts, end_ts), requests are sorted by clock_time,
+    uncompressed and seekable traces jump to start_ts, other traces are read from the beginning,
+    all traces stop reading after end_ts
+
+    Yields:
+        Tuple[int, np.ndarray]: version, raw records
+    """
+
+    if not ifilepath.endswith(".zst") or load_frame_index(ifilepath) is not None:
+        trace = LcsTrace(ifilepath)
+        time_slice = trace.time_slice(start_ts, end_ts)
+        for start in range(time_slice.start, time_slice.stop, chunk_rows):
+            end = min(start + chunk_rows, time_slice.stop)
+            yield trace.version, trace._raw_range(start, end)
+        return
+
+    reader = open_trace(ifilepath)
+    try:
+        version = read_header(reader, print_stat=False)
+        for raw in iter_raw_chunks(reader, LCS_RAW_DTYPE[version], chunk_rows):
+            yield version, raw
+            if end_ts is not None and raw["clock_time"][-1] >= end_ts:
+                break
+    finally:
+        reader.close()
+
+
+def filter_lcs(
+    ifilepath,
+    tenants=None,
+    ops=None,
+    start_ts=None,
+    end_ts=None,
+    sample_ratio=1,
+    chunk_rows=DEFAULT_CHUNK_ROWS,
+):
+    """read the requests selected by the filters in chunks,
+    the filters are evaluated on the raw records so only the selected requests are decoded
+
+    Args:
+        ifilepath (str): the path of the lcs trace
+        tenants (List[int], optional): keep requests from these tenants
+        ops (List[int], optional): keep requests with these op, e.g., [OP_NAMES.index("GET")]
+        start_ts (int, optional): keep requests with clock_time >= start_ts
+        end_ts (int, optional): keep requests with clock_time < end_ts
+        sample_ratio (float, optional): keep the requests of this fraction of objects,
+            see obj_sample_mask
+        chunk_rows (int, optional): the number of requests read at a time,
+            a yielded chunk can be smaller after filtering
+
+    Yields:
+        np.ndarray: records with dtype LCS_DTYPE[version]
+    """
+
+    for version, raw in _iter_raw_time_range(ifilepath, start_ts, end_ts, chunk_rows):
+        if (ops is not None or tenants is not None) and version == 1:
+            raise ValueError("lcs_v1 has no op and tenant")
+
+        mask = _raw_request_mask(raw, tenants, ops, start_ts, end_ts, sample_ratio)
+        if mask.any():
+            yield decode_records(raw[mask], version)
+
+
+def format_records(records, op_names=None):
+    """format records as csv lines with the columns in LCS_REQUEST_HEADER order
+
+    Args:
+        records (np.ndarray): records with dtype LCS_DTYPE[version]
+        op_names (List[str], optional): print op as names instead of numbers
+
+    Returns:
+        str: one line per request, each line ends with a newline
+    """
+
+    columns = []
+    for name in records.dtype.names:
+        column = records[name].tolist()
+        if name == "op" and op_names is not None:
+            column = [op_names[op] if op < len(op_names) else op for op in column]
+        columns.append(column)
+
+    line_fmt = ",".join(["%s"] * len(columns)) + "\n"
+    return "".join([line_fmt % req for req in zip(*columns)])
+
+
+def print_trace(
+    ifilepath,
+    n_max_req=-1,
+    print_stat=True,
+    print_header=True,
+    tenants=None,
+    ops=None,
+    start_ts=None,
+    end_ts=None,
+    sample_ratio=1,
+    ofile=None,
+):
+    """print the requests selected by the filters (see filter_lcs) as csv,
+    each chunk is formatted at once and written with a single write
+
+    Args:
+        n_max_req (int, optional): print at most n_max_req requests, -1 means all
+        print_stat (bool, optional): print the stat in the header
+        print_header (bool, optional): print the column names
+        ops (List[Union[int, str]], optional): op numbers or names, e.g., ["GET", "SET"]
+        ofile (TextIO, optional): the output, default: sys.stdout
+    """
+
+    # imported here because traceConv/utils.py shadows the utils package
+    # when lcs_reader is imported from the traceConv scripts
+    from utils.const import OP_NAMES
+
+    if ofile is None:
+        ofile = sys.stdout
+
+    reader = open_trace(ifilepath)
+    version = read_header(reader, print_stat)
     reader.close()
 
+    if print_header:
+        ofile.write(",".join(LCS_REQUEST_HEADER[version]) + "\n")
+
+    if ops is not None:
+        ops = [OP_NAMES.index(op.upper()) if isinstance(op, str) else op for op in ops]
+
+    # without filters, the first n_max_req records are printed, so read no more than that,
+    # with filters, small reads would decode and drop many tiny chunks
+    filtered = (
+        tenants is not None
+        or ops is not None
+        or start_ts is not None
+        or end_ts is not None
+        or sample_ratio < 1
+    )
+    chunk_rows = DEFAULT_CHUNK_ROWS
+    if n_max_req > 0 and not filtered:
+        chunk_rows = min(chunk_rows, n_max_req)
+
+    n_req = 0
+    for records in filter_lcs(
+        ifilepath, tenants, ops, start_ts, end_ts, sample_ratio, chunk_rows
+    ):
+        if n_max_req > 0:
+            records = records[: n_max_req - n_req]
+        ofile.write(format_records(records, OP_NAMES))
+        n_req += len(records)
+        if n_max_req > 0 and n_req >= n_max_req:
+            break
+
 
 if __name__ == "__main__":
     from argparse import ArgumentParser
@@ -318,7 +926,34 @@ if __name__ == "__main__":
     p.add_argument(
         "--print-header", action="store_true", help="print header", default=True
     )
+    p.add_argument(
+        "--tenant", type=str, help="tenants to print, separated by comma", default=None
+    )
+    p.add_argument(
+        "--op", type=str, help="ops to print, separated by comma, e.g., GET,SET"
+    )
+    p.add_argument("--start-ts", type=int, help="print clock_time >= start_ts")
+    p.add_argument("--end-ts", type=int, help="print clock_time < end_ts")
+    p.add_argument(
+        "--sample-ratio", type=float, help="object sample ratio, in (0, 1]", default=1
+    )
+    p.add_argument("-o", "--ofilepath", type=str, help="output file path")
     args = p.parse_args()
 
+    tenants = [int(t) for t in args.tenant.split(",")] if args.tenant else None
+    ops = args.op.split(",") if args.op else None
+    ofile = open(args.ofilepath, "w") if args.ofilepath else sys.stdout
     # test_block_trace(sys.argv[1])
-    print_trace(args.trace, args.n, args.print_stat, args.print_header)
+    print_trace(
+        args.trace,
+        args.n,
+        args.print_stat,
+        args.print_header,
+        tenants,
+        ops,
+        args.start_ts,
+        args.end_ts,
+        args.sample_ratio,
+        ofile,
+    )
+    ofile.close()
@@ -0,0 +1,524 @@
+"""
+compute the exact LRU stack distance (reuse distance) of every request in a lcs trace
+and the LRU miss ratio curve of all cache sizes in one pass
+
+the stack distance of a request is its position in the LRU stack, i.e., one plus the number of
+distinct objects requested since the last request to the same object, an LRU cache of size C
+hits the request if and only if the stack distance is at most C,
+the byte stack distance is the total size of these objects plus the size of the object,
+it is used for caches whose size is in bytes
+
+every object has a marker at the vtime of its last request, the stack distance is the number of
+markers after the last request, the markers are kept in a Fenwick tree, a chunk of requests is
+processed at a time:
+    1. the markers after the last request at the start of the chunk are counted in the Fenwick tree
+    2. the markers moved by the earlier requests in the chunk are counted with numpy (count of
+       the earlier requests in the chunk whose last request is after the last request)
+    3. the markers of the objects requested in the chunk are moved to their last request
+the Fenwick tree has one slot per marker, slots are appended in time order and compacted when
+they run out, so the memory is O(n_obj) and the time is O(n_req log n_req)
+
+usage:
+    python3 lcs_reuse_distance.py trace.lcs.zst
+    python3 lcs_reuse_distance.py trace.lcs.zst --byte --sizes 0.01,0.1,1GiB --plot trace_lru
+
+    from lcs_reuse_distance import reuse_distance
+    sd = reuse_distance("trace.lcs.zst")
+    mrc_dict = {"LRU": sd.mrc([0.001, 0.01, 0.1])}
+
+"""
+
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from lcs_reader import DEFAULT_CHUNK_ROWS, read_lcs
+from lcs_analyzer import AccessTracker, _add_counts
+from utils.str_utils import conv_size_str_to_int
+
+# the granularity of the byte stack distance histogram
+DEFAULT_BYTE_GRANULARITY = 1024 * 1024
+
+# the smallest number of slots of the Fenwick tree
+MIN_N_SLOT = 1 << 16
+
+# the default cache sizes of plot_mrc_size, as a fraction of the working set
+DEFAULT_CACHE_SIZES = "0.001,0.005,0.01,0.02,0.05,0.10,0.20,0.40"
+
+
+class FenwickTree:
+    """a Fenwick (binary indexed) tree of int64 values at positions [0, n),
+    updated and queried with arrays of positions, each operation is log(n) numpy calls
+
+    Args:
+        values (np.ndarray): the initial values
+    """
+
+    def __init__(self, values):
+        n = len(values)
+        self.tree = np.zeros(n + 1, dtype=np.int64)
+        self.tree[1:] = values
+        # add each node to its parent, the children before the parents
+        k = 1
+        while 2 * k <= n:
+            parent = self.tree[2 * k :: 2 * k]
+            parent += self.tree[k :: 2 * k][: len(parent)]
+            k *= 2
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, pos, values):
+        """add values[i] (or values if it is a scalar) at pos[i], pos can have duplicates"""
+
+        idx = np.asarray(pos, dtype=np.int64) + 1
+        values = np.broadcast_to(np.asarray(values, dtype=np.int64), idx.shape)
+        while len(idx) > 0:
+            np.add.at(self.tree, idx, values)
+            idx = idx + (idx & -idx)
+            keep = idx < len(self.tree)
+            idx, values = idx[keep], values[keep]
+
+    def prefix_sum(self, pos):
+        """the sum of the values at [0, pos[i]] for each i"""
+
+        idx = np.asarray(pos, dtype=np.int64) + 1
+        result = np.zeros(len(idx), dtype=np.int64)
+        while True:
+            nonzero = idx > 0
+            if not nonzero.any():
+                break
+            result[nonzero] += self.tree[idx[nonzero]]
+            idx &= idx - 1
+
+        return result
+
+
+def _count_earlier_greater(values, weights=None):
+    """for each i, the number and the total weight of j < i with values[j] > values[i]
+
+    the values are replaced by their ranks and processed one bit at a time from the highest
+    bit (a wavelet matrix), at each bit, the elements with the same higher bits are in one group
+    in their original order, an element with the bit 0 is smaller than the earlier elements
+    in the group with the bit 1, then the elements are stably partitioned by the bit,
+    the per-element arrays are kept in the partitioned order, so each bit is a few
+    sequential passes over the arrays
+
+    Returns:
+        tuple: (cnt, weight) arrays, weight is None if weights is None
+    """
+
+    n = len(values)
+    cnt = np.zeros(n, dtype=np.int64)
+    weight = None if weights is None else np.zeros(n, dtype=np.int64)
+    if n < 2:
+        return cnt, weight
+
+    # equal values get increasing ranks, so an earlier equal value is never greater,
+    # the ranks, positions and counts are less than n, int32 halves the memory traffic
+    idx_dtype = np.int32 if n < 2**31 else np.int64
+    rank = np.empty(n, dtype=idx_dtype)
+    rank[np.argsort(values, kind="stable")] = np.arange(n, dtype=idx_dtype)
+
+    arrays = {
+        "rank": rank,
+        "order": np.arange(n, dtype=idx_dtype),
+        "cnt": np.zeros(n, dtype=idx_dtype),
+    }
+    if weights is not None:
+        arrays["w"] = np.asarray(weights, dtype=np.int64)
+        arrays["weight"] = np.zeros(n, dtype=np.int64)
+    group_start = np.empty(n, dtype=bool)
+    group_start[0] = True
+    for bit in reversed(range(int(n - 1).bit_length())):
+        rank = arrays["rank"]
+        np.not_equal(rank[1:] >> (bit + 1), rank[:-1] >> (bit + 1), out=group_start[1:])
+        is_one = ((rank >> bit) & 1).astype(bool)
+        is_zero = ~is_one
+
+        # the number (weight) of ones before each element in the array, then in its group
+        ones_before = np.cumsum(is_one, dtype=idx_dtype) - is_one
+        ones_before -= np.maximum.accumulate(ones_before * group_start)
+        arrays["cnt"] += ones_before * is_zero
+        if weights is not None:
+            w_one = arrays["w"] * is_one
+            ones_weight_before = np.cumsum(w_one) - w_one
+            ones_weight_before -= np.maximum.accumulate(
+                ones_weight_before * group_start
+            )
+            arrays["weight"] += ones_weight_before * is_zero
+
+        perm = np.argsort(is_one, kind="stable")
+        for name, arr in arrays.items():
+            arrays[name] = arr.take(perm)
+
+    cnt[arrays["order"]] = arrays["cnt"]
+    if weights is not None:
+        weight[arrays["order"]] = arrays["weight"]
+    return cnt, weight
+
+
+class StackDistance:
+    """the LRU stack distance of a stream of requests and their histograms
+
+    req_cnt[b] and req_byte[b] are the number and bytes of requests with
+    stack distance in ((b - 1) * obj_granularity, b * obj_granularity],
+    byte_req_cnt[b] and byte_req_byte[b] are the same for the byte stack distance
+    with byte_granularity, requests to new objects are counted in n_cold_req and n_cold_byte
+
+    Args:
+        byte_weighted (bool, optional): whether to compute the byte stack distance
+        obj_granularity (int, optional): the bucket of the stack distance histogram
+        byte_granularity (int, optional): the bucket of the byte stack distance histogram
+    """
+
+    def __init__(
+        self,
+        byte_weighted=False,
+        obj_granularity=1,
+        byte_granularity=DEFAULT_BYTE_GRANULARITY,
+    ):
+        self.byte_weighted = byte_weighted
+        self.obj_granularity = obj_granularity
+        self.byte_granularity = byte_granularity
+
+        self.n_req, self.n_byte = 0, 0
+        self.n_cold_req, self.n_cold_byte = 0, 0
+        self.req_cnt = np.zeros(1, dtype=np.int64)
+        self.req_byte = np.zeros(1, dtype=np.int64)
+        self.byte_req_cnt = np.zeros(1, dtype=np.int64)
+        self.byte_req_byte = np.zeros(1, dtype=np.int64)
+
+        self._tracker = AccessTracker()
+        # the vtime and the object size of the marker in each slot
+        self._slot_vtime = np.zeros(MIN_N_SLOT, dtype=np.int64)
+        self._slot_size = np.zeros(MIN_N_SLOT, dtype=np.int64)
+        self._slot_alive = np.zeros(MIN_N_SLOT, dtype=bool)
+        self._n_slot = 0
+        self._cnt_tree = FenwickTree(np.zeros(MIN_N_SLOT, dtype=np.int64))
+        self._byte_tree = None
+        if byte_weighted:
+            self._byte_tree = FenwickTree(np.zeros(MIN_N_SLOT, dtype=np.int64))
+        # the number of objects and the bytes of their last requests
+        self.n_obj, self.working_set_byte = 0, 0
+
+    def _compact(self, n_new_slot):
+        """remove the dead slots and make room for n_new_slot slots"""
+
+        alive = np.flatnonzero(self._slot_alive[: self._n_slot])
+        n_slot = max(MIN_N_SLOT, 2 * (len(alive) + n_new_slot))
+        for name in ("_slot_vtime", "_slot_size", "_slot_alive"):
+            arr = getattr(self, name)
+            new_arr = np.zeros(n_slot, dtype=arr.dtype)
+            new_arr[: len(alive)] = arr[alive]
+            setattr(self, name, new_arr)
+        self._n_slot = len(alive)
+        self._cnt_tree = FenwickTree(self._slot_alive.astype(np.int64))
+        if self.byte_weighted:
+            self._byte_tree = FenwickTree(self._slot_size * self._slot_alive)
+
+    def add(self, obj_id, obj_size):
+        """compute the stack distance of a chunk of requests and add them to the histograms
+
+        Args:
+            obj_id (np.ndarray): the object of each request
+            obj_size (np.ndarray): the size of each request
+
+        Returns:
+            tuple: (dist, byte_dist), the stack distance and the byte stack distance
+                (None if not byte_weighted) of each request, -1 for new objects
+        """
+
+        n = len(obj_id)
+        if n == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty if self.byte_weighted else None
+
+        obj_size = np.asarray(obj_size, dtype=np.int64)
+        t0 = self.n_req
+        vtime = np.arange(t0, t0 + n, dtype=np.int64)
+        _, last_vtime, _ = self._tracker.update(obj_id, vtime, vtime)
+
+        reuse = last_vtime >= 0
+        # the requests whose last request is before the chunk, the marker is in the tree
+        old = reuse & (last_vtime < t0)
+        in_chunk = last_vtime >= t0
+        old_slot = np.searchsorted(self._slot_vtime[: self._n_slot], last_vtime[old])
+        # the size of the object at the last request, it is the weight of the marker
+        last_size = np.zeros(n, dtype=np.int64)
+        last_size[old] = self._slot_size[old_slot]
+        last_size[in_chunk] = obj_size[last_vtime[in_chunk] - t0]
+
+        # the requests in the chunk after the last request (and after the chunk start)
+        # minus the ones that are not the last request of their objects,
+        # i.e., the earlier requests in the chunk whose last request is after the last request
+        earlier_cnt = np.zeros(n, dtype=np.int64)
+        earlier_byte = np.zeros(n, dtype=np.int64)
+        earlier_cnt[reuse], reuse_earlier_byte = _count_earlier_greater(
+            last_vtime[reuse], last_size[reuse] if self.byte_weighted else None
+        )
+        if self.byte_weighted:
+            earlier_byte[reuse] = reuse_earlier_byte
+        lo = np.maximum(last_vtime + 1, t0) - t0
+        dist = np.full(n, -1, dtype=np.int64)
+        dist[reuse] = vtime[reuse] - t0 - lo[reuse] - earlier_cnt[reuse] + 1
+        dist[old] += self.n_obj - self._cnt_tree.prefix_sum(old_slot)
+
+        byte_dist = None
+        if self.byte_weighted:
+            byte_before = np.zeros(n + 1, dtype=np.int64)
+            np.cumsum(obj_size, out=byte_before[1:])
+            byte_dist = np.full(n, -1, dtype=np.int64)
+            byte_dist[reuse] = (
+                byte_before[vtime[reuse] - t0]
+                - byte_before[lo[reuse]]
+                - earlier_byte[reuse]
+                + obj_size[reuse]
+            )
+            byte_dist[old] += self.working_set_byte - self._byte_tree.prefix_sum(
+                old_slot
+            )
+
+        # move the markers to the last request of each object in the chunk
+        self._cnt_tree.add(old_slot, -1)
+        if self.byte_weighted:
+            self._byte_tree.add(old_slot, -last_size[old])
+        self._slot_alive[old_slot] = False
+        is_last = np.ones(n, dtype=bool)
+        is_last[last_vtime[in_chunk] - t0] = False
+        last_pos = np.flatnonzero(is_last)
+        if self._n_slot + len(last_pos) > len(self._slot_vtime):
+            self._compact(len(last_pos))
+        new_slot = np.arange(self._n_slot, self._n_slot + len(last_pos))
+        self._slot_vtime[new_slot] = vtime[last_pos]
+        self._slot_size[new_slot] = obj_size[last_pos]
+        self._slot_alive[new_slot] = True
+        self._n_slot += len(last_pos)
+        self._cnt_tree.add(new_slot, 1)
+        if self.byte_weighted:
+            self._byte_tree.add(new_slot, obj_size[last_pos])
+        self.n_obj += len(last_pos) - int(np.sum(old))
+        self.working_set_byte += int(np.sum(obj_size[last_pos])) - int(
+            np.sum(last_size[old])
+        )
+
+        self._add_histogram(dist, byte_dist, obj_size)
+        self.n_req += n
+        self.n_byte += int(obj_size.sum())
+
+        return dist, byte_dist
+
+    def remove(self, obj_id):
+        """remove objects from the LRU stack, e.g., the objects dropped by sampling,
+        a removed object is a new object if it is requested again
+
+        Args:
+            obj_id (np.ndarray): distinct objects in the stack
+        """
+
+        last_vtime = self._tracker.remove(obj_id)
+        slot = np.searchsorted(self._slot_vtime[: self._n_slot], last_vtime)
+        self._cnt_tree.add(slot, -1)
+        if self.byte_weighted:
+            self._byte_tree.add(slot, -self._slot_size[slot])
+        self._slot_alive[slot] = False
+        self.n_obj -= len(slot)
+        self.working_set_byte -= int(np.sum(self._slot_size[slot]))
+
+    def _add_histogram(self, dist, byte_dist, obj_size):
+        reuse = dist > 0
+        self.n_cold_req += int(np.sum(~reuse))
+        self.n_cold_byte += int(np.sum(obj_size[~reuse]))
+
+        size = obj_size[reuse]
+        bucket = (dist[reuse] + self.obj_granularity - 1) // self.obj_granularity
+        self.req_cnt = _add_counts(self.req_cnt, bucket)
+        self.req_byte = _add_counts(self.req_byte, bucket, size)
+        if byte_dist is not None:
+            bucket = (byte_dist[reuse] + self.byte_granularity - 1) // (
+                self.byte_granularity
+            )
+            self.byte_req_cnt = _add_counts(self.byte_req_cnt, bucket)
+            self.byte_req_byte = _add_counts(self.byte_req_byte, bucket, size)
+
+    def miss_ratio_curve(self, ignore_obj_size=True):
+        """the miss ratio of LRU at every cache size
+
+        Args:
+            ignore_obj_size (bool, optional): the cache size is the number of objects if True,
+                otherwise bytes, which needs byte_weighted
+
+        Returns:
+            tuple: (cache_size, miss_ratio, byte_miss_ratio) arrays, one per histogram bucket
+        """
+
+        if ignore_obj_size:
+            granularity, req_cnt, req_byte = (
+                self.obj_granularity,
+                self.req_cnt,
+                self.req_byte,
+            )
+        else:
+            assert self.byte_weighted, "byte stack distance is not computed"
+            granularity, req_cnt, req_byte = (
+                self.byte_granularity,
+                self.byte_req_cnt,
+                self.byte_req_byte,
+            )
+
+        # the misses of the cache of size b * granularity are the requests in the buckets after b
+        n_miss = self.n_req - np.cumsum(req_cnt)
+        n_miss_byte = self.n_byte - np.cumsum(req_byte)
+        cache_size = np.arange(len(req_cnt), dtype=np.int64) * granularity
+
+        return (
+            cache_size,
+            n_miss / max(self.n_req, 1),
+            n_miss_byte / max(self.n_byte, 1),
+        )
+
+    def mrc(self, cache_sizes, ignore_obj_size=True):
+        """the LRU miss ratio at the cache sizes in the mrc_dict format of plot_mrc_size
+
+        Args:
+            cache_sizes (Iterable[float]): a size smaller than 1 is a fraction of the working set
+                (the number of objects or the bytes of the objects), cachesim does the same
+            ignore_obj_size (bool, optional): the cache size is the number of objects if True,
+                otherwise bytes
+
+        Returns:
+            list: [(cache_size, miss_ratio, byte_miss_ratio)]
+        """
+
+        working_set = self.n_obj if ignore_obj_size else self.working_set_byte
+        return mrc_at_sizes(
+            self.miss_ratio_curve(ignore_obj_size), working_set, cache_sizes
+        )
+
+
+def mrc_at_sizes(curve, working_set, cache_sizes):
+    """look up the miss ratio at each cache size on a miss ratio curve
+
+    Args:
+        curve (tuple): (cache_size, miss_ratio, byte_miss_ratio) arrays, cache_size is increasing
+            and the miss ratio of a cache size holds until the next one
+        working_set (float): the working set size, the unit of a fraction of the working set
+        cache_sizes (Iterable[float]): a size smaller than 1 is a fraction of the working set
+
+    Returns:
+        list: [(cache_size, miss_ratio, byte_miss_ratio)]
+    """
+
+    size, miss_ratio, byte_miss_ratio = curve
+    mrc = []
+    for cache_size in cache_sizes:
+        if cache_size < 1:
+            cache_size = int(working_set * cache_size)
+        cache_size = int(cache_size)
+        # the largest bucket that fits in the cache
+        idx = min(np.searchsorted(size, cache_size, side="right") - 1, len(size) - 1)
+        mrc.append((cache_size, float(miss_ratio[idx]), float(byte_miss_ratio[idx])))
+
+    return mrc
+
+
+def reuse_distance(
+    ifilepath,
+    byte_weighted=False,
+    obj_granularity=1,
+    byte_granularity=DEFAULT_BYTE_GRANULARITY,
+    n_req=-1,
+    chunk_rows=DEFAULT_CHUNK_ROWS,
+):
+    """compute the stack distance histograms of a lcs trace
+
+    Args:
+        ifilepath (str): the path of the lcs trace
+        byte_weighted (bool, optional): whether to compute the byte stack distance
+        obj_granularity (int, optional): the bucket of the stack distance histogram
+        byte_granularity (int, optional): the bucket of the byte stack distance histogram
+        n_req (int, optional): the number of requests to use, -1 means all
+        chunk_rows (int, optional): the number of requests read at a time
+
+    Returns:
+        StackDistance: the histograms
+    """
+
+    sd = StackDistance(byte_weighted, obj_granularity, byte_granularity)
+    for records in read_lcs(ifilepath, chunk_rows=chunk_rows):
+        if n_req >= 0:
+            records = records[: n_req - sd.n_req]
+        if len(records) == 0:
+            break
+        sd.add(records["obj_id"], records["obj_size"])
+
+    return sd
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    p = ArgumentParser(description="compute the LRU miss ratio curve of a lcs trace")
+    p.add_argument("ifilepath", help="lcs trace, can be zstd compressed")
+    p.add_argument(
+        "--sizes",
+        help="comma separated cache sizes, a size smaller than 1 is a fraction of the working set",
+        default=DEFAULT_CACHE_SIZES,
+    )
+    p.add_argument(
+        "--byte",
+        action="store_true",
+        help="the cache size is in bytes (the byte stack distance)",
+    )
+    p.add_argument(
+        "--obj-granularity",
+        type=int,
+        help="the bucket of the stack distance histogram",
+        default=1,
+    )
+    p.add_argument(
+        "--byte-granularity",
+        type=int,
+        help="the bucket of the byte stack distance histogram",
+        default=DEFAULT_BYTE_GRANULARITY,
+    )
+    p.add_argument(
+        "--num-req", type=int, help="the number of requests to use", default=-1
+    )
+    p.add_argument("--plot", help="plot the mrc to {plot}.pdf", default=None)
+    args = p.parse_args()
+
+    sd = reuse_distance(
+        args.ifilepath,
+        byte_weighted=args.byte,
+        obj_granularity=args.obj_granularity,
+        byte_granularity=args.byte_granularity,
+        n_req=args.num_req,
+    )
+    # 0.01 is a fraction of the working set, 1GiB and 1000 are sizes
+    sizes = [
+        conv_size_str_to_int(s) if s.endswith("B") else float(s)
+        for s in args.sizes.split(",")
+    ]
+    mrc = sd.mrc(sizes, ignore_obj_size=not args.byte)
+
+    print(
+        f"{sd.n_req} req, {sd.n_obj} obj, working set {sd.working_set_byte} bytes, "
+        f"cold miss ratio {sd.n_cold_req / max(sd.n_req, 1):.4f}"
+    )
+    for cache_size, miss_ratio, byte_miss_ratio in mrc:
+        print(
+            f"LRU cache size {cache_size:16}, miss ratio {miss_ratio:.4f}, "
+            f"byte miss ratio {byte_miss_ratio:.4f}"
+        )
+
+    if args.plot:
+        from plot_mrc_size import plot_mrc_size
+
+        plot_mrc_size(
+            {"LRU": mrc},
+            cache_size_has_unit=args.byte,
+            use_byte_miss_ratio=False,
+            name=args.plot,
+        )
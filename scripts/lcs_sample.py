@@ -0,0 +1,153 @@
+"""
+spatially sample a lcs trace: keep all the requests of a fixed fraction of objects
+
+an object is selected if its obj_id_hash (a fixed 64-bit mixing hash) is in the lowest
+sample_ratio of the hash space, so the sample is the same on every run and machine,
+and a 0.1% sample is a subset of the 1% sample,
+the converters use the same hash (see traceConv/metaKV.py), so sampling during conversion
+and sampling a converted trace select the same objects
+
+spatial sampling keeps every request of a selected object, so the popularity, size, ttl
+and tenant distributions of the sample estimate the full trace as they are,
+while the counts (n_req, n_obj, n_req_byte, ...) are divided by sample_ratio to estimate the
+full trace; the header describes the sample, the sample ratio and the estimated counts
+are saved to trace.sample{ratio}.lcs.sample.json;
+when simulating a sampled trace, the cache size should be scaled by sample_ratio
+
+next_access_vtime of the sampled trace is not known (-2), use lcs_next_access.py to compute it
+
+usage:
+    python3 lcs_sample.py trace.lcs.zst --sample-ratio 0.01
+    python3 lcs_sample.py trace.lcs.zst --sample-ratio 0.001 -o trace.sample0.001.lcs
+
+"""
+
+import os
+import sys
+import json
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from lcs_reader import DEFAULT_CHUNK_ROWS, filter_lcs, read_stat
+from lcs_writer import LcsWriter, DEFAULT_MAX_MEM_ROWS
+
+# the sample ratio and the full-trace estimates, saved next to the sampled trace
+SAMPLE_INFO_SUFFIX = ".sample.json"
+
+# these fields are proportional to the number of sampled objects
+RESCALED_STAT_FIELDS = (
+    "n_req",
+    "n_obj",
+    "n_req_byte",
+    "n_obj_byte",
+    "n_read",
+    "n_write",
+    "n_delete",
+)
+
+
+def rescale_stat(stat, sample_ratio):
+    """estimate the stat of the full trace from the stat of a spatial sample
+
+    Args:
+        stat (dict): the stat of the sampled trace, see lcs_reader.parse_stat
+        sample_ratio (float): the sample ratio
+
+    Returns:
+        dict: a new stat with the count fields divided by sample_ratio
+    """
+
+    stat = dict(stat)
+    for field in RESCALED_STAT_FIELDS:
+        stat[field] = int(round(stat[field] / sample_ratio))
+
+    return stat
+
+
+def sample_lcs(
+    ifilepath,
+    sample_ratio,
+    ofilepath=None,
+    max_mem_rows=DEFAULT_MAX_MEM_ROWS,
+    tmp_dir=None,
+    chunk_rows=DEFAULT_CHUNK_ROWS,
+):
+    """write the requests of sample_ratio of objects to an uncompressed lcs trace,
+    the header has the stat of the sample, the sample ratio and the full-trace estimate
+    (see rescale_stat) are saved to ofilepath + SAMPLE_INFO_SUFFIX
+
+    Args:
+        ifilepath (str): the path of the lcs trace
+        sample_ratio (float): the fraction of objects to keep, in (0, 1]
+        ofilepath (str, optional): the output path, default: trace.lcs(.zst) -> trace.sample{ratio}.lcs
+        max_mem_rows (int, optional): see lcs_writer.LcsWriter
+        tmp_dir (str, optional): see lcs_writer.LcsWriter
+        chunk_rows (int, optional): the number of requests read at a time
+
+    Returns:
+        Tuple[dict, dict]: the stat of the sample and the full-trace estimate
+    """
+
+    if ofilepath is None:
+        pathbase = (
+            ifilepath[: -len(".zst")] if ifilepath.endswith(".zst") else ifilepath
+        )
+        pathbase = pathbase[: -len(".lcs")] if pathbase.endswith(".lcs") else pathbase
+        ofilepath = f"{pathbase}.sample{sample_ratio}.lcs"
+
+    version = read_stat(ifilepath)["lcs_version"]
+    writer = LcsWriter(
+        ofilepath,
+        version=version,
+        max_mem_rows=max_mem_rows,
+        tmp_dir=tmp_dir,
+    )
+    for records in filter_lcs(
+        ifilepath, sample_ratio=sample_ratio, chunk_rows=chunk_rows
+    ):
+        # the next access in the full trace is not the next access in the sample
+        writer.write(
+            **{
+                name: records[name]
+                for name in records.dtype.names
+                if name != "next_access_vtime"
+            }
+        )
+    sample_stat = writer.close()
+
+    estimated_stat = rescale_stat(sample_stat, sample_ratio)
+    with open(ofilepath + SAMPLE_INFO_SUFFIX, "w") as f:
+        json.dump(
+            {
+                "sample_ratio": sample_ratio,
+                "estimate": {
+                    field: estimated_stat[field] for field in RESCALED_STAT_FIELDS
+                },
+            },
+            f,
+        )
+
+    print(
+        f"sampled {sample_stat['n_req']} requests of {sample_stat['n_obj']} objects "
+        f"(sample ratio {sample_ratio}) to {ofilepath}"
+    )
+    return sample_stat, estimated_stat
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    p = ArgumentParser(description="spatially sample a lcs trace")
+    p.add_argument("trace", help="trace file path")
+    p.add_argument(
+        "--sample-ratio", type=float, help="fraction of objects to keep", required=True
+    )
+    p.add_argument("-o", "--ofilepath", help="output file path", default=None)
+    p.add_argument("--tmp-dir", type=str, help="directory of spill files", default=None)
+    args = p.parse_args()
+
+    sample_lcs(
+        args.trace,
+        args.sample_ratio,
+        args.ofilepath,
+        tmp_dir=args.tmp_dir,
+    )
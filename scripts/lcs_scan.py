@@ -0,0 +1,242 @@
+"""
+scan a lcs trace with multiple processes in a map/reduce fashion
+
+the trace is split into record-aligned request ranges (aligned to frames for seekable .zst traces),
+each process maps every chunk of records in its range with the reducers,
+and the partial results are merged in trace order
+
+a reducer is a pair of functions, map(records) -> partial and merge(partial1, partial2) -> partial,
+records is a numpy structured array with dtype lcs_reader.LCS_DTYPE[version];
+because the reducers are sent to the worker processes, they must be defined at module level
+
+usage:
+    python3 lcs_scan.py trace.lcs --n-proc 64
+    python3 lcs_scan.py trace.lcs --reducers n_req,n_byte,op_cnt
+
+    from lcs_scan import scan, Reducer, REDUCERS
+    result = scan("trace.lcs", {"n_req": REDUCERS["n_req"], "my_stat": Reducer(my_map, my_merge)})
+
+"""
+
+import os
+import sys
+import numpy as np
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from lcs_reader import (
+    LcsTrace,
+    DEFAULT_CHUNK_ROWS,
+    decode_records,
+    read_lcs,
+    load_frame_index,
+)
+
+Reducer = namedtuple("Reducer", ["map", "merge"])
+
+
+def _add(a, b):
+    return a + b
+
+
+def _map_n_req(records):
+    return len(records)
+
+
+def _map_n_byte(records):
+    return int(records["obj_size"].sum())
+
+
+def _map_time_range(records):
+    return int(records["clock_time"][0]), int(records["clock_time"][-1])
+
+
+def _merge_time_range(a, b):
+    return min(a[0], b[0]), max(a[1], b[1])
+
+
+def _map_op_cnt(records):
+    return np.bincount(records["op"], minlength=256)
+
+
+def _map_value_cnt(values):
+    return np.unique(values, return_counts=True)
+
+
+def _merge_value_cnt(a, b):
+    values, inverse = np.unique(np.concatenate([a[0], b[0]]), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate([a[1], b[1]]))
+    return values, counts.astype(np.int64)
+
+
+def _map_tenant_cnt(records):
+    return _map_value_cnt(records["tenant"])
+
+
+def _map_size_cnt(records):
+    return _map_value_cnt(records["obj_size"])
+
+
+REDUCERS = {
+    "n_req": Reducer(_map_n_req, _add),
+    "n_byte": Reducer(_map_n_byte, _add),
+    "time_range": Reducer(_map_time_range, _merge_time_range),
+    # the number of requests of each op, indexed by op
+    "op_cnt": Reducer(_map_op_cnt, _add),
+    # (tenant, count) arrays
+    "tenant_cnt": Reducer(_map_tenant_cnt, _merge_value_cnt),
+    # (obj_size, count) arrays, weighted by requests
+    "size_cnt": Reducer(_map_size_cnt, _merge_value_cnt),
+}
+
+
+def split_trace(trace, n_split):
+    """split the trace into at most n_split contiguous request ranges,
+    the ranges are aligned to frames for seekable traces
+
+    Returns:
+        List[Tuple[int, int]]: a list of [start, end) request index
+    """
+
+    if trace.frame_index is not None:
+        boundaries = trace.frame_index["first_req"].astype(np.int64)
+        step = max(1, int(np.ceil(len(boundaries) / n_split)))
+        starts = list(boundaries[::step])
+    else:
+        step = max(1, int(np.ceil(len(trace) / n_split)))
+        starts = list(range(0, len(trace), step))
+
+    ends = starts[1:] + [len(trace)]
+    return [(int(s), int(e)) for s, e in zip(starts, ends)]
+
+
+def _iter_range(trace, start, end, chunk_rows):
+    if trace.frame_index is not None:
+        # decode one frame at a time
+        first_frame = (
+            int(np.searchsorted(trace.frame_index["first_req"], start, side="right"))
+            - 1
+        )
+        for frame_id in range(first_frame, trace.n_frame):
+            frame = trace.frame_index[frame_id]
+            if frame["first_req"] >= end:
+                break
+            raw = trace.read_frame(frame_id)
+            lo = max(start - int(frame["first_req"]), 0)
+            hi = min(end - int(frame["first_req"]), len(raw))
+            yield decode_records(raw[lo:hi], trace.version)
+    else:
+        for chunk_start in range(start, end, chunk_rows):
+            yield trace[chunk_start : min(chunk_start + chunk_rows, end)]
+
+
+def _reduce_chunks(chunks, reducers):
+    result = {}
+    for records in chunks:
+        if len(records) == 0:
+            continue
+        for name, reducer in reducers.items():
+            partial = reducer.map(records)
+            result[name] = (
+                partial if name not in result else reducer.merge(result[name], partial)
+            )
+
+    return result
+
+
+def _scan_range(ifilepath, start, end, reducers, chunk_rows):
+    trace = LcsTrace(ifilepath, n_thread=1)
+    return _reduce_chunks(_iter_range(trace, start, end, chunk_rows), reducers)
+
+
+def _merge_results(results, reducers):
+    merged = {}
+    for result in results:
+        for name, partial in result.items():
+            merged[name] = (
+                partial
+                if name not in merged
+                else reducers[name].merge(merged[name], partial)
+            )
+
+    return merged
+
+
+def scan(ifilepath, reducers=None, n_proc=-1, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """run the reducers over the trace with n_proc processes
+
+    Args:
+        ifilepath (str): the path of the lcs trace, uncompressed or seekable .zst,
+            other .zst traces are scanned sequentially in the current process
+        reducers (Dict[str, Reducer], optional): the reducers to run, default: all REDUCERS
+        n_proc (int, optional): the number of processes, default: -1 (use all the cores)
+        chunk_rows (int, optional): the number of requests passed to each map call
+
+    Returns:
+        Dict[str, Any]: the merged result of each reducer, a reducer that never
+            saw a record (e.g., the trace is empty) is not in the result
+    """
+
+    if reducers is None:
+        reducers = REDUCERS
+    if n_proc <= 0:
+        n_proc = os.cpu_count()
+
+    if ifilepath.endswith(".zst") and load_frame_index(ifilepath) is None:
+        return _reduce_chunks(read_lcs(ifilepath, chunk_rows=chunk_rows), reducers)
+
+    trace = LcsTrace(ifilepath)
+    ranges = split_trace(trace, n_proc)
+    if len(ranges) <= 1:
+        return _reduce_chunks(_iter_range(trace, 0, len(trace), chunk_rows), reducers)
+
+    with ProcessPoolExecutor(min(n_proc, len(ranges))) as executor:
+        futures = [
+            executor.submit(_scan_range, ifilepath, start, end, reducers, chunk_rows)
+            for start, end in ranges
+        ]
+        # merge in trace order so that order-sensitive reducers work
+        return _merge_results([f.result() for f in futures], reducers)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from utils.const import OP_NAMES
+    from lcs_reader import open_trace, read_header, LCS_DTYPE
+
+    p = ArgumentParser()
+    p.add_argument("trace", help="trace file path")
+    p.add_argument("--n-proc", type=int, default=-1, help="number of processes")
+    p.add_argument(
+        "--reducers",
+        type=str,
+        default=",".join(REDUCERS.keys()),
+        help="reducers to run, separated by comma",
+    )
+    args = p.parse_args()
+
+    reader = open_trace(args.trace)
+    fields = LCS_DTYPE[read_header(reader, print_stat=False)].names
+    reader.close()
+
+    reducers = {name: REDUCERS[name] for name in args.reducers.split(",")}
+    # lcs_v1 does not have op and tenant
+    if "op" not in fields:
+        reducers.pop("op_cnt", None)
+        reducers.pop("tenant_cnt", None)
+
+    result = scan(args.trace, reducers, args.n_proc)
+
+    for name, value in result.items():
+        if name == "op_cnt":
+            value = {
+                OP_NAMES[i]: int(c)
+                for i, c in enumerate(value)
+                if c > 0 and i < len(OP_NAMES)
+            }
+        elif name in ("tenant_cnt", "size_cnt"):
+            order = np.argsort(-value[1])[:8]
+            value = ", ".join(f"{value[0][i]}:{value[1][i]}" for i in order)
+            value += ", ..." if len(order) == 8 else ""
+        print(f"{name:12}: {value}")
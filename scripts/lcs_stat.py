@@ -0,0 +1,93 @@
+"""
+print the stat stored in the header of lcs traces without reading the requests
+
+it only reads the 8 KiB header of each trace (the beginning of the first frame for .zst),
+so a catalog of thousands of traces can be refreshed in seconds
+
+usage:
+    python3 lcs_stat.py /disk/data/lcs/
+    python3 lcs_stat.py --json /disk/data/lcs/*.lcs.zst > catalog.json
+
+"""
+
+import os
+import sys
+import json
+import glob
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from lcs_reader import read_stat
+
+LCS_SUFFIXES = (".lcs", ".lcs.zst")
+
+
+def find_traces(paths):
+    """expand directories into the lcs traces under them"""
+
+    tracepaths = []
+    for path in paths:
+        if os.path.isdir(path):
+            for suffix in LCS_SUFFIXES:
+                tracepaths += glob.glob(f"{path}/**/*{suffix}", recursive=True)
+        else:
+            tracepaths.append(path)
+
+    return sorted(set(tracepaths))
+
+
+def _read_stat(tracepath):
+    try:
+        stat = read_stat(tracepath)
+    except Exception as e:
+        return {"path": tracepath, "error": str(e)}
+
+    return {"path": tracepath, "file_size": os.path.getsize(tracepath), **stat}
+
+
+def lcs_stat(paths, n_thread=32):
+    """read the stat of many lcs traces in parallel
+
+    Args:
+        paths (List[str]): lcs traces or directories containing lcs traces
+        n_thread (int, optional): the number of threads, default: 32
+
+    Returns:
+        List[dict]: one stat per trace, a trace that cannot be read has an error field
+    """
+
+    tracepaths = find_traces(paths)
+    # reading the header is dominated by IO latency, so threads are enough
+    with ThreadPoolExecutor(n_thread) as executor:
+        return list(executor.map(_read_stat, tracepaths))
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    p = ArgumentParser()
+    p.add_argument("paths", nargs="+", help="lcs traces or directories")
+    p.add_argument("--json", action="store_true", help="output json", default=False)
+    p.add_argument("--n-thread", type=int, help="number of threads", default=32)
+    args = p.parse_args()
+
+    stats = lcs_stat(args.paths, args.n_thread)
+
+    if args.json:
+        print(json.dumps(stats, indent=2))
+        sys.exit(0)
+
+    print(
+        f"{'trace':48} {'ver':>3} {'n_req':>14} {'n_obj':>12} {'n_req_byte':>16} "
+        f"{'n_obj_byte':>16} {'days':>6} {'skewness':>8}"
+    )
+    for stat in stats:
+        if "error" in stat:
+            print(f"{os.path.basename(stat['path']):48} error: {stat['error']}")
+            continue
+        duration = (stat["end_timestamp"] - stat["start_timestamp"]) / 86400
+        print(
+            f"{os.path.basename(stat['path']):48} {stat['lcs_version']:3} {stat['n_req']:14} "
+            f"{stat['n_obj']:12} {stat['n_req_byte']:16} {stat['n_obj_byte']:16} "
+            f"{duration:6.2f} {stat['skewness']:8.4f}"
+        )
@@ -0,0 +1,735 @@
+"""
+write lcs traces, see lcs_reader.py for the format
+
+LcsWriter writes batches of numpy columns into any lcs version (lcs_v1 - lcs_v8),
+it computes the header stat (the same fields as traceConv) incrementally with bounded memory
+and back-patches the header when it is closed
+
+compress_seekable compresses a lcs trace into independent zstd frames
+so that it can be decoded in parallel and accessed randomly (see LcsTrace),
+the output is still a valid .zst file that zstd and libCacheSim can read
+
+usage:
+    python3 lcs_writer.py trace.lcs --frame-rows 1048576
+
+"""
+
+import io
+import os
+import sys
+import math
+import struct
+import tempfile
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from lcs_reader import (
+    LCS_HEADER_SIZE,
+    LCS_TRACE_STAT_SIZE,
+    LCS_STRAT_MAGIC,
+    LCS_END_MAGIC,
+    LCS_REQUEST_HEADER,
+    N_MOST_COMMON,
+    LCS_RAW_DTYPE,
+    LCS_FRAME_INDEX_DTYPE,
+    LCS_FRAME_INDEX_SUFFIX,
+    open_trace,
+    read_header,
+    iter_raw_chunks,
+    _read_full,
+    obj_id_hash,
+)
+
+# 1M requests per frame is 24 MB of lcs_v2 records before compression
+DEFAULT_FRAME_ROWS = 1024 * 1024
+# the window log of `zstd --long`, the largest window zstd decompresses by default
+ZSTD_LONG_WINDOW_LOG = 27
+
+# req_op_e in libCacheSim/include/libCacheSim/enum.h
+OP_NOP, OP_GET, OP_GETS, OP_SET, OP_ADD, OP_CAS, OP_REPLACE = 0, 1, 2, 3, 4, 5, 6
+OP_DELETE, OP_READ, OP_WRITE, OP_UPDATE = 9, 12, 13, 14
+# how traceConv counts n_read, n_write and n_delete in the header stat
+READ_OPS = (OP_GET, OP_GETS, OP_READ)
+WRITE_OPS = (OP_WRITE, OP_SET, OP_REPLACE, OP_ADD, OP_UPDATE)
+DELETE_OPS = (OP_DELETE,)
+
+# the value of next_access_vtime when it is unknown (see new_request in libCacheSim)
+NEXT_ACCESS_VTIME_UNKNOWN = -2
+UINT32_MAX = 0xFFFFFFFF
+CURR_STAT_VERSION = 1
+
+# the number of buffered per-object rows before spilling them to disk
+DEFAULT_MAX_MEM_ROWS = 16 * 1024 * 1024
+DEFAULT_N_PARTITION = 64
+
+# a zstd frame holding one raw (uncompressed) block, see RFC 8878:
+# magic, frame header descriptor (single segment, 2-byte content size), content size - 256,
+# and the block header (last block, raw block, block size)
+ZSTD_MAGIC = 0xFD2FB528
+_RAW_FRAME_HEADER_SIZE = 4 + 1 + 2 + 3
+
+_OBJ_AGG_DTYPE = np.dtype([("obj_id", "<u8"), ("freq", "<i8"), ("obj_size", "<i8")])
+
+
+def pack_stat(stat):
+    """pack the trace stat (see lcs_reader.parse_stat) into LCS_TRACE_STAT_SIZE bytes"""
+
+    b = bytearray(LCS_TRACE_STAT_SIZE)
+
+    def _pack_list(fmt, offset, values):
+        values = list(values)[:N_MOST_COMMON]
+        values += [0] * (N_MOST_COMMON - len(values))
+        struct.pack_into("<" + fmt * N_MOST_COMMON, b, offset, *values)
+
+    struct.pack_into(
+        "<qqqqqqqqqq",
+        b,
+        0,
+        stat.get("version", CURR_STAT_VERSION),
+        stat["n_req"],
+        stat["n_obj"],
+        stat["n_req_byte"],
+        stat["n_obj_byte"],
+        stat["start_timestamp"],
+        stat["end_timestamp"],
+        stat["n_read"],
+        stat["n_write"],
+        stat["n_delete"],
+    )
+    struct.pack_into("<qq", b, 80, stat["smallest_obj_size"], stat["largest_obj_size"])
+    _pack_list("q", 96, stat["most_common_obj_sizes"])
+    _pack_list("f", 224, stat["most_common_obj_size_ratio"])
+    _pack_list("q", 288, stat["highest_freq"])
+    _pack_list("i", 416, stat["most_common_freq"])
+    _pack_list("f", 480, stat["most_common_freq_ratio"])
+    struct.pack_into("<d", b, 544, stat["skewness"])
+    struct.pack_into("<i", b, 552, stat["n_tenant"])
+    _pack_list("i", 556, stat["most_common_tenants"])
+    _pack_list("f", 620, stat["most_common_tenant_ratio"])
+    struct.pack_into(
+        "<iii", b, 684, stat["n_ttl"], stat["smallest_ttl"], stat["largest_ttl"]
+    )
+    _pack_list("i", 696, stat["most_common_ttls"])
+    _pack_list("f", 760, stat["most_common_ttl_ratio"])
+
+    return bytes(b)
+
+
+def _zstd_compressor(level, n_thread, long_distance):
+    """the zstd compressor of the lcs traces, long_distance is `zstd --long`"""
+
+    import zstandard as zstd
+
+    params = zstd.ZstdCompressionParameters.from_level(
+        level,
+        threads=n_thread,
+        enable_ldm=long_distance,
+        window_log=ZSTD_LONG_WINDOW_LOG if long_distance else 0,
+        write_checksum=True,
+    )
+    return zstd.ZstdCompressor(compression_params=params)
+
+
+def _raw_zstd_frame(data):
+    """wrap data (256 to 128 KiB bytes) into a zstd frame without compression,
+    the data is at a fixed offset (_RAW_FRAME_HEADER_SIZE) in the frame so it can be
+    overwritten later, which lets a .zst trace back-patch its header
+    """
+
+    assert 256 <= len(data) <= 128 * 1024
+    block_header = 1 | (0 << 1) | (len(data) << 3)
+    return (
+        struct.pack("<IBH", ZSTD_MAGIC, 0x60, len(data) - 256)
+        + block_header.to_bytes(3, "little")
+        + data
+    )
+
+
+def pack_header(version, stat):
+    """pack a lcs header (LCS_HEADER_SIZE bytes)"""
+
+    header = bytearray(LCS_HEADER_SIZE)
+    struct.pack_into("<QQ", header, 0, LCS_STRAT_MAGIC, version)
+    header[16 : 16 + LCS_TRACE_STAT_SIZE] = pack_stat(stat)
+    struct.pack_into("<Q", header, LCS_HEADER_SIZE - 8, LCS_END_MAGIC)
+
+    return bytes(header)
+
+
+def _sum_log_rank(start, end, block=1024 * 1024):
+    """sum of log(r) and log(r)^2 for rank r in [start, end)"""
+
+    sum_x, sum_xx = 0.0, 0.0
+    for s in range(start, end, block):
+        x = np.log(np.arange(s, min(s + block, end), dtype=np.float64))
+        sum_x += x.sum()
+        sum_xx += (x * x).sum()
+
+    return sum_x, sum_xx
+
+
+def zipf_fit(freq, cnt):
+    """fit a Zipf distribution to a popularity distribution given as run lengths,
+    cnt[i] objects are requested freq[i] times each,
+    it is the linear regression between log(rank) and log(freq), the same as traceConv,
+    but without expanding one element per object
+
+    Args:
+        freq (np.ndarray): the request count of the objects, in any order
+        cnt (np.ndarray): the number of objects with each freq
+
+    Returns:
+        tuple: (alpha, r_squared), alpha is the negative slope of the regression,
+            r_squared is its coefficient of determination
+    """
+
+    freq = np.asarray(freq, dtype=np.float64)
+    cnt = np.asarray(cnt, dtype=np.int64)
+    order = np.argsort(-freq, kind="stable")
+    freq, cnt = freq[order], cnt[order]
+
+    n = int(cnt.sum())
+    if n < 2:
+        return 0.0, 0.0
+
+    # objects with rank in [run_start, run_end) have the same freq
+    run_end = np.cumsum(cnt) + 1
+    run_start = run_end - cnt
+    lgamma = np.vectorize(math.lgamma, otypes=[np.float64])
+    # sum of log(r) for r in [run_start, run_end) is lgamma(run_end) - lgamma(run_start)
+    sum_log_rank_run = lgamma(run_end.astype(np.float64)) - lgamma(
+        run_start.astype(np.float64)
+    )
+
+    log_freq = np.log(freq)
+    sum_x, sum_xx = _sum_log_rank(1, n + 1)
+    sum_y = float(np.sum(cnt * log_freq))
+    sum_yy = float(np.sum(cnt * log_freq * log_freq))
+    sum_xy = float(np.sum(sum_log_rank_run * log_freq))
+
+    var_x = n * sum_xx - sum_x * sum_x
+    var_y = n * sum_yy - sum_y * sum_y
+    cov_xy = n * sum_xy - sum_x * sum_y
+    if var_x == 0:
+        return 0.0, 0.0
+
+    slope = cov_xy / var_x
+    # all objects have the same freq, the regression is a horizontal line
+    r_squared = cov_xy * cov_xy / (var_x * var_y) if var_y > 0 else 0.0
+    return -slope, r_squared
+
+
+def zipf_alpha(freq, cnt):
+    """the Zipf alpha (skewness) of a popularity distribution given as run lengths,
+    see zipf_fit
+
+    Returns:
+        float: Zipf alpha
+    """
+
+    return zipf_fit(freq, cnt)[0]
+
+
+def _top_values(values, counts, n_top=N_MOST_COMMON):
+    """the n_top values with the largest counts"""
+
+    order = np.argsort(-counts, kind="stable")[:n_top]
+    return values[order], counts[order]
+
+
+def _merge_value_cnt(value_cnt, values):
+    """merge values into a (values, counts) pair"""
+
+    new_values, new_counts = np.unique(values, return_counts=True)
+    if value_cnt is None:
+        return new_values, new_counts
+
+    values, inverse = np.unique(
+        np.concatenate([value_cnt[0], new_values]), return_inverse=True
+    )
+    counts = np.bincount(inverse, weights=np.concatenate([value_cnt[1], new_counts]))
+    return values, counts.astype(np.int64)
+
+
+def _aggregate_obj(obj_id, freq, obj_size):
+    """group rows by obj_id, sum the freq and keep the last obj_size"""
+
+    # unique on the reversed array finds the last occurrence of each object
+    uniq_obj, last_idx, inverse = np.unique(
+        obj_id[::-1], return_index=True, return_inverse=True
+    )
+    agg = np.empty(len(uniq_obj), dtype=_OBJ_AGG_DTYPE)
+    agg["obj_id"] = uniq_obj
+    agg["freq"] = np.bincount(inverse, weights=freq[::-1], minlength=len(uniq_obj))
+    agg["obj_size"] = obj_size[::-1][last_idx]
+
+    return agg
+
+
+def pack_records(version, **columns):
+    """pack columns into records with dtype LCS_RAW_DTYPE[version],
+    see LcsWriter for the columns and their default values
+    """
+
+    unknown = set(columns) - set(LCS_REQUEST_HEADER[version]) - {"op_tenant"}
+    if unknown:
+        raise ValueError(f"lcs_v{version} does not have {sorted(unknown)}")
+
+    raw = np.zeros(len(columns["obj_id"]), dtype=LCS_RAW_DTYPE[version])
+    raw["next_access_vtime"] = NEXT_ACCESS_VTIME_UNKNOWN
+    for name, values in columns.items():
+        if name not in ("op", "tenant"):
+            raw[name] = values
+
+    if "op_tenant" in raw.dtype.names and "op_tenant" not in columns:
+        op = np.asarray(columns.get("op", 0), dtype=np.uint32)
+        tenant = np.asarray(columns.get("tenant", 0), dtype=np.uint32)
+        raw["op_tenant"] = (op & 0xFF) | (tenant << np.uint32(8))
+
+    return raw
+
+
+class _TraceStat:
+    """compute the lcs header stat incrementally with bounded memory
+
+    the per-request stat (n_req, op, tenant, ttl, ...) is updated on every batch,
+    the per-object stat (n_obj, object size, popularity) needs the frequency of each object,
+    so (obj_id, freq, obj_size) aggregates of each batch are buffered and spilled to
+    n_partition files partitioned by obj_id hash once more than max_mem_rows are buffered,
+    at the end, each partition is aggregated separately
+    """
+
+    def __init__(self, max_mem_rows, n_partition, tmp_dir):
+        self.max_mem_rows = max_mem_rows
+        self.n_partition = n_partition
+        self.tmp_dir = tmp_dir
+
+        self.n_req, self.n_req_byte = 0, 0
+        self.n_read, self.n_write, self.n_delete = 0, 0, 0
+        self.start_timestamp, self.end_timestamp = None, None
+        self.tenant_cnt, self.ttl_cnt = None, None
+
+        self.buffered_aggs = []
+        self.n_buffered_rows = 0
+        self.spill_paths = None
+
+    def update(self, clock_time, obj_id, obj_size, op, tenant, ttl):
+        if len(clock_time) == 0:
+            return
+
+        self.n_req += len(clock_time)
+        self.n_req_byte += int(obj_size.sum())
+        if self.start_timestamp is None:
+            self.start_timestamp = int(clock_time[0])
+        self.end_timestamp = int(clock_time[-1])
+
+        op_cnt = np.bincount(op, minlength=256)
+        self.n_read += int(op_cnt[list(READ_OPS)].sum())
+        self.n_write += int(op_cnt[list(WRITE_OPS)].sum())
+        self.n_delete += int(op_cnt[list(DELETE_OPS)].sum())
+
+        self.tenant_cnt = _merge_value_cnt(self.tenant_cnt, tenant)
+        self.ttl_cnt = _merge_value_cnt(self.ttl_cnt, ttl)
+
+        agg = _aggregate_obj(obj_id, np.ones(len(obj_id), dtype=np.int64), obj_size)
+        self.buffered_aggs.append(agg)
+        self.n_buffered_rows += len(agg)
+        if self.n_buffered_rows > self.max_mem_rows:
+            self._spill()
+
+    def _spill(self):
+        if self.spill_paths is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="lcs_stat_", dir=self.tmp_dir)
+            self.spill_paths = [
+                os.path.join(self.spill_dir, f"part{i}")
+                for i in range(self.n_partition)
+            ]
+        if not self.buffered_aggs:
+            return
+
+        aggs = np.concatenate(self.buffered_aggs)
+        partition = obj_id_hash(aggs["obj_id"]) % np.uint64(self.n_partition)
+        # stable sort keeps the order of the batches in each partition
+        order = np.argsort(partition, kind="stable")
+        aggs, partition = aggs[order], partition[order]
+        bounds = np.searchsorted(partition, np.arange(self.n_partition + 1))
+        for i in range(self.n_partition):
+            if bounds[i] < bounds[i + 1]:
+                with open(self.spill_paths[i], "ab") as f:
+                    f.write(aggs[bounds[i] : bounds[i + 1]].tobytes())
+
+        self.buffered_aggs = []
+        self.n_buffered_rows = 0
+
+    def _iter_partitions(self):
+        """yield the per-object aggregates of each partition"""
+
+        if self.spill_paths is None:
+            if self.buffered_aggs:
+                aggs = np.concatenate(self.buffered_aggs)
+                yield _aggregate_obj(aggs["obj_id"], aggs["freq"], aggs["obj_size"])
+            return
+
+        self._spill()
+        for path in self.spill_paths:
+            if not os.path.exists(path):
+                continue
+            aggs = np.fromfile(path, dtype=_OBJ_AGG_DTYPE)
+            os.remove(path)
+            yield _aggregate_obj(aggs["obj_id"], aggs["freq"], aggs["obj_size"])
+        os.rmdir(self.spill_dir)
+
+    def finalize(self):
+        """returns the stat as a dict, see lcs_reader.parse_stat"""
+
+        n_obj, n_obj_byte = 0, 0
+        size_cnt, freq_cnt = None, None
+        for agg in self._iter_partitions():
+            n_obj += len(agg)
+            n_obj_byte += int(agg["obj_size"].sum())
+            size_cnt = _merge_value_cnt(size_cnt, agg["obj_size"])
+            freq_cnt = _merge_value_cnt(freq_cnt, agg["freq"])
+
+        stat = {
+            "version": CURR_STAT_VERSION,
+            "n_req": self.n_req,
+            "n_obj": n_obj,
+            "n_req_byte": self.n_req_byte,
+            "n_obj_byte": n_obj_byte,
+            "start_timestamp": self.start_timestamp or 0,
+            "end_timestamp": self.end_timestamp or 0,
+            "n_read": self.n_read,
+            "n_write": self.n_write,
+            "n_delete": self.n_delete,
+            "smallest_obj_size": 0,
+            "largest_obj_size": 0,
+            "most_common_obj_sizes": [],
+            "most_common_obj_size_ratio": [],
+            "highest_freq": [],
+            "most_common_freq": [],
+            "most_common_freq_ratio": [],
+            "skewness": 0.0,
+            "n_tenant": 0,
+            "most_common_tenants": [],
+            "most_common_tenant_ratio": [],
+            "n_ttl": 0,
+            "smallest_ttl": 0,
+            "largest_ttl": 0,
+            "most_common_ttls": [],
+            "most_common_ttl_ratio": [],
+        }
+        if n_obj == 0:
+            return stat
+
+        sizes, counts = _top_values(*size_cnt)
+        stat["smallest_obj_size"] = int(size_cnt[0][0])
+        stat["largest_obj_size"] = int(size_cnt[0][-1])
+        stat["most_common_obj_sizes"] = sizes.tolist()
+        stat["most_common_obj_size_ratio"] = (counts / n_obj).tolist()
+
+        freqs, counts = freq_cnt
+        stat["highest_freq"] = freqs[::-1][:N_MOST_COMMON].tolist()
+        stat["skewness"] = zipf_alpha(freqs, counts)
+        freqs, counts = _top_values(freqs, counts)
+        stat["most_common_freq"] = freqs.tolist()
+        stat["most_common_freq_ratio"] = (counts / n_obj).tolist()
+
+        tenants, counts = _top_values(*self.tenant_cnt)
+        stat["n_tenant"] = len(self.tenant_cnt[0])
+        stat["most_common_tenants"] = tenants.tolist()
+        stat["most_common_tenant_ratio"] = (counts / self.n_req).tolist()
+
+        ttls, counts = _top_values(*self.ttl_cnt)
+        stat["n_ttl"] = len(self.ttl_cnt[0])
+        stat["smallest_ttl"] = int(self.ttl_cnt[0][0])
+        stat["largest_ttl"] = int(self.ttl_cnt[0][-1])
+        stat["most_common_ttls"] = ttls.tolist()
+        stat["most_common_ttl_ratio"] = (counts / self.n_req).tolist()
+
+        return stat
+
+
+class LcsWriter:
+    """write a lcs trace from batches of numpy columns, the header stat is computed
+    incrementally with bounded memory and written when the writer is closed
+
+    usage:
+        with LcsWriter("trace.lcs", version=2) as writer:
+            for chunk in chunks:
+                writer.write(clock_time=ts, obj_id=obj, obj_size=size, op=op, tenant=tenant)
+        # or writer.write(records) with records from lcs_reader.read_lcs
+
+    the columns are the ones in LCS_REQUEST_HEADER[version], missing columns are filled with
+    zero except next_access_vtime which is NEXT_ACCESS_VTIME_UNKNOWN,
+    op uses the op code in libCacheSim (e.g., OP_READ)
+
+    if ofilepath ends with .zst, the records are compressed while they are written,
+    the header is stored in an uncompressed zstd frame at the beginning of the file
+    so that it can be back-patched, with frame_rows > 0, the records are compressed
+    into independent frames of frame_rows requests with a frame index (see compress_seekable),
+    level, n_thread and long_distance (`zstd --long`) are the zstd settings
+    """
+
+    def __init__(
+        self,
+        ofilepath,
+        version=2,
+        max_mem_rows=DEFAULT_MAX_MEM_ROWS,
+        n_partition=DEFAULT_N_PARTITION,
+        tmp_dir=None,
+        level=16,
+        frame_rows=0,
+        n_thread=16,
+        long_distance=False,
+    ):
+        if version not in range(1, len(LCS_RAW_DTYPE)):
+            raise ValueError(f"unknown lcs version {version}")
+
+        self.ofilepath = ofilepath
+        self.version = version
+        self.raw_dtype = LCS_RAW_DTYPE[version]
+        self.columns = LCS_REQUEST_HEADER[version]
+        self.stat = None
+        self._warned_overflow = False
+        self._trace_stat = _TraceStat(
+            max_mem_rows,
+            n_partition,
+            tmp_dir if tmp_dir else os.path.dirname(os.path.abspath(ofilepath)),
+        )
+
+        self.ofile = open(ofilepath, "wb")
+        # the header is back-patched when the writer is closed
+        if not ofilepath.endswith(".zst"):
+            self.header_offset = 0
+            self.ofile.write(bytes(LCS_HEADER_SIZE))
+            self._write_raw = lambda raw: self.ofile.write(raw.tobytes())
+            return
+
+        self.header_offset = _RAW_FRAME_HEADER_SIZE
+        self.ofile.write(_raw_zstd_frame(bytes(LCS_HEADER_SIZE)))
+        self._cctx = _zstd_compressor(level, n_thread, long_distance)
+        self.frame_rows = frame_rows
+        if frame_rows > 0:
+            self.frame_index = []
+            self._frame_buf, self._n_frame_buf_rows = [], 0
+            self._write_raw = self._write_frames
+        else:
+            self._zstd_writer = self._cctx.stream_writer(self.ofile, closefd=False)
+            self._write_raw = lambda raw: self._zstd_writer.write(raw.tobytes())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.ofile.close()
+
+    @property
+    def n_req(self):
+        return self._trace_stat.n_req
+
+    def _pack(self, records=None, **columns):
+        if records is not None:
+            if columns:
+                raise ValueError("records and columns cannot be used together")
+            columns = {name: records[name] for name in records.dtype.names}
+
+        raw = pack_records(self.version, **columns)
+        n_req = len(raw)
+
+        if self.version <= 2 and not self._warned_overflow and n_req > 0:
+            if (
+                np.max(columns["clock_time"]) > UINT32_MAX
+                or np.max(columns["obj_size"]) > UINT32_MAX
+            ):
+                print(
+                    "clock_time or obj_size > UINT32_MAX, may cause overflow, consider using lcs_v3"
+                )
+                self._warned_overflow = True
+
+        return raw
+
+    def _compress_frame(self, raw):
+        frame = self._cctx.compress(raw.tobytes())
+        self.frame_index.append(
+            (
+                self.ofile.tell(),
+                len(frame),
+                self.n_req - self._n_frame_buf_rows,
+                len(raw),
+                raw["clock_time"][0],
+                raw["clock_time"][-1],
+            )
+        )
+        self.ofile.write(frame)
+        self._n_frame_buf_rows -= len(raw)
+
+    def _write_frames(self, raw):
+        self._frame_buf.append(raw)
+        self._n_frame_buf_rows += len(raw)
+        if self._n_frame_buf_rows < self.frame_rows:
+            return
+
+        raw = np.concatenate(self._frame_buf)
+        n_full = len(raw) // self.frame_rows * self.frame_rows
+        for start in range(0, n_full, self.frame_rows):
+            self._compress_frame(raw[start : start + self.frame_rows])
+        self._frame_buf = [raw[n_full:]]
+
+    def write(self, records=None, **columns):
+        """append a batch of requests
+
+        Args:
+            records (np.ndarray, optional): records with dtype LCS_DTYPE[version]
+                or LCS_RAW_DTYPE[version]
+            **columns: the columns (np.ndarray or scalar) of the requests, e.g., obj_id=...
+        """
+
+        raw = self._pack(records, **columns)
+        if len(raw) == 0:
+            return
+
+        if "op_tenant" in raw.dtype.names:
+            op = (raw["op_tenant"] & 0xFF).astype(np.uint8)
+            tenant = raw["op_tenant"] >> np.uint32(8)
+        else:
+            op = np.zeros(len(raw), dtype=np.uint8)
+            tenant = np.zeros(len(raw), dtype=np.uint32)
+        ttl = raw["ttl"] if "ttl" in raw.dtype.names else np.zeros(len(raw), np.int64)
+
+        self._trace_stat.update(
+            raw["clock_time"], raw["obj_id"], raw["obj_size"], op, tenant, ttl
+        )
+        self._write_raw(raw)
+
+    def close(self):
+        """compute the header stat and back-patch the header
+
+        Returns:
+            dict: the trace stat
+        """
+
+        if self.ofile.closed:
+            return self.stat
+
+        if self.header_offset > 0:
+            if self.frame_rows > 0:
+                if self._n_frame_buf_rows > 0:
+                    self._compress_frame(np.concatenate(self._frame_buf))
+                save_frame_index(self.ofilepath, self.frame_index)
+            else:
+                self._zstd_writer.close()
+
+        self.stat = self._trace_stat.finalize()
+        self.ofile.seek(self.header_offset)
+        self.ofile.write(pack_header(self.version, self.stat))
+        self.ofile.close()
+
+        return self.stat
+
+
+def save_frame_index(ofilepath, frame_index):
+    """save the frame index of a seekable lcs trace next to the trace"""
+
+    frame_index = np.asarray(frame_index, dtype=LCS_FRAME_INDEX_DTYPE)
+    with open(ofilepath + LCS_FRAME_INDEX_SUFFIX, "wb") as f:
+        np.save(f, frame_index)
+
+
+def compress_seekable(
+    ifilepath,
+    ofilepath=None,
+    frame_rows=DEFAULT_FRAME_ROWS,
+    level=16,
+    n_thread=16,
+    long_distance=False,
+):
+    """compress a lcs trace into a seekable .zst trace with a frame index
+
+    Args:
+        ifilepath (str): the path of the lcs trace, can be a .zst trace
+        ofilepath (str, optional): the output path, default: ifilepath + ".zst"
+        frame_rows (int, optional): the number of requests in each frame
+        level (int, optional): zstd compression level
+        n_thread (int, optional): the number of zstd worker threads
+        long_distance (bool, optional): long-distance matching within each frame,
+            i.e., `zstd --long`, it only helps when frame_rows is large
+
+    Returns:
+        str: the path of the seekable trace
+    """
+
+    if ofilepath is None:
+        ofilepath = ifilepath + ".zst"
+    assert ofilepath != ifilepath, "cannot compress a trace in place"
+
+    # the frames are independent, a match never crosses a frame
+    cctx = _zstd_compressor(level, n_thread, long_distance)
+
+    reader = open_trace(ifilepath)
+    frame_index = []
+    n_req, n_byte = 0, 0
+    try:
+        header = _read_full(reader, LCS_HEADER_SIZE)
+        version = read_header(io.BytesIO(header), print_stat=False)
+        raw_dtype = LCS_RAW_DTYPE[version]
+
+        with open(ofilepath, "wb") as ofile:
+            offset = ofile.write(cctx.compress(header))
+            for raw in iter_raw_chunks(reader, raw_dtype, frame_rows):
+                frame = cctx.compress(raw.tobytes())
+                frame_index.append(
+                    (
+                        offset,
+                        len(frame),
+                        n_req,
+                        len(raw),
+                        raw["clock_time"][0],
+                        raw["clock_time"][-1],
+                    )
+                )
+                offset += ofile.write(frame)
+                n_req += len(raw)
+                n_byte += raw.nbytes
+    finally:
+        reader.close()
+
+    save_frame_index(ofilepath, frame_index)
+
+    print(
+        f"{ofilepath}: {n_req} requests in {len(frame_index)} frames, "
+        f"compression ratio {(n_byte + LCS_HEADER_SIZE) / offset:.2f}"
+    )
+
+    return ofilepath
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    p = ArgumentParser(description="compress a lcs trace into a seekable .zst trace")
+    p.add_argument("trace", help="trace file path")
+    p.add_argument("-o", "--ofilepath", help="output file path", default=None)
+    p.add_argument(
+        "--frame-rows",
+        type=int,
+        help="number of requests per zstd frame",
+        default=DEFAULT_FRAME_ROWS,
+    )
+    p.add_argument("--level", type=int, help="zstd compression level", default=16)
+    p.add_argument("--n-thread", type=int, help="zstd worker threads", default=16)
+    p.add_argument(
+        "--long", action="store_true", help="zstd long-distance matching", default=False
+    )
+    args = p.parse_args()
+
+    compress_seekable(
+        args.trace,
+        args.ofilepath,
+        args.frame_rows,
+        args.level,
+        args.n_thread,
+        args.long,
+    )
@@ -0,0 +1,59 @@
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from lcs_analyzer import DEFAULT_ANALYZERS, AccessTracker, analyze
+from lcs_writer import LcsWriter
+
+
+def _write_trace(path, obj_id):
+    with LcsWriter(str(path), version=1) as writer:
+        writer.write(
+            clock_time=np.arange(len(obj_id), dtype=np.uint32),
+            obj_id=np.asarray(obj_id, dtype=np.uint64),
+            obj_size=np.full(len(obj_id), 100, dtype=np.uint32),
+        )
+
+
+def test_all_cold_trace(tmp_path):
+    path = tmp_path / "cold.lcs"
+    _write_trace(path, range(10))
+
+    result = analyze(str(path), DEFAULT_ANALYZERS)
+    bucket, cnt = result["reuse"].rtime_distribution()
+    assert bucket.tolist() == [-1] and cnt.tolist() == [10]
+
+
+def test_all_cold_first_chunk(tmp_path):
+    # the first chunk has no reuse, the second chunk reuses the first three objects
+    path = tmp_path / "cold_chunk.lcs"
+    _write_trace(path, list(range(10)) + [0, 1, 2])
+
+    reuse = analyze(str(path), ["reuse"], chunk_rows=10)["reuse"]
+    bucket, cnt = reuse.rtime_distribution()
+    assert bucket.tolist() == [-1, 2] and cnt.tolist() == [10, 3]
+    assert [c.tolist() for c in reuse.window_rtime_cnt] == [[0, 0, 3]]
+
+
+def test_access_tracker_matches_dict():
+    # enough objects to grow the hash table several times, with objects removed in between
+    rng = np.random.default_rng(0)
+    obj_id = rng.integers(0, 20000, 50000).astype(np.uint64)
+    tracker, last_vtime = AccessTracker(), {}
+    for start in range(0, len(obj_id), 4096):
+        chunk = obj_id[start : start + 4096]
+        vtime = np.arange(start, start + len(chunk), dtype=np.int64)
+        _, got, _ = tracker.update(chunk, vtime, vtime)
+
+        expected = []
+        for o, v in zip(chunk.tolist(), vtime.tolist()):
+            expected.append(last_vtime.get(o, -1))
+            last_vtime[o] = v
+        assert got.tolist() == expected
+
+        if start % (4096 * 4) == 0:
+            removed = np.array(sorted(last_vtime)[::3], dtype=np.uint64)
+            got = tracker.remove(removed)
+            assert got.tolist() == [last_vtime.pop(o) for o in removed.tolist()]
+        assert len(tracker) == len(last_vtime)
@@ -18,13 +18,28 @@ import logging
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+ "/../")
 from utils.trace_utils import extract_dataname
 from utils.plot_utils import FIG_DIR, FIG_TYPE
+from utils.plot_data_utils import find_plot_data, load_plot_data
+from lcs_writer import zipf_fit
 
 
 logger = logging.getLogger("popularity")
 
 
-def load_popularity_data(datapath):
-    """load popularity plot data from C++ computation"""
+def load_popularity_run_length(datapath: str) -> Tuple[np.ndarray, np.ndarray]:
+    """load popularity plot data from C++ computation as run lengths,
+    n_obj[i] objects are requested freq[i] times, freq is in descending order
+
+    Args:
+        datapath (str): the path of popularity data file or its npz file
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: freq, n_obj
+    """
+
+    npz_path = find_plot_data(datapath)
+    if npz_path is not None:
+        data, _ = load_plot_data(npz_path, "popularity")
+        return data["freq"], data["n_obj"]
 
     ifile = open(datapath)
     data_line = ifile.readline()
@@ -33,32 +48,63 @@ def load_popularity_data(datapath):
         "the input file might not be popularity freq data file " + "data " + datapath
     )
 
-    sorted_freq = []
-    freq_cnt = Counter()
-    for line in ifile:
-        freq, cnt = [int(i) for i in line.strip("\n").split(":")]
-        for i in range(cnt):
-            sorted_freq.append(freq)
-        freq_cnt[freq] += 1
-
+    # one line per distinct freq, there are much fewer lines than objects
+    freq_cnt = [line.split(":") for line in ifile if line.strip()]
     ifile.close()
 
+    freq_cnt = np.array(freq_cnt, dtype=np.int64).reshape(-1, 2)
+    order = np.argsort(-freq_cnt[:, 0], kind="stable")
+
+    return freq_cnt[order, 0], freq_cnt[order, 1]
+
+
+def rank_frequency(
+    freq: np.ndarray, n_obj: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """the rank-frequency (Zipf) curve of run-length popularity data,
+    the objects with the same freq have consecutive ranks, so each run is a horizontal
+    segment from its first rank to its last rank, the curve is the same as plotting
+    the freq of every object, but it has two points per run instead of one per object
+
+    Args:
+        freq (np.ndarray): the request count, in descending order
+        n_obj (np.ndarray): the number of objects with each freq
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: rank (starting from 1), freq
+    """
+
+    last_rank = np.cumsum(n_obj)
+    first_rank = last_rank - n_obj + 1
+
+    return np.column_stack((first_rank, last_rank)).ravel(), np.repeat(freq, 2)
+
+
+def load_popularity_data(datapath):
+    """load popularity plot data from C++ computation
+
+    this expands one element per object, use load_popularity_run_length for large traces
+
+    Returns:
+        sorted_freq: the freq of each object in descending order
+        freq_cnt: the number of lines of each freq
+    """
+
+    freq, n_obj = load_popularity_run_length(datapath)
+    sorted_freq = np.repeat(freq, n_obj)
+    freq_cnt = Counter(freq.tolist())
+
     return sorted_freq, freq_cnt
 
 
 def plot_popularity_Zipf(datapath, figname_prefix=""):
-    from scipy import stats
-    from scipy.optimize import minimize
-    from scipy.optimize import curve_fit
-
     if not figname_prefix:
         figname_prefix = extract_dataname(datapath)
 
-    sorted_freq, _ = load_popularity_data(datapath)
+    freq, n_obj = load_popularity_run_length(datapath)
+    rank, rank_freq = rank_frequency(freq, n_obj)
 
-    plt.plot(
-        sorted_freq,
-    )
+    plt.plot(rank, rank_freq)
     plt.xlabel("Object rank")
     plt.ylabel("Frequency")
     plt.grid(linestyle="--")
@@ -73,18 +119,16 @@ def plot_popularity_Zipf(datapath, figname_prefix=""):
         "save fig to {}/{}_pop_rank.{}".format(FIG_DIR, figname_prefix, FIG_TYPE)
     )
 
-    x = np.log(np.arange(1, 1 + len(sorted_freq)))
-    y = np.log(np.array(sorted_freq))
-    slope, intercept, r_value, p_value, std_err = stats.linregress(x, y)
+    alpha, r_squared = zipf_fit(freq, n_obj)
 
-    if sorted_freq[0] < 100:
+    if freq[0] < 100:
         s = "{:48} {:12} obj alpha 0, r^2 0 (the most popular object has less than 100 requests)".format(
             figname_prefix,
-            len(sorted_freq),
+            int(np.sum(n_obj)),
         )
     else:
         s = "{:48} {:12} obj alpha {:.4f}, r^2 {:.4f}".format(
-            figname_prefix, len(sorted_freq), -slope, r_value * r_value
+            figname_prefix, int(np.sum(n_obj)), alpha, r_squared
         )
 
     logger.info(s)
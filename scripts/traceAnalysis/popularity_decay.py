@@ -24,6 +24,7 @@ import matplotlib.colors as colors
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+ "/../")
 from utils.trace_utils import extract_dataname
 from utils.plot_utils import FIG_DIR, FIG_TYPE
+from utils.plot_data_utils import find_plot_data, load_plot_data
 
 logger = logging.getLogger("popularity_decay")
 
@@ -41,6 +42,10 @@ def load_popularity_decay_data(datapath: str) -> Tuple[np.ndarray, int]:
 
     import numpy.ma as ma
 
+    npz_path = find_plot_data(datapath)
+    if npz_path is not None:
+        return _load_popularity_decay_npz(npz_path)
+
     ifile = open(datapath)
     _data_line = ifile.readline()
     desc_line = ifile.readline()
@@ -104,6 +109,27 @@ def load_popularity_decay_data(datapath: str) -> Tuple[np.ndarray, int]:
     return data, time_window
 
 
+def _load_popularity_decay_npz(npz_path: str) -> Tuple[np.ndarray, int]:
+    """load popularity decay plot data from the npz file, see load_popularity_decay_data"""
+
+    import numpy.ma as ma
+
+    data, metadata = load_plot_data(npz_path, "popularityDecay")
+    time_window = metadata["time_window"]
+    data = data["n_obj"].astype(np.double)
+    print(
+        "{} trace length {:.2f} days".format(
+            os.path.basename(npz_path), len(data) * time_window / 86400
+        )
+    )
+
+    # the windows before the object is created are masked
+    data = ma.array(data, mask=np.triu(np.ones(data.shape, dtype=bool), 1))
+    data = data / np.diag(data)
+
+    return data.T, time_window
+
+
 # def cal_popularity_decay(mean_req_prob_over_time, time_window):
 
 #     assert time_window == 300, "only support 5 min time window now"
@@ -21,6 +21,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/../")
 from utils.trace_utils import extract_dataname
 from utils.plot_utils import FIG_DIR, FIG_TYPE
 from utils.data_utils import conv_to_cdf
+from utils.plot_data_utils import find_plot_data, load_plot_data
 
 logger = logging.getLogger("reuse")
 
@@ -38,6 +39,10 @@ def _load_reuse_data(
 
     """
 
+    npz_path = find_plot_data(datapath)
+    if npz_path is not None:
+        return _load_reuse_npz(npz_path, ignore_compulsory_miss)
+
     ifile = open(datapath)
     data_line = ifile.readline()
     desc_line = ifile.readline()
@@ -91,6 +96,29 @@ def _load_reuse_data(
     return reuse_rtime_count, reuse_vtime_count
 
 
+def _load_reuse_npz(
+    npz_path: str, ignore_compulsory_miss: bool = True
+) -> Tuple[dict, dict]:
+    """load reuse distribution plot data from the npz file, see _load_reuse_data"""
+
+    data, metadata = load_plot_data(npz_path, "reuse")
+    rtime_bucket, rtime_cnt = data["rtime_bucket"], data["rtime_cnt"]
+    vtime_bucket, vtime_cnt = data["vtime_bucket"], data["vtime_cnt"]
+    if not ignore_compulsory_miss:
+        rtime_mask, vtime_mask = rtime_bucket != -1, vtime_bucket != -1
+        rtime_bucket, rtime_cnt = rtime_bucket[rtime_mask], rtime_cnt[rtime_mask]
+        vtime_bucket, vtime_cnt = vtime_bucket[vtime_mask], vtime_cnt[vtime_mask]
+
+    log_base = metadata["log_base"]
+    rtime = rtime_bucket * metadata["time_granularity"]
+    # the same keys as the text loader, the float power of numpy can differ in the last bit
+    vtime = [log_base**b for b in vtime_bucket.tolist()]
+    reuse_rtime_count = dict(zip(rtime.tolist(), rtime_cnt.tolist()))
+    reuse_vtime_count = dict(zip(vtime, vtime_cnt.tolist()))
+
+    return reuse_rtime_count, reuse_vtime_count
+
+
 def plot_reuse(datapath: str, figname_prefix: str = "") -> None:
     """
     plot reuse time distribution
@@ -24,6 +24,7 @@ import logging
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+ "/../")
 from utils.trace_utils import extract_dataname
 from utils.plot_utils import FIG_DIR, FIG_TYPE
+from utils.plot_data_utils import find_plot_data, load_plot_data, csr_to_dense
 
 logger = logging.getLogger("reuse_heatmap")
 
@@ -39,6 +40,10 @@ def _load_reuse_heatmap_data(datapath: str) -> Tuple[np.ndarray, int, int, float
 
     """
 
+    npz_path = find_plot_data(datapath)
+    if npz_path is not None:
+        return _load_reuse_heatmap_npz(npz_path)
+
     ifile = open(datapath)
     data_line = ifile.readline()
     desc_line = ifile.readline()
@@ -106,6 +111,27 @@ def _load_reuse_heatmap_data(datapath: str) -> Tuple[np.ndarray, int, int, float
     return plot_data, time_granularity, time_window, log_base
 
 
+def _load_reuse_heatmap_npz(npz_path: str) -> Tuple[np.ndarray, int, int, float]:
+    """load reuse heatmap plot data from the npz file, see _load_reuse_heatmap_data"""
+
+    data, metadata = load_plot_data(npz_path, "reuseWindow")
+    cnt, offsets = data["cnt"], data["offsets"]
+    # the windows without reuse are skipped
+    offsets = np.unique(offsets)
+
+    # the cdf of reuse time in each window, it is 1 after the last bucket of the window
+    plot_data = csr_to_dense(cnt, offsets, np.float64)
+    np.cumsum(plot_data, axis=1, out=plot_data)
+    plot_data /= plot_data[:, -1:]
+
+    return (
+        plot_data.T,
+        metadata["time_granularity"],
+        metadata["time_window"],
+        metadata["log_base"],
+    )
+
+
 def plot_reuse_heatmap(datapath: str, figname_prefix: str = "") -> None:
     """
     plot reuse heatmap
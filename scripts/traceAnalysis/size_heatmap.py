@@ -23,6 +23,7 @@ import logging
 sys.path.append(os.path.dirname(os.path.abspath(__file__))+ "/../")
 from utils.trace_utils import extract_dataname
 from utils.plot_utils import FIG_DIR, FIG_TYPE
+from utils.plot_data_utils import find_plot_data, load_plot_data, csr_to_dense
 
 logger = logging.getLogger("size_heatmap")
 
@@ -38,6 +39,10 @@ def _load_size_heatmap_data(datapath) -> Tuple[np.ndarray, int, float, int]:
 
     """
 
+    npz_path = find_plot_data(datapath)
+    if npz_path is not None:
+        return _load_size_heatmap_npz(npz_path)
+
     ifile = open(datapath)
     data_line = ifile.readline()
     desc_line = ifile.readline()
@@ -79,6 +84,21 @@ def _load_size_heatmap_data(datapath) -> Tuple[np.ndarray, int, float, int]:
     return plot_data.T, time_window, log_base, size_base
 
 
+def _load_size_heatmap_npz(npz_path) -> Tuple[np.ndarray, int, float, int]:
+    """load size heatmap plot data from the npz file, see _load_size_heatmap_data"""
+
+    data, metadata = load_plot_data(npz_path, "sizeWindow")
+    plot_data = csr_to_dense(data["cnt"], data["offsets"], np.float64)
+    plot_data /= np.sum(plot_data, axis=1, keepdims=True)
+
+    return (
+        plot_data.T,
+        metadata["time_window"],
+        metadata["log_base"],
+        metadata["size_base"],
+    )
+
+
 def plot_size_heatmap(datapath: str, figname_prefix: str = ""):
     """
     plot size heatmap
@@ -1,12 +1,12 @@
 import os
 import sys
-from collections import defaultdict
 import subprocess
-from math import ceil
+import numpy as np
 
 CURRFILE_PATH = os.path.dirname(os.path.abspath(__file__))
 BASEPATH = os.path.join(CURRFILE_PATH, "..", "..")
 sys.path.append(BASEPATH)
+from utils import BlockSplitter, CsvSpec, iter_csv_chunks, write_block_stat
 
 ######### trace format #########
 # device_id,opcode,offset,length,timestamp
@@ -26,97 +26,123 @@ BLOCK_SIZE = 4096
 # because each volume may access the same LBA, we add MAX_VOL_SIZE to lba to make it unique
 MAX_VOL_SIZE = 100 * 1024 * 1024 * 1024 * 1024 // BLOCK_SIZE  # 100TiB
 
+ALIBABA_CSV_SPEC = CsvSpec(
+    names=["vol_id", "op", "offset", "req_size", "ts"],
+    types={
+        "vol_id": "int64",
+        "op": "str",
+        "offset": "int64",
+        "req_size": "int64",
+        "ts": "int64",
+    },
+    header=False,
+)
 
-def preprocess(ifilepath, ofilepath, stat_path):
+
+def parse_range(ifilepath, splitter, block_size=BLOCK_SIZE, byte_range=None):
+    """parse the requests in byte_range (default: the whole trace) and write their blocks
+    to splitter (BlockSplitter), this is the parse_range of utils.convert_sharded
+
+    Returns:
+        dict: n_original_req, n_read, n_write, n_delete, start_ts and end_ts
+    """
+
+    n_original_req = 0
+    start_ts, end_ts = None, None
+    n_read, n_write, n_delete = 0, 0, 0
+    # MAX_VOL_SIZE in blocks of block_size
+    max_vol_size = MAX_VOL_SIZE * BLOCK_SIZE // block_size
+
+    for chunk in iter_csv_chunks(ifilepath, ALIBABA_CSV_SPEC, byte_range=byte_range):
+        vol_id, op, req_size = chunk["vol_id"], chunk["op"], chunk["req_size"]
+        ts = chunk["ts"] // 1_000_000
+        lba = chunk["offset"]
+        # calculate logical block number
+        lbn = lba // block_size
+        # because different volumes may access the same LBA
+        # we add volume id to lba to make it unique
+        lbn += vol_id * max_vol_size
+
+        is_read, is_write = op == "R", op == "W"
+        if not (is_read | is_write).all():
+            i = np.argmin(is_read | is_write)
+            raise RuntimeError(
+                f"Unknown operation: {op[i]} {req_size[i]} {lba[i]} {ts[i]}"
+            )
+        n_read += int(is_read.sum())
+        n_write += int(is_write.sum())
+
+        if start_ts is None:
+            start_ts = int(ts[0])
+        end_ts = int(ts[-1])
+        n_original_req += len(ts)
+
+        op = np.where(is_read, "read", "write")
+        splitter.write(ts, lbn, req_size, op, vol_id)
+
+    return {
+        "n_original_req": n_original_req,
+        "n_read": n_read,
+        "n_write": n_write,
+        "n_delete": n_delete,
+        "start_ts": start_ts,
+        "end_ts": end_ts,
+    }
+
+
+def preprocess(ifilepath, ofilepath, stat_path, block_size=BLOCK_SIZE, lcs_writer=None):
     """
     preprocess the trace into a csv format with only necessary information
     this step aims to normalize the trace format before converting it to lcs format
+    if lcs_writer is given (the --direct mode), the requests are written to it
+    and ofilepath is not used
+    returns False without preprocessing if stat_path exists (preprocessed before)
 
     """
 
     if os.path.exists(stat_path):
-        return
+        return False
 
-    ifile = open(ifilepath, "r")
-    ofile = open(ofilepath, "w")
-    n_req, n_original_req, n_byte = 0, 0, 0
-    start_ts, end_ts = None, None
-    n_read, n_write, n_delete = 0, 0, 0
-    block_cnt = defaultdict(int)
+    ofile = open(ofilepath, "w") if lcs_writer is None else None
+    splitter = BlockSplitter(ofile, block_size, lcs_writer)
+    stat = parse_range(ifilepath, splitter, block_size)
+    if ofile is not None:
+        ofile.close()
 
-    for line in ifile:
-        parts = line.strip().split(",")
-        if len(parts) != 5:
-            print("unknown line {}".format(line))
-            continue
+    stat.update(
+        n_req=splitter.n_req, n_obj=len(splitter.block_cnt), n_byte=splitter.n_byte
+    )
+    write_block_stat(stat_path, ifilepath, stat, block_size)
+    if ofile is not None:
+        print(f"Preprocessed trace is saved to {ofilepath}")
 
-        vol_id, op, offset, req_size, ts = parts
-
-        ts = int(ts) // 1_000_000
-        lba = int(offset)
-        # calculate logical block number
-        lbn = lba // BLOCK_SIZE
-        # because different volumes may access the same LBA
-        # we add volume id to lba to make it unique
-        lbn += int(vol_id) * MAX_VOL_SIZE
-
-        req_size = int(req_size)
-        if op == "R":
-            op = "read"
-            n_read += 1
-        elif op == "W":
-            op = "write"
-            n_write += 1
-        else:
-            raise RuntimeError(f"Unknown operation: {op} {req_size} {lba} {ts}")
-
-        if not start_ts:
-            start_ts = ts
-        end_ts = ts
-        n_original_req += 1
-
-        # write to file
-        for i in range(int(ceil(req_size / BLOCK_SIZE))):
-            ofile.write(f"{ts},{lbn + i},{BLOCK_SIZE},{op},{vol_id}\n")
-            block_cnt[lbn + i] += 1
-            n_req += 1
-            n_byte += BLOCK_SIZE
-
-    ifile.close()
-    ofile.close()
-
-    with open(stat_path, "w") as f:
-        f.write(ifilepath + "\n")
-        f.write("n_original_req: {}\n".format(n_original_req))
-        f.write("n_req:          {}\n".format(n_req))
-        f.write("n_obj:          {}\n".format(len(block_cnt)))
-        f.write("n_byte:         {}\n".format(n_byte))
-        f.write("n_uniq_byte:    {}\n".format(len(block_cnt) * BLOCK_SIZE))
-        f.write("n_read:         {}\n".format(n_read))
-        f.write("n_write:        {}\n".format(n_write))
-        f.write("n_delete:       {}\n".format(n_delete))
-        f.write("start_ts:       {}\n".format(start_ts))
-        f.write("end_ts:         {}\n".format(end_ts))
-        f.write("duration:       {}\n".format(end_ts - start_ts))
-
-    print(open(stat_path, "r").read().strip("\n"))
-    print(f"Preprocessed trace is saved to {ofilepath}")
+    return True
 
 
 def convert(traceconv_path, ifilepath, ofilepath):
-    csv_params = '"time-col=1,obj-id-col=2,obj-size-col=3,op-col=4,tenant-col=5,obj-id-is-num=1"'
-    
+    csv_params = (
+        '"time-col=1,obj-id-col=2,obj-size-col=3,op-col=4,tenant-col=5,obj-id-is-num=1"'
+    )
+
     p = subprocess.run(
-        f'{traceconv_path} {ifilepath} csv -t {csv_params} -o {ofilepath} --output-format lcs_v2',
+        f"{traceconv_path} {ifilepath} csv -t {csv_params} -o {ofilepath} --output-format lcs_v2",
         shell=True,
     )
-    if p.returncode == 0:
-        print(f"Converted trace is saved to {ofilepath}")
+    if p.returncode != 0:
+        raise RuntimeError(f"traceConv failed with return code {p.returncode}")
+    print(f"Converted trace is saved to {ofilepath}")
 
 
 if __name__ == "__main__":
     from argparse import ArgumentParser
-    from utils import post_process
+    from utils import (
+        add_compression_args,
+        compression_args,
+        convert_sharded,
+        open_lcs_writer,
+        post_process,
+    )
+    from pipeline import BlockPreprocessor, run_pipeline, DEFAULT_CHECKPOINT_BYTES
 
     DEFAULT_TRACECONV_PATH = BASEPATH + "/_build/bin/traceConv"
 
@@ -126,9 +152,47 @@ if __name__ == "__main__":
         "--traceconv-path", help="path to traceConv", default=DEFAULT_TRACECONV_PATH
     )
     p.add_argument("--ofilepath", help="output file path", default=None)
+    p.add_argument(
+        "--seekable-frame-rows",
+        type=int,
+        help="compress into a seekable trace with this many requests per zstd frame",
+        default=0,
+    )
+    p.add_argument(
+        "--block-size", type=int, help="split requests into blocks", default=BLOCK_SIZE
+    )
+    p.add_argument(
+        "--direct",
+        action="store_true",
+        help="write the lcs trace without the pre_lcs csv and traceConv, "
+        "next_access_vtime is not computed",
+        default=False,
+    )
+    p.add_argument(
+        "--n-proc",
+        type=int,
+        help="convert with multiple processes (implies --direct), -1 uses all the cores",
+        default=1,
+    )
+    p.add_argument(
+        "--per-volume",
+        action="store_true",
+        help="also write one lcs trace per volume (implies --direct)",
+        default=False,
+    )
+    p.add_argument(
+        "--checkpoint-bytes",
+        type=int,
+        help="checkpoint the conversion every this many input bytes, "
+        "an interrupted conversion resumes from the last checkpoint",
+        default=DEFAULT_CHECKPOINT_BYTES,
+    )
+    add_compression_args(p)
     args = p.parse_args()
+    compression = compression_args(args)
+    sharded = args.n_proc != 1 or args.per_volume
 
-    if not os.path.exists(args.traceconv_path):
+    if not (args.direct or sharded) and not os.path.exists(args.traceconv_path):
         raise RuntimeError(f"traceConv not found at {args.traceconv_path}")
 
     if args.ofilepath:
@@ -140,11 +204,57 @@ if __name__ == "__main__":
         lcs_path = args.ifilepath + ".lcs"
         stat_path = args.ifilepath + ".stat"
 
+    vol_paths = []
     try:
-        preprocess(args.ifilepath, prelcs_path, stat_path)
-        convert(args.traceconv_path, prelcs_path, ofilepath=lcs_path)
-        post_process(args.ifilepath, prelcs_path, stat_path, lcs_path)
+        if not (sharded or args.direct):
+            run_pipeline(
+                args.ifilepath,
+                prelcs_path,
+                stat_path,
+                lcs_path,
+                BlockPreprocessor(parse_range, args.block_size),
+                lambda: convert(args.traceconv_path, prelcs_path, ofilepath=lcs_path),
+                seekable_frame_rows=args.seekable_frame_rows,
+                checkpoint_bytes=args.checkpoint_bytes,
+                **compression,
+            )
+        elif sharded:
+            prelcs_path = None
+            vol_paths = convert_sharded(
+                args.ifilepath,
+                lcs_path,
+                stat_path,
+                parse_range,
+                args.block_size,
+                args.n_proc,
+                per_volume=args.per_volume,
+                seekable_frame_rows=args.seekable_frame_rows,
+                lcs_compression=compression["lcs_compression"],
+            )
+        else:
+            prelcs_path = None
+            with open_lcs_writer(
+                lcs_path,
+                2,
+                args.seekable_frame_rows,
+                stat_path,
+                lcs_compression=compression["lcs_compression"],
+            ) as lcs_writer:
+                preprocess(args.ifilepath, None, stat_path, args.block_size, lcs_writer)
+            print(f"Converted trace is saved to {lcs_path}.zst")
+
+        if prelcs_path is None:
+            post_process(
+                args.ifilepath,
+                None,
+                stat_path,
+                lcs_path,
+                seekable_frame_rows=args.seekable_frame_rows,
+                extra_lcs_paths=vol_paths,
+                **compression,
+            )
     except Exception as e:
         print(e)
         with open(lcs_path.replace(".lcs", ".fail"), "w") as f:
             f.write(str(e))
+        sys.exit(1)
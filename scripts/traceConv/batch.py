@@ -0,0 +1,416 @@
+"""
+convert all the traces of a dataset in a directory with a pool of converter processes
+
+usage:
+    python3 batch.py /data/msr --format msr --n-job 8
+    python3 batch.py /data/tencent --format tencent --pattern "*.tgz.csv" -- --seekable-frame-rows 65536
+    # keep watching the directory and convert new traces once they are fully copied
+    python3 batch.py /data/alibaba --format alibaba --watch 60
+
+each trace is converted by its converter (e.g., msr.py) in a subprocess, which leaves
+the stat in stat/, the lcs trace in lcs/ and the compressed original trace in finished/ (see utils.post_process),
+a trace that is in finished/ is skipped, the output of each conversion is saved to log/{trace}.log
+
+the concurrency is limited by
+    --n-job: the number of conversions at the same time, by default the number of cores
+        divided by --cpu-per-job (e.g., 4 if the converters run with --n-proc 4)
+    --io-job-per-device: the number of conversions reading from the same device at the same time,
+        parsing a trace is often limited by the disk, so adding more jobs on one disk does not help
+    --n-compress-job: the number of files compressed at the same time by this process,
+        the converters run with --defer-compression and leave the compression of the lcs trace
+        and the original trace to batch.py, so a job starts the next trace while
+        the previous one is being compressed, 0 compresses in the converters instead
+
+each finished conversion is appended to manifest.jsonl in the directory with its status, time,
+throughput and output files, after the trace is compressed
+
+"""
+
+import os
+import sys
+import json
+import time
+import fnmatch
+import glob
+import functools
+import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils import COMPRESS_JOB_SUFFIX, BackgroundCompressor, run_compress_job
+
+CURRFILE_PATH = os.path.dirname(os.path.abspath(__file__))
+
+# the converter script of each trace format
+CONVERTERS = {
+    "msr": "msr.py",
+    "tencent": "tencentBlock.py",
+    "alibaba": "alibabaBlock.py",
+    "cloudphysics": "cloudphysics.py",
+    "metaKV": "metaKV.py",
+}
+
+# the files written next to the traces by the converters
+OUTPUT_SUFFIXES = (
+    ".pre_lcs",
+    ".lcs",
+    ".stat",
+    ".fail",
+    ".ckpt",
+    ".blocks",
+    ".tmp",
+    ".idx",
+    COMPRESS_JOB_SUFFIX,
+)
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def is_finished(data_dir, name):
+    """whether the trace has been converted and moved to finished/"""
+
+    return os.path.exists(os.path.join(data_dir, "finished", name + ".zst"))
+
+
+def has_lcs_output(data_dir, name):
+    """whether the lcs trace of a trace is in lcs/, e.g., lcs/{name}.lcs.zst"""
+
+    lcs_dir = os.path.join(data_dir, "lcs")
+    if not os.path.isdir(lcs_dir):
+        return False
+
+    return any(
+        fnmatch.fnmatch(f, glob.escape(name) + ".lcs*.zst") for f in os.listdir(lcs_dir)
+    )
+
+
+def find_traces(data_dir, pattern="*"):
+    """the traces in data_dir to be converted
+
+    Returns:
+        list: [(name, size)] sorted by size in descending order
+    """
+
+    traces = []
+    for name in os.listdir(data_dir):
+        path = os.path.join(data_dir, name)
+        if not os.path.isfile(path) or not fnmatch.fnmatch(name, pattern):
+            continue
+        if name == MANIFEST_NAME or name.endswith(OUTPUT_SUFFIXES):
+            continue
+        if ".lcs." in name or is_finished(data_dir, name):
+            continue
+        # the compressed copy of a trace left by a failed conversion
+        if name.endswith(".zst") and os.path.exists(path[: -len(".zst")]):
+            continue
+        traces.append((name, os.path.getsize(path)))
+
+    # the large traces first so that the last conversions are short
+    traces.sort(key=lambda x: x[1], reverse=True)
+    return traces
+
+
+def read_stat(stat_path):
+    """parse the "key: value" lines of a stat file"""
+
+    stat = {}
+    if not os.path.exists(stat_path):
+        return stat
+
+    with open(stat_path, "r") as f:
+        for line in f:
+            key, sep, value = line.partition(":")
+            if not sep:
+                continue
+            try:
+                stat[key.strip()] = float(value)
+            except ValueError:
+                pass
+
+    return stat
+
+
+def find_outputs(data_dir, name):
+    """the output files of a converted trace"""
+
+    outputs = []
+    for sub_dir in ("lcs", "stat", "finished"):
+        dir_path = os.path.join(data_dir, sub_dir)
+        if not os.path.isdir(dir_path):
+            continue
+        for f in sorted(os.listdir(dir_path)):
+            if f == name + ".zst" or f.startswith(name + "."):
+                outputs.append(os.path.join(sub_dir, f))
+
+    return outputs
+
+
+class BatchConverter:
+    """convert the traces in a directory with at most n_job conversions at the same time
+    and at most io_job_per_device conversions reading from the same device
+
+    Args:
+        data_dir (str): the directory of the traces
+        trace_format (str): one of CONVERTERS
+        converter_args (list, optional): the extra arguments of the converter
+        pattern (str, optional): glob of the trace names
+        n_job (int, optional): the number of conversions at the same time
+        io_job_per_device (int, optional): the number of conversions per device at the same time
+        n_compress_job (int, optional): the number of files compressed at the same time
+            by this process, 0 leaves the compression to the converters
+        python (str, optional): the python interpreter to run the converter
+    """
+
+    def __init__(
+        self,
+        data_dir,
+        trace_format,
+        converter_args=(),
+        pattern="*",
+        n_job=1,
+        io_job_per_device=2,
+        n_compress_job=2,
+        python=sys.executable,
+    ):
+        if trace_format not in CONVERTERS:
+            raise ValueError(
+                f"unknown trace format {trace_format}, supported: {list(CONVERTERS)}"
+            )
+
+        self.data_dir = data_dir
+        self.converter = os.path.join(CURRFILE_PATH, CONVERTERS[trace_format])
+        self.trace_format = trace_format
+        self.converter_args = list(converter_args)
+        self.pattern = pattern
+        self.n_job = n_job
+        self.io_job_per_device = io_job_per_device
+        self.python = python
+
+        self._compressor = None
+        if n_compress_job > 0:
+            self._compressor = BackgroundCompressor(n_compress_job)
+            if "--defer-compression" not in self.converter_args:
+                self.converter_args.append("--defer-compression")
+
+        self._device_sems = {}
+        self._lock = threading.Lock()
+        # the traces that have been scheduled in this run, a failed trace is not retried
+        self._scheduled = set()
+        self.n_ok, self.n_fail = 0, 0
+
+        os.makedirs(os.path.join(data_dir, "log"), exist_ok=True)
+
+    def _device_sem(self, path):
+        dev = os.stat(path).st_dev
+        with self._lock:
+            if dev not in self._device_sems:
+                self._device_sems[dev] = threading.Semaphore(self.io_job_per_device)
+            return self._device_sems[dev]
+
+    def _write_manifest(self, record):
+        with self._lock:
+            with open(os.path.join(self.data_dir, MANIFEST_NAME), "a") as f:
+                f.write(json.dumps(record) + "\n")
+
+    def convert(self, name):
+        """convert one trace, the result is appended to the manifest once the trace
+        is compressed, the compression runs in the background with n_compress_job
+
+        Returns:
+            Future: the manifest record
+        """
+
+        path = os.path.join(self.data_dir, name)
+        input_bytes = os.path.getsize(path)
+        log_path = os.path.join(self.data_dir, "log", name + ".log")
+        job_path = path + COMPRESS_JOB_SUFFIX
+        fail_path = path + ".fail"
+
+        if self._compressor is not None and os.path.exists(job_path):
+            # converted by an interrupted run, only the compression is left
+            start_time, returncode = time.time(), 0
+        else:
+            # the .fail of an earlier run
+            if os.path.exists(fail_path):
+                os.remove(fail_path)
+            with self._device_sem(path):
+                start_time = time.time()
+                with open(log_path, "w") as log_file:
+                    p = subprocess.run(
+                        [self.python, self.converter, path] + self.converter_args,
+                        stdout=log_file,
+                        stderr=subprocess.STDOUT,
+                    )
+            returncode = p.returncode
+
+        if returncode == 0 and os.path.exists(job_path):
+            done = run_compress_job(job_path, self._compressor)
+        else:
+            done = Future()
+            done.set_result(None)
+
+        record = Future()
+
+        def on_done(future):
+            if future.exception() is not None:
+                print(f"fail to compress {name}: {future.exception()}", flush=True)
+            try:
+                record.set_result(
+                    self._write_record(name, returncode, start_time, input_bytes)
+                )
+            except Exception as e:
+                record.set_exception(e)
+
+        done.add_done_callback(on_done)
+        return record
+
+    def _write_record(self, name, returncode, start_time, input_bytes):
+        elapsed = time.time() - start_time
+        # the converters catch the exceptions and write .fail, so the return code is not enough
+        ok = (
+            returncode == 0
+            and not os.path.exists(os.path.join(self.data_dir, name + ".fail"))
+            and is_finished(self.data_dir, name)
+            and has_lcs_output(self.data_dir, name)
+        )
+        stat = read_stat(os.path.join(self.data_dir, "stat", name + ".lcs.stat"))
+        if not stat:
+            stat = read_stat(os.path.join(self.data_dir, "stat", name + ".stat"))
+        n_req = int(stat.get("n_req", 0))
+
+        record = {
+            "trace": name,
+            "format": self.trace_format,
+            "status": "ok" if ok else "fail",
+            "returncode": returncode,
+            "start_time": start_time,
+            "elapsed_sec": round(elapsed, 3),
+            "input_bytes": input_bytes,
+            "input_mb_per_sec": round(input_bytes / 1e6 / max(elapsed, 1e-6), 3),
+            "n_req": n_req,
+            "req_per_sec": round(n_req / max(elapsed, 1e-6), 3),
+            "outputs": find_outputs(self.data_dir, name) if ok else [],
+            "log": os.path.join("log", name + ".log"),
+        }
+        self._write_manifest(record)
+
+        with self._lock:
+            if ok:
+                self.n_ok += 1
+            else:
+                self.n_fail += 1
+        print(
+            f"{record['status']:4} {name} {elapsed:.1f} sec "
+            f"{record['input_mb_per_sec']:.1f} MB/s {n_req} req",
+            flush=True,
+        )
+
+        return record
+
+    def run(self, watch_interval=0):
+        """convert the unfinished traces, if watch_interval > 0, keep scanning the directory
+        every watch_interval seconds and convert the new traces whose sizes do not change
+        between two scans (i.e., they are not being copied)
+        """
+
+        last_sizes = {}
+        with ThreadPoolExecutor(max_workers=self.n_job) as executor:
+            while True:
+                traces = find_traces(self.data_dir, self.pattern)
+                for name, size in traces:
+                    if name in self._scheduled:
+                        continue
+                    if watch_interval > 0 and last_sizes.get(name) != size:
+                        continue
+                    self._scheduled.add(name)
+                    executor.submit(self._try_convert, name)
+                last_sizes = dict(traces)
+
+                if watch_interval <= 0:
+                    break
+                time.sleep(watch_interval)
+        if self._compressor is not None:
+            # wait for the compressions of the last traces
+            self._compressor.close()
+
+        print(f"{self.n_ok} traces converted, {self.n_fail} failed")
+
+    def _try_convert(self, name):
+        try:
+            record = self.convert(name)
+        except Exception as e:
+            record = Future()
+            record.set_exception(e)
+        record.add_done_callback(functools.partial(self._check_record, name))
+
+    def _check_record(self, name, record):
+        if record.exception() is None:
+            return
+
+        with self._lock:
+            self.n_fail += 1
+        print(f"fail {name} {record.exception()}", flush=True)
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    p = ArgumentParser(
+        description="convert all the traces in a directory, "
+        "the arguments after -- are passed to the converter"
+    )
+    p.add_argument("data_dir", help="the directory of the traces")
+    p.add_argument("--format", choices=list(CONVERTERS), required=True)
+    p.add_argument("--pattern", help="glob of the trace names", default="*")
+    p.add_argument(
+        "--cpu-per-job",
+        type=int,
+        help="the number of cores used by one conversion",
+        default=1,
+    )
+    p.add_argument(
+        "--n-job",
+        type=int,
+        help="the number of conversions at the same time, "
+        "defaults to the number of cores / cpu-per-job",
+        default=None,
+    )
+    p.add_argument(
+        "--io-job-per-device",
+        type=int,
+        help="the number of conversions reading from the same device at the same time",
+        default=2,
+    )
+    p.add_argument(
+        "--n-compress-job",
+        type=int,
+        help="the number of files compressed at the same time in the background, "
+        "0 compresses in the converters",
+        default=2,
+    )
+    p.add_argument(
+        "--watch",
+        type=float,
+        help="keep watching the directory and scan it every this many seconds",
+        default=0,
+    )
+    argv = sys.argv[1:]
+    converter_args = []
+    if "--" in argv:
+        converter_args = argv[argv.index("--") + 1 :]
+        argv = argv[: argv.index("--")]
+    args = p.parse_args(argv)
+
+    if args.n_job is None:
+        args.n_job = max(1, (os.cpu_count() or 1) // args.cpu_per_job)
+
+    batch = BatchConverter(
+        args.data_dir,
+        args.format,
+        converter_args,
+        pattern=args.pattern,
+        n_job=args.n_job,
+        io_job_per_device=args.io_job_per_device,
+        n_compress_job=args.n_compress_job,
+    )
+    batch.run(watch_interval=args.watch)
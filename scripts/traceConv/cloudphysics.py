@@ -1,14 +1,13 @@
 import os
 import sys
-import struct
-from collections import defaultdict
 import subprocess
-from math import ceil
+import numpy as np
 
 
 CURRFILE_PATH = os.path.dirname(os.path.abspath(__file__))
 BASEPATH = os.path.join(CURRFILE_PATH, "..", "..")
 sys.path.append(BASEPATH)
+from utils import BlockSplitter, DEFAULT_CHUNK_ROWS, write_block_stat
 
 ######### trace format #########
 # the trace has sector size 512 bytes
@@ -46,8 +45,41 @@ SECTOR_SIZE = 512
 BLOCK_SIZE = 4096
 
 
-S1 = struct.Struct("<IIIHHQQ")
-S2 = struct.Struct("<HHIIIQQQ")
+# the records of vscsi1 and vscsi2 traces
+VSCSI_DTYPES = {
+    1: np.dtype(
+        [
+            ("sn", "<u4"),
+            ("len", "<u4"),
+            ("nSG", "<u4"),
+            ("cmd", "<u2"),
+            ("ver", "<u2"),
+            ("lbn", "<u8"),
+            ("ts", "<u8"),
+        ]
+    ),
+    2: np.dtype(
+        [
+            ("cmd", "<u2"),
+            ("ver", "<u2"),
+            ("sn", "<u4"),
+            ("len", "<u4"),
+            ("nSG", "<u4"),
+            ("lbn", "<u8"),
+            ("ts", "<u8"),
+            ("rt", "<u8"),
+        ]
+    ),
+}
+
+# the op of each SCSI command, https://www.t10.org/lists/op-num.htm
+# commands >= 255 are looked up as 255, i.e., unknown
+OP_NAMES = np.array(["read", "write"])
+CMD_READ, CMD_WRITE, CMD_IGNORED, CMD_UNKNOWN = 0, 1, 2, 3
+CMD_OP = np.full(256, CMD_UNKNOWN, dtype=np.uint8)
+CMD_OP[[40, 8, 136, 45, 168]] = CMD_READ
+CMD_OP[[42, 63, 138, 142, 154, 156, 170, 174]] = CMD_WRITE
+CMD_OP[0] = CMD_IGNORED
 
 
 def find_version_method1(ifilepath):
@@ -61,22 +93,9 @@ def find_version_method1(ifilepath):
 
 def find_version_method2(ifilepath, n_test=800):
     ver_cnt = [0, 0]
-    with open(ifilepath, "rb") as f:
-        for i in range(n_test):
-            data = f.read(S1.size)
-            if len(data) != S1.size:
-                break
-            sn, size, nSG, cmd, ver, lbn, ts = S1.unpack(data)
-            if ver >> 8 == 1:
-                ver_cnt[0] += 1
-        f.seek(0, 0)
-        for i in range(n_test):
-            data = f.read(S2.size)
-            if len(data) != S2.size:
-                break
-            cmd, ver, sn, size, nSG, lbn, ts, rt = S2.unpack(data)
-            if ver >> 8 == 2:
-                ver_cnt[1] += 1
+    for version in (1, 2):
+        records = np.fromfile(ifilepath, dtype=VSCSI_DTYPES[version], count=n_test)
+        ver_cnt[version - 1] = int(np.sum(records["ver"] >> 8 == version))
 
     if ver_cnt[0] > ver_cnt[1]:
         assert (
@@ -92,104 +111,126 @@ def find_version_method2(ifilepath, n_test=800):
         raise RuntimeError(f"Cannot determine version {ver_cnt} {ifilepath}")
 
 
-def preprocess(ifilepath, ofilepath, stat_path):
-    """
-    preprocess the trace into a csv format with only necessary information
-    this step aims to normalize the trace format before converting it to lcs format
+def find_version(ifilepath):
+    """the vscsi version of the trace, from its name and its records"""
+
+    version = find_version_method1(ifilepath)
+    version2 = find_version_method2(ifilepath)
+    assert version == version2, f"version mismatch {version} {version2}"
+    return version
+
 
+def iter_vscsi_chunks(
+    ifilepath, version, chunk_rows=DEFAULT_CHUNK_ROWS, byte_range=None
+):
+    """read a vscsi trace as structured arrays (VSCSI_DTYPES) of chunk_rows records,
+    byte_range (start, end) limits the records read, both ends are at record boundaries
     """
 
-    if os.path.exists(stat_path):
-        return
+    dtype = VSCSI_DTYPES[version]
+    with open(ifilepath, "rb") as f:
+        n_remain = -1
+        if byte_range is not None:
+            f.seek(byte_range[0])
+            n_remain = (byte_range[1] - byte_range[0]) // dtype.itemsize
+        while n_remain != 0:
+            count = chunk_rows if n_remain < 0 else min(chunk_rows, n_remain)
+            records = np.fromfile(f, dtype=dtype, count=count)
+            if len(records) == 0:
+                break
+            if n_remain > 0:
+                n_remain -= len(records)
+            yield records
 
-    ifile = open(ifilepath, "rb")
-    ofile = open(ofilepath, "w")
-    n_req, n_byte = 0, 0
-    n_original_req, n_control_req = 0, 0
-    start_ts, end_ts = None, None
-    n_read, n_write, n_delete = 0, 0, 0
-    block_cnt = defaultdict(int)
 
-    version = find_version_method1(ifilepath)
-    version2 = find_version_method2(ifilepath)
-    assert version == version2, f"version mismatch {version} {version2}"
+def parse_range(ifilepath, splitter, block_size=BLOCK_SIZE, byte_range=None):
+    """parse the requests in byte_range (default: the whole trace) and write their blocks
+    to splitter (BlockSplitter), this is the parse_range of utils.convert_sharded,
+    byte_range must be at record boundaries
 
-    data = ifile.read(S1.size) if version == 1 else ifile.read(S2.size)
-    while data:
-        if version == 1:
-            sn, req_size, nSG, cmd, ver, trace_lbn, ts = S1.unpack(data)
-        else:
-            cmd, ver, sn, req_size, nSG, trace_lbn, ts, rt = S2.unpack(data)
+    Returns:
+        dict: n_original_req, n_read, n_write, n_delete, start_ts and end_ts
+    """
 
-        data = ifile.read(S1.size) if version == 1 else ifile.read(S2.size)
+    n_original_req, n_control_req = 0, 0
+    start_ts, end_ts = None, None
+    n_read, n_write, n_delete = 0, 0, 0
 
-        if trace_lbn == 0:
-            # control operations
-            n_control_req += 1
+    version = find_version(ifilepath)
+    for records in iter_vscsi_chunks(ifilepath, version, byte_range=byte_range):
+        # control operations
+        control = records["lbn"] == 0
+        n_control_req += int(control.sum())
+        records = records[~control]
+        if len(records) == 0:
             continue
 
-        ts = int(ts) // 1000000
+        ts = records["ts"] // 1000000
         if not start_ts:
-            start_ts = ts
-        end_ts = ts
-        n_original_req += 1
-
-        op = cmd
+            # the first non-zero timestamp
+            nonzero = np.flatnonzero(ts)
+            start_ts = int(ts[nonzero[0]]) if len(nonzero) > 0 else 0
+        end_ts = int(ts[-1])
+        n_original_req += len(records)
 
-        lba = trace_lbn * SECTOR_SIZE
+        lba = records["lbn"].astype(np.int64) * SECTOR_SIZE
         # align lba to block size to BLOCK_SIZE
         # lba = lba - (lba % BLOCK_SIZE)
-        lbn = lba // BLOCK_SIZE
-
-        # https://www.t10.org/lists/op-num.htm
-        if cmd == 40 or cmd == 8 or cmd == 136 or cmd == 45 or cmd == 168:
-            op = "read"
-            n_read += 1
-        elif (
-            cmd == 42
-            or cmd == 63
-            or cmd == 138
-            or cmd == 142
-            or cmd == 154
-            or cmd == 156
-            or cmd == 170
-            or cmd == 174
-        ):
-            op = "write"
-            n_write += 1
-        elif cmd == 0:
-            continue
-        else:
-            raise RuntimeError(f"Unknown operation: {cmd} {req_size} {lbn} {ts}")
-
-        # write to file
-        for i in range(int(ceil(req_size / BLOCK_SIZE))):
-            ofile.write("{},{},{},{}\n".format(ts, lbn + i, BLOCK_SIZE, op))
-
-            block_cnt[lbn + i] += 1
-            n_req += 1
-            n_byte += BLOCK_SIZE
-
-    ifile.close()
-    ofile.close()
-
-    with open(stat_path, "w") as f:
-        f.write(ifilepath + "\n")
-        f.write("n_original_req: {}\n".format(n_original_req))
-        f.write("n_req:          {}\n".format(n_req))
-        f.write("n_obj:          {}\n".format(len(block_cnt)))
-        f.write("n_byte:         {}\n".format(n_byte))
-        f.write("n_uniq_byte:    {}\n".format(len(block_cnt) * BLOCK_SIZE))
-        f.write("n_read:         {}\n".format(n_read))
-        f.write("n_write:        {}\n".format(n_write))
-        f.write("n_delete:       {}\n".format(n_delete))
-        f.write("start_ts:       {}\n".format(start_ts))
-        f.write("end_ts:         {}\n".format(end_ts))
-        f.write("duration:       {}\n".format(end_ts - start_ts))
-
-    print(open(stat_path, "r").read().strip("\n"))
+        lbn = lba // block_size
+
+        cmd = records["cmd"]
+        op = CMD_OP[np.minimum(cmd, 255)]
+        unknown = op == CMD_UNKNOWN
+        if unknown.any():
+            i = np.argmax(unknown)
+            raise RuntimeError(
+                f"Unknown operation: {cmd[i]} {records['len'][i]} {lbn[i]} {ts[i]}"
+            )
+        n_read += int(np.sum(op == CMD_READ))
+        n_write += int(np.sum(op == CMD_WRITE))
+
+        keep = op != CMD_IGNORED
+        splitter.write(ts[keep], lbn[keep], records["len"][keep], (OP_NAMES, op[keep]))
+
     print("n_control_req:        ", n_control_req)
-    print(f"Preprocessed trace is saved to {ofilepath}\n")
+
+    return {
+        "n_original_req": n_original_req,
+        "n_read": n_read,
+        "n_write": n_write,
+        "n_delete": n_delete,
+        "start_ts": start_ts,
+        "end_ts": end_ts,
+    }
+
+
+def preprocess(ifilepath, ofilepath, stat_path, block_size=BLOCK_SIZE, lcs_writer=None):
+    """
+    preprocess the trace into a csv format with only necessary information
+    this step aims to normalize the trace format before converting it to lcs format
+    if lcs_writer is given (the --direct mode), the requests are written to it
+    and ofilepath is not used
+    returns False without preprocessing if stat_path exists (preprocessed before)
+
+    """
+
+    if os.path.exists(stat_path):
+        return False
+
+    ofile = open(ofilepath, "w") if lcs_writer is None else None
+    splitter = BlockSplitter(ofile, block_size, lcs_writer)
+    stat = parse_range(ifilepath, splitter, block_size)
+    if ofile is not None:
+        ofile.close()
+
+    stat.update(
+        n_req=splitter.n_req, n_obj=len(splitter.block_cnt), n_byte=splitter.n_byte
+    )
+    write_block_stat(stat_path, ifilepath, stat, block_size)
+    if ofile is not None:
+        print(f"Preprocessed trace is saved to {ofilepath}\n")
+
+    return True
 
 
 def convert(traceConv_path, ifilepath, ofilepath):
@@ -199,13 +240,20 @@ def convert(traceConv_path, ifilepath, ofilepath):
         f"{traceConv_path} {ifilepath} csv -t {csv_params} -o {ofilepath} --output-format lcs_v2",
         shell=True,
     )
-    if p.returncode == 0:
-        print(f"Converted trace is saved to {ofilepath}")
+    if p.returncode != 0:
+        raise RuntimeError(f"traceConv failed with return code {p.returncode}")
+    print(f"Converted trace is saved to {ofilepath}")
 
 
 if __name__ == "__main__":
     from argparse import ArgumentParser
-    from utils import post_process
+    from utils import (
+        add_compression_args,
+        compression_args,
+        open_lcs_writer,
+        post_process,
+    )
+    from pipeline import BlockPreprocessor, run_pipeline, DEFAULT_CHECKPOINT_BYTES
 
     DEFAULT_TRACECONV_PATH = BASEPATH + "/_build/bin/traceConv"
 
@@ -215,9 +263,34 @@ if __name__ == "__main__":
         "--traceconv-path", help="path to traceConv", default=DEFAULT_TRACECONV_PATH
     )
     p.add_argument("--ofilepath", help="output file path", default=None)
+    p.add_argument(
+        "--seekable-frame-rows",
+        type=int,
+        help="compress into a seekable trace with this many requests per zstd frame",
+        default=0,
+    )
+    p.add_argument(
+        "--block-size", type=int, help="split requests into blocks", default=BLOCK_SIZE
+    )
+    p.add_argument(
+        "--direct",
+        action="store_true",
+        help="write the lcs trace without the pre_lcs csv and traceConv, "
+        "next_access_vtime is not computed",
+        default=False,
+    )
+    p.add_argument(
+        "--checkpoint-bytes",
+        type=int,
+        help="checkpoint the conversion every this many input bytes, "
+        "an interrupted conversion resumes from the last checkpoint",
+        default=DEFAULT_CHECKPOINT_BYTES,
+    )
+    add_compression_args(p)
     args = p.parse_args()
+    compression = compression_args(args)
 
-    if not os.path.exists(args.traceconv_path):
+    if not args.direct and not os.path.exists(args.traceconv_path):
         raise RuntimeError(f"traceConv not found at {args.traceconv_path}")
 
     if args.ofilepath:
@@ -230,10 +303,39 @@ if __name__ == "__main__":
         stat_path = args.ifilepath + ".stat"
 
     try:
-        preprocess(args.ifilepath, prelcs_path, stat_path)
-        convert(args.traceconv_path, prelcs_path, ofilepath=lcs_path)
-        post_process(args.ifilepath, prelcs_path, stat_path, lcs_path)
+        if not args.direct:
+            record_size = VSCSI_DTYPES[find_version(args.ifilepath)].itemsize
+            run_pipeline(
+                args.ifilepath,
+                prelcs_path,
+                stat_path,
+                lcs_path,
+                BlockPreprocessor(parse_range, args.block_size, record_size),
+                lambda: convert(args.traceconv_path, prelcs_path, ofilepath=lcs_path),
+                seekable_frame_rows=args.seekable_frame_rows,
+                checkpoint_bytes=args.checkpoint_bytes,
+                **compression,
+            )
+        else:
+            with open_lcs_writer(
+                lcs_path,
+                2,
+                args.seekable_frame_rows,
+                stat_path,
+                lcs_compression=compression["lcs_compression"],
+            ) as lcs_writer:
+                preprocess(args.ifilepath, None, stat_path, args.block_size, lcs_writer)
+            print(f"Converted trace is saved to {lcs_path}.zst")
+            post_process(
+                args.ifilepath,
+                None,
+                stat_path,
+                lcs_path,
+                seekable_frame_rows=args.seekable_frame_rows,
+                **compression,
+            )
     except Exception as e:
         print(e)
         with open(lcs_path.replace(".lcs", ".fail"), "w") as f:
             f.write(str(e))
+        sys.exit(1)
@@ -9,20 +9,39 @@ import sys
 from collections import defaultdict
 import subprocess
 import time
-import json
-from collections import namedtuple
-
-# set random seed for hash
-os.environ["PYTHONHASHSEED"] = "0"
-
-# define a namedtuple to store object information
-ObjInfo = namedtuple(
-    "ObjInfo", ["freq", "size", "ttl", "n_read", "n_write", "n_delete"]
+import shutil
+import tempfile
+import numpy as np
+
+# the object table, one row per object sorted by key
+OBJ_INFO_DTYPE = np.dtype(
+    [
+        ("key", "<u8"),
+        ("freq", "<i8"),
+        ("size", "<i8"),
+        ("ttl", "<i8"),
+        ("n_read", "<i8"),
+        ("n_write", "<i8"),
+        ("n_delete", "<i8"),
+    ]
 )
+# the number of buffered object rows before spilling them to disk
+DEFAULT_MAX_MEM_ROWS = 64 * 1024 * 1024
+N_PARTITION = 64
 
 CURRFILE_PATH = os.path.dirname(os.path.abspath(__file__))
 BASEPATH = os.path.join(CURRFILE_PATH, "..", "..")
 sys.path.append(BASEPATH)
+sys.path.append(os.path.join(CURRFILE_PATH, ".."))
+# the same spatial sampling as lcs_sample.py
+from lcs_reader import obj_sample_mask
+from utils import (
+    CsvSpec,
+    iter_csv_chunks,
+    next_line_start,
+    op_codes,
+    write_csv_columns,
+)
 
 ############ trace format ###########
 # 202206
@@ -69,298 +88,542 @@ def detect_release_time(ifilepath):
         return None
 
 
-def parse_line(line, release_time):
-    ttl, usecase = "0", "0"
-    ts, sub_usecase = "0", "0"
+METAKV_CSV_SPECS = {
+    "202206": CsvSpec(
+        names=["key", "op", "size", "op_count", "key_size"],
+        types={
+            "key": "uint64",
+            "op": "str",
+            "size": "int64",
+            "op_count": "int64",
+            "key_size": "int64",
+        },
+    ),
+    "202210": CsvSpec(
+        names=[
+            "op_time",
+            "key",
+            "key_size",
+            "op",
+            "op_count",
+            "size",
+            "cache_hits",
+            "ttl",
+        ],
+        types={
+            "op_time": "int64",
+            "key": "uint64",
+            "key_size": "int64",
+            "op": "str",
+            "op_count": "int64",
+            "size": "int64",
+            "ttl": "int64",
+        },
+    ),
+    "202312": CsvSpec(
+        names=["key", "op", "size", "op_count", "key_size", "ttl"],
+        types={
+            "key": "uint64",
+            "op": "str",
+            "size": "int64",
+            "op_count": "int64",
+            "key_size": "int64",
+            "ttl": "int64",
+        },
+    ),
+    # the key is a hex string
+    "202401": CsvSpec(
+        names=[
+            "op_time",
+            "key",
+            "key_size",
+            "op",
+            "op_count",
+            "size",
+            "cache_hits",
+            "ttl",
+            "usecase",
+            "sub_usecase",
+        ],
+        types={
+            "op_time": "int64",
+            "key": "hex",
+            "key_size": "int64",
+            "op": "str",
+            "op_count": "int64",
+            "size": "int64",
+            "ttl": "int64",
+            "usecase": "int64",
+            "sub_usecase": "int64",
+        },
+    ),
+}
 
-    parts = line.strip().split(",")
-    if release_time == "202206":
-        if len(parts) != 5:
-            print("unknown line {}".format(line))
-            return None
-
-        # key,op,size,op_count,key_size
-        key, op, req_size, op_count, key_size = parts
-        key = int(key)
-
-    elif release_time == "202210":
-        if len(parts) != 8:
-            print("unknown line {}".format(line))
-            return None
-
-        ts, key, key_size, op, op_count, req_size, _cache_hits, ttl = parts
-        key = int(key)
-
-    elif release_time == "202312":
-        if len(parts) != 6:
-            print("unknown line {}".format(line))
-            return None
-        # key,op,size,op_count,key_size,ttl
-        key, op, req_size, op_count, key_size, ttl = parts
-        key = int(key)
-
-    elif release_time == "202401":
-
-        if len(parts) != 10:
-            print("unknown line {}".format(line))
-            return None
-
-        (
-            ts,
-            key,
-            key_size,
-            op,
-            op_count,
-            req_size,
-            _cache_hits,
-            ttl,
-            usecase,
-            sub_usecase,
-        ) = parts
-
-        key = int(key, 16)
-    else:
+
+REQUEST_FIELDS = [
+    "ts",
+    "key",
+    "size",
+    "key_size",
+    "op",
+    "op_count",
+    "ttl",
+    "usecase",
+    "sub_usecase",
+]
+
+
+def iter_request_chunks(ifilepath, release_time, byte_range=None):
+    """parse the trace (or the lines in byte_range) in chunks of numpy columns,
+    the names are REQUEST_FIELDS, the key is an uint64
+    and the fields that the release does not have are 0
+    """
+
+    if release_time not in METAKV_CSV_SPECS:
         raise RuntimeError("Unknown release time: {}".format(release_time))
 
-    return (
-        int(ts),
-        int(key),
-        int(req_size),
-        int(key_size),
-        op,
-        int(op_count),
-        int(ttl),
-        int(usecase),
-        int(sub_usecase),
-    )
+    for chunk in iter_csv_chunks(
+        ifilepath, METAKV_CSV_SPECS[release_time], byte_range=byte_range
+    ):
+        n = len(chunk["key"])
+        chunk["ts"] = chunk.pop("op_time", None)
+
+        yield {
+            name: chunk[name] if chunk.get(name) is not None else np.zeros(n, np.int64)
+            for name in REQUEST_FIELDS
+        }
+
 
+def _reduce_obj_info(rows):
+    """merge the rows of the same key (in trace order) into one row per key sorted by key,
+    the counts are summed, size is the first non-zero size, ttl is the last non-zero ttl
+    """
+
+    rows = rows[np.argsort(rows["key"], kind="stable")]
+    is_first = np.empty(len(rows), dtype=bool)
+    is_first[:1] = True
+    np.not_equal(rows["key"][1:], rows["key"][:-1], out=is_first[1:])
+    first_idx = np.flatnonzero(is_first)
+    group = np.cumsum(is_first) - 1
+
+    table = np.zeros(len(first_idx), dtype=OBJ_INFO_DTYPE)
+    table["key"] = rows["key"][first_idx]
+    if len(rows) == 0:
+        return table
+
+    for name in ("freq", "n_read", "n_write", "n_delete"):
+        table[name] = np.add.reduceat(rows[name], first_idx)
+
+    idx = np.flatnonzero(rows["size"] != 0)
+    first = idx[np.r_[True, group[idx][1:] != group[idx][:-1]]] if len(idx) else idx
+    table["size"][group[first]] = rows["size"][first]
+
+    idx = np.flatnonzero(rows["ttl"] != 0)
+    last = idx[np.r_[group[idx][1:] != group[idx][:-1], True]] if len(idx) else idx
+    table["ttl"][group[last]] = rows["ttl"][last]
+
+    return table
 
-def find_obj_info(ifilepath, release_time, sample_ratio=1.0):
+
+def _obj_info_of_chunk(chunk):
+    rows = np.zeros(len(chunk["key"]), dtype=OBJ_INFO_DTYPE)
+    rows["key"] = chunk["key"]
+    rows["freq"] = 1
+    rows["size"] = chunk["size"]
+    rows["ttl"] = chunk["ttl"]
+
+    op = chunk["op"]
+    rows["n_read"] = (op == "GET") | (op == "GET_LEASE")
+    rows["n_write"] = (op == "SET") | (op == "SET_LEASE")
+    rows["n_delete"] = op == "DELETE"
+    known = (rows["n_read"] | rows["n_write"] | rows["n_delete"]) > 0
+    for unknown_op in np.unique(op[~known]):
+        print("Unknown operation: {}".format(unknown_op))
+
+    return _reduce_obj_info(rows)
+
+
+def _spill_obj_info(table, bounds, spill_dir):
+    """append the rows to the partition files,
+    partition i has the keys in [bounds[i - 1], bounds[i])
+    """
+
+    partition = np.searchsorted(bounds, table["key"], side="right")
+    for i in np.unique(partition):
+        with open(os.path.join(spill_dir, f"part{i}"), "ab") as f:
+            f.write(table[partition == i].tobytes())
+
+
+def lookup_obj_info(obj_table, keys):
+    """the rows of obj_table (see find_obj_info) of the keys, every key must be in the table"""
+
+    return obj_table[np.searchsorted(obj_table["key"], keys)]
+
+
+def find_obj_info(
+    ifilepath,
+    release_time,
+    sample_ratio=1.0,
+    max_mem_rows=DEFAULT_MAX_MEM_ROWS,
+    tmp_dir=None,
+):
     """
     because key-value cache traces only have ttl during SET which can happen after GET
     but we may see GET requests before SET, we need to find the ttl of each object
     Moreover, we do not have size information during cache misses,
     we need to find the size of each object from the first SET request
-    because set may change object size, we simplify the problem by using the last size of the object
+    because set may change object size, we simplify the problem by using the first non-zero size
+
+    the object table is a numpy array (OBJ_INFO_DTYPE) sorted by key, it is computed chunk by chunk,
+    when more than max_mem_rows objects are buffered, they are spilled to N_PARTITION files
+    of key ranges, so the memory usage is bounded by the size of the table,
+    the table is saved to ifilepath.objinfo.npy and memory-mapped when it is reused
 
-    return a dictionary {key: obj_info}
+    return the object table, use lookup_obj_info to find the objects
 
     """
 
     if sample_ratio == 1.0:
-        ofilepath = ifilepath + ".objinfo.json"
+        ofilepath = ifilepath + ".objinfo.npy"
     else:
-        ofilepath = ifilepath + f".sample{sample_ratio}.objinfo.json"
+        ofilepath = ifilepath + f".hsample{sample_ratio}.objinfo.npy"
 
     if os.path.exists(ofilepath):
         print("load computed object info")
-        with open(ofilepath, "r") as f:
-            obj_info_dict = json.loads(f.read())
-            return {int(k): ObjInfo(*v) for k, v in obj_info_dict.items()}
+        return np.load(ofilepath, mmap_mode="r")
     else:
-        print("compute object info dict")
-
-    sample_ratio_inv = int(1.0 / sample_ratio)
-    obj_info_dict = {}
-    ifile = open(ifilepath, "r")
-    for line in ifile:
-        ts, key, req_size, key_size, op, op_count, ttl, usecase, sub_usecase = (
-            parse_line(line, release_time)
+        print("compute object info table")
+
+    if tmp_dir is None:
+        tmp_dir = os.path.dirname(os.path.abspath(ofilepath))
+    buffered, n_buffered = [], 0
+    bounds, spill_dir = None, None
+    for chunk in iter_request_chunks(ifilepath, release_time):
+        if sample_ratio < 1.0:
+            keep = obj_sample_mask(chunk["key"], sample_ratio)
+            chunk = {name: col[keep] for name, col in chunk.items()}
+
+        buffered.append(_obj_info_of_chunk(chunk))
+        n_buffered += len(buffered[-1])
+        if n_buffered > max_mem_rows:
+            table = _reduce_obj_info(np.concatenate(buffered))
+            if spill_dir is None:
+                spill_dir = tempfile.mkdtemp(prefix="objinfo_", dir=tmp_dir)
+                # the partitions have similar numbers of keys as the first spill
+                bounds = np.unique(
+                    table["key"][np.arange(1, N_PARTITION) * len(table) // N_PARTITION]
+                )
+            _spill_obj_info(table, bounds, spill_dir)
+            buffered, n_buffered = [], 0
+
+    # write to a temporary file so that an interrupted run is not reused
+    tmp_path = ofilepath + ".tmp"
+    if spill_dir is None:
+        table = _reduce_obj_info(
+            np.concatenate(buffered) if buffered else np.zeros(0, OBJ_INFO_DTYPE)
         )
-        if hash(key) % sample_ratio_inv != 0:
-            continue
-
-        obj_info = obj_info_dict.get(key, ObjInfo(0, req_size, ttl, 0, 0, 0))
-
-        freq = obj_info.freq + 1
-        if obj_info.size > 0:
-            req_size = obj_info.size
-
-        assert type(ttl) == int, f"ttl is not int: {ttl}"
-        if ttl == 0:
-            ttl = obj_info.ttl
-
-        if op == "GET" or op == "GET_LEASE":
-            n_read = obj_info.n_read + 1
-            n_write = obj_info.n_write
-            n_delete = obj_info.n_delete
-        elif op == "SET" or op == "SET_LEASE":
-            n_read = obj_info.n_read
-            n_write = obj_info.n_write + 1
-            n_delete = obj_info.n_delete
-        elif op == "DELETE":
-            n_read = obj_info.n_read
-            n_write = obj_info.n_write
-            n_delete = obj_info.n_delete + 1
-        # elif op == "GET_LEASE" or op == "SET_LEASE":
-        #     continue
-        else:
-            print("Unknown operation: {}\n{}".format(op, line))
-
-        obj_info_dict[key] = ObjInfo(freq, req_size, ttl, n_read, n_write, n_delete)
-
-    with open(ofilepath, "w") as f:
-        f.write(json.dumps(obj_info_dict))
-
-    print(f"{time.asctime()} {ifilepath} sample_ratio {sample_ratio} found object info for {len(obj_info_dict)} objects")
-
-    n_has_ttls = sum([1 for v in obj_info_dict.values() if v.ttl > 0])
-    print(f"n_has_ttls: {n_has_ttls / len(obj_info_dict)}")
+        with open(tmp_path, "wb") as f:
+            np.save(f, table)
+    else:
+        if buffered:
+            _spill_obj_info(
+                _reduce_obj_info(np.concatenate(buffered)), bounds, spill_dir
+            )
+        # the key ranges are disjoint and in order, so the reduced partitions are sorted
+        paths = [os.path.join(spill_dir, f"part{i}") for i in range(len(bounds) + 1)]
+        n_obj = 0
+        for path in paths:
+            if os.path.exists(path):
+                table = _reduce_obj_info(np.fromfile(path, dtype=OBJ_INFO_DTYPE))
+                table.tofile(path)
+                n_obj += len(table)
+        table = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=OBJ_INFO_DTYPE, shape=(n_obj,)
+        )
+        pos = 0
+        for path in paths:
+            if os.path.exists(path):
+                part = np.fromfile(path, dtype=OBJ_INFO_DTYPE)
+                table[pos : pos + len(part)] = part
+                pos += len(part)
+        table.flush()
+        del table
+        shutil.rmtree(spill_dir)
+    os.replace(tmp_path, ofilepath)
+    obj_table = np.load(ofilepath, mmap_mode="r")
+
+    print(f"{time.asctime()} {ifilepath} sample_ratio {sample_ratio} found object info for {len(obj_table)} objects")
+
+    n_has_ttls = int(np.count_nonzero(obj_table["ttl"] > 0))
+    print(f"n_has_ttls: {n_has_ttls / len(obj_table)}")
     
-    return obj_info_dict
+    return obj_table
 
 
-def preprocess(ifilepath, release_time, ofilepath, stat_path, sample_ratio=1.0):
-    """
-    preprocess the trace into a csv format with only necessary information
-    this step aims to normalize the trace format before converting it to lcs format
+def _iter_sampled_requests(
+    ifilepath, release_time, obj_table, sample_ratio, byte_range=None
+):
+    """iter_request_chunks of the sampled objects, with obj_size and obj_ttl of obj_table"""
+
+    for chunk in iter_request_chunks(ifilepath, release_time, byte_range):
+        if sample_ratio < 1.0:
+            keep = obj_sample_mask(chunk["key"], sample_ratio)
+            chunk = {name: col[keep] for name, col in chunk.items()}
+        obj_info = lookup_obj_info(obj_table, chunk["key"])
+        chunk["obj_size"] = obj_info["size"]
+        chunk["obj_ttl"] = obj_info["ttl"]
+
+        yield chunk
+
+
+# the op names in the pre_lcs csv, the other ops are written as they are
+OP_NAMES = {
+    "GET": "read",
+    "GET_LEASE": "read",
+    "SET": "write",
+    "SET_LEASE": "write",
+    "DELETE": "delete",
+}
 
-    """
 
-    sample_ratio_inv = int(1.0 / sample_ratio)
+def _map_ids(values, mapping):
+    """map the values to 1, 2, ... in the order they are first seen, mapping is updated"""
 
-    if os.path.exists(stat_path):
-        return
+    uniq, first, inverse = np.unique(values, return_index=True, return_inverse=True)
+    ids = np.empty(len(uniq), dtype=np.int64)
+    for i in np.argsort(first, kind="stable").tolist():
+        ids[i] = mapping.setdefault(uniq[i].item(), len(mapping) + 1)
 
-    ifile = open(ifilepath, "r")
-    ofile = open(ofilepath, "w")
-    n_req, n_original_req, n_byte, n_uniq_byte = 0, 0, 0, 0
-    start_ts, end_ts = None, None
-    n_read, n_write, n_delete = 0, 0, 0
-    n_has_ttls, n_update_ttl = 0, 0
+    return ids[inverse]
 
-    obj_info_dict = find_obj_info(ifilepath, release_time, sample_ratio)
-    seen_obj = set()
 
-    usecase_mapping, subusecase_mapping = {}, {}
+def _top_objects(obj_table, field, n=10):
+    """the n objects with the largest field, e.g., freq"""
 
-    # read header
-    ifile.readline()
+    top = np.argsort(-np.asarray(obj_table[field]), kind="stable")[:n]
+    return [dict(zip(OBJ_INFO_DTYPE.names, row)) for row in obj_table[top].tolist()]
 
-    for line in ifile:
-        ts, key, req_size, key_size, op, op_count, ttl, usecase, sub_usecase = (
-            parse_line(line, release_time)
-        )
-        if hash(key) % sample_ratio_inv != 0:
-            continue
 
-        if release_time == "202206":
-            ts = int(n_original_req // n_req_per_sec_v202206)
-        elif release_time == "202312":
-            ts = int(n_original_req // n_req_per_sec_v202312)
-        elif release_time == "202401":
-            usecase_new = usecase_mapping.get(usecase, len(usecase_mapping) + 1)
-            sub_usecase_new = subusecase_mapping.get(
-                sub_usecase, len(subusecase_mapping) + 1
-            )
-            usecase_mapping[usecase] = usecase_new
-            subusecase_mapping[sub_usecase] = sub_usecase_new
+def _initial_state():
+    """the counters of parse_range and the usecase ids, carried from one byte range
+    to the next, the usecases are in the order of their ids
+    """
 
-        obj_info = obj_info_dict[key]
+    state = {
+        name: 0
+        for name in (
+            "n_req",
+            "n_original_req",
+            "n_byte",
+            "n_read",
+            "n_write",
+            "n_delete",
+            "n_has_ttls",
+            "n_update_ttl",
+        )
+    }
+    state.update(start_ts=None, end_ts=None, usecases=[], sub_usecases=[])
+    return state
+
+
+def parse_range(
+    ifilepath,
+    release_time,
+    obj_table,
+    state,
+    sample_ratio=1.0,
+    ofile=None,
+    lcs_writer=None,
+    byte_range=None,
+):
+    """parse the requests in byte_range (default: the whole trace) and write them
+    to ofile (the pre_lcs csv) or lcs_writer, the byte ranges must be parsed in order
 
-        # always use the same size
-        req_size = obj_info.size
-        # skip size zero requests
-        if req_size == 0:
-            continue
+    Args:
+        obj_table (np.ndarray): see find_obj_info
+        state (dict): the counters and the usecase ids (see _initial_state), updated
+    """
 
-        assert type(ttl) == int, f"ttl is not int: {ttl}"
-        if ttl == 0:
-            ttl = obj_info.ttl
-            n_update_ttl += 1
-        
-        if ttl > 0:
-            n_has_ttls += 1
-        
-        n_req += int(op_count)
-        n_byte += int(req_size) * int(op_count)
-        n_original_req += 1
-
-        if key not in seen_obj:
-            n_uniq_byte += int(req_size)
-        else:
-            seen_obj.add(key)
-
-        ts = int(ts)
-        if not start_ts:
-            start_ts = ts
-        end_ts = ts
-
-        if op == "GET" or op == "GET_LEASE":
-            n_read += 1
-            op = "read"
-        elif op == "SET" or op == "SET_LEASE":
-            n_write += 1
-            op = "write"
-        elif op == "DELETE":
-            n_delete += 1
-            op = "delete"
-        elif op == "GET_LEASE" or op == "SET_LEASE":
+    # the columns of the pre_lcs csv, the same as the columns of lcs_writer
+    lcs_names = ["clock_time", "obj_id", "obj_size", "op", "ttl", "tenant", "feature_0"]
+    if release_time == "202206":
+        lcs_names = lcs_names[:4]
+    elif release_time != "202401":
+        lcs_names = lcs_names[:5]
+
+    usecase_mapping = {u: i + 1 for i, u in enumerate(state["usecases"])}
+    subusecase_mapping = {u: i + 1 for i, u in enumerate(state["sub_usecases"])}
+
+    for chunk in _iter_sampled_requests(
+        ifilepath, release_time, obj_table, sample_ratio, byte_range
+    ):
+        if release_time == "202401":
+            # map before skipping, the same as the order of the requests
+            chunk["usecase"] = _map_ids(chunk["usecase"], usecase_mapping)
+            chunk["sub_usecase"] = _map_ids(chunk["sub_usecase"], subusecase_mapping)
+
+        # always use the same size, skip size zero requests
+        keep = chunk["obj_size"] != 0
+        chunk = {name: col[keep] for name, col in chunk.items()}
+        n = len(chunk["key"])
+        if n == 0:
             continue
-        else:
-            print("Unknown operation: {}\n{}".format(op, line))
 
-        # write to file
+        ts = chunk["ts"]
         if release_time == "202206":
-            for _ in range(int(op_count)):
-                ofile.write("{},{},{},{}\n".format(ts - start_ts, key, req_size, op))
-        elif release_time == "202210":
-            for _ in range(int(op_count)):
-                ofile.write(
-                    "{},{},{},{},{}\n".format(ts - start_ts, key, req_size, op, ttl)
-                )
+            ts = (state["n_original_req"] + np.arange(n)) // n_req_per_sec_v202206
         elif release_time == "202312":
-            for _ in range(int(op_count)):
-                ofile.write(
-                    "{},{},{},{},{}\n".format(ts - start_ts, key, req_size, op, ttl)
-                )
-        elif release_time == "202401":
-            for _ in range(int(op_count)):
-                ofile.write(
-                    "{},{},{},{},{},{},{}\n".format(
-                        ts - start_ts,
-                        key,
-                        req_size,
-                        op,
-                        ttl,
-                        usecase_new,
-                        sub_usecase_new,
-                    )
-                )
+            ts = (state["n_original_req"] + np.arange(n)) // n_req_per_sec_v202312
+        ts = ts.astype(np.int64)
+        if state["start_ts"] is None:
+            state["start_ts"] = int(ts[0])
+        state["end_ts"] = int(ts[-1])
+
+        ttl = chunk["ttl"]
+        no_ttl = ttl == 0
+        ttl = np.where(no_ttl, chunk["obj_ttl"], ttl)
+        state["n_update_ttl"] += int(np.sum(no_ttl))
+        state["n_has_ttls"] += int(np.sum(ttl > 0))
+
+        op_count = chunk["op_count"]
+        req_size = chunk["obj_size"]
+        state["n_req"] += int(np.sum(op_count))
+        state["n_byte"] += int(np.sum(req_size * op_count))
+        state["n_original_req"] += n
+
+        op_values, op_idx = np.unique(chunk["op"], return_inverse=True)
+        op_names = np.array([OP_NAMES.get(op, op) for op in op_values.tolist()])
+        op_cnt = np.bincount(op_idx, minlength=len(op_values))
+        state["n_read"] += int(np.sum(op_cnt[op_names == "read"]))
+        state["n_write"] += int(np.sum(op_cnt[op_names == "write"]))
+        state["n_delete"] += int(np.sum(op_cnt[op_names == "delete"]))
+        for op in op_values[~np.isin(op_values, list(OP_NAMES))].tolist():
+            print("Unknown operation: {}".format(op))
+
+        # one row per op_count
+        columns = {
+            "clock_time": ts - state["start_ts"],
+            "obj_id": chunk["key"],
+            "obj_size": req_size,
+            "op": op_idx,
+            "ttl": ttl,
+            "tenant": chunk["usecase"],
+            "feature_0": chunk["sub_usecase"],
+        }
+        columns = {name: np.repeat(columns[name], op_count) for name in lcs_names}
+
+        if lcs_writer is not None:
+            columns["op"] = op_codes((op_names, columns["op"]))
+            lcs_writer.write(**columns)
         else:
-            raise RuntimeError("Unknown release time: {}".format(release_time))
+            columns["op"] = (op_names, columns["op"])
+            write_csv_columns(ofile, [columns[name] for name in lcs_names])
 
-    ifile.close()
-    ofile.close()
+    state["usecases"] = list(usecase_mapping)
+    state["sub_usecases"] = list(subusecase_mapping)
 
+
+def write_stat(stat_path, ifilepath, state, obj_table):
+    """write the stat of the trace after parse_range, and print the top objects"""
+
+    n_req = state["n_req"]
+    start_ts, end_ts = state["start_ts"], state["end_ts"]
     with open(stat_path, "w") as f:
         f.write(ifilepath + "\n")
-        f.write("n_original_req: {}\n".format(n_original_req))
+        f.write("n_original_req: {}\n".format(state["n_original_req"]))
         f.write("n_req:          {}\n".format(n_req))
-        f.write("n_obj:          {}\n".format(len(obj_info_dict)))
-        f.write("n_byte:         {}\n".format(n_byte))
-        f.write("n_uniq_byte:    {}\n".format(n_uniq_byte))
-        f.write("n_read:         {}\n".format(n_read))
-        f.write("n_write:        {}\n".format(n_write))
-        f.write("n_delete:       {}\n".format(n_delete))
+        f.write("n_obj:          {}\n".format(len(obj_table)))
+        f.write("n_byte:         {}\n".format(state["n_byte"]))
+        # the size of an object is the same in all its requests
+        f.write("n_uniq_byte:    {}\n".format(int(np.sum(obj_table["size"]))))
+        f.write("n_read:         {}\n".format(state["n_read"]))
+        f.write("n_write:        {}\n".format(state["n_write"]))
+        f.write("n_delete:       {}\n".format(state["n_delete"]))
         f.write("start_ts:       {}\n".format(start_ts))
         f.write("end_ts:         {}\n".format(end_ts))
         f.write("duration:       {}\n".format(end_ts - start_ts))
 
     print(open(stat_path, "r").read().strip("\n"))
+    print(f"highest ten freq are {_top_objects(obj_table, 'freq')}")
+    print(f"highest delete times are {_top_objects(obj_table, 'n_delete')}")
+    print(f"highest write times are {_top_objects(obj_table, 'n_write')}")
     print(
-        f"highest ten freq are {sorted(obj_info_dict.values(), key=lambda x: -x.freq)[:10]}"
-    )
-    print(
-        f"highest delete times are {sorted(obj_info_dict.values(), key=lambda x: -x.n_delete)[:10]}"
+        f"n_has_ttls: {state['n_has_ttls'] / n_req:.4f}, "
+        f"n_update_ttl: {state['n_update_ttl'] / n_req:.4f}"
     )
-    print(
-        f"highest write times are {sorted(obj_info_dict.values(), key=lambda x: -x.n_write)[:10]}"
+
+
+def preprocess(
+    ifilepath, release_time, ofilepath, stat_path, sample_ratio=1.0, lcs_writer=None
+):
+    """
+    preprocess the trace into a csv format with only necessary information
+    this step aims to normalize the trace format before converting it to lcs format
+    if lcs_writer is given (the --direct mode), the requests are written to it
+    and ofilepath is not used
+    returns False without preprocessing if stat_path exists (preprocessed before)
+
+    """
+
+    if os.path.exists(stat_path):
+        return False
+
+    obj_table = find_obj_info(ifilepath, release_time, sample_ratio)
+    state = _initial_state()
+    ofile = open(ofilepath, "w") if lcs_writer is None else None
+    parse_range(
+        ifilepath, release_time, obj_table, state, sample_ratio, ofile, lcs_writer
     )
-    print(f"n_has_ttls: {n_has_ttls / n_req:.4f}, n_update_ttl: {n_update_ttl / n_req:.4f}")
-    print(f"Preprocessed trace is saved to {ofilepath}")
+    if ofile is not None:
+        ofile.close()
 
-    return ofilepath
+    write_stat(stat_path, ifilepath, state, obj_table)
+    if ofile is not None:
+        print(f"Preprocessed trace is saved to {ofilepath}")
+
+    return True
+
+
+class Preprocessor:
+    """the preprocessor of pipeline.run_pipeline (see pipeline.BlockPreprocessor),
+    the object table is computed by find_obj_info before the first segment,
+    it is saved next to the trace, so a resumed run loads it
+    """
+
+    def __init__(self, release_time, sample_ratio=1.0):
+        self.release_time = release_time
+        self.sample_ratio = sample_ratio
+        self._obj_table = None
+
+    def _load_obj_table(self, ifilepath):
+        if self._obj_table is None:
+            self._obj_table = find_obj_info(
+                ifilepath, self.release_time, self.sample_ratio
+            )
+        return self._obj_table
+
+    def initial_state(self):
+        return _initial_state()
+
+    def segment_end(self, ifile, pos):
+        return next_line_start(ifile, pos)
+
+    def parse_segment(self, ifilepath, ofile, byte_range, state):
+        obj_table = self._load_obj_table(ifilepath)
+        parse_range(
+            ifilepath,
+            self.release_time,
+            obj_table,
+            state,
+            self.sample_ratio,
+            ofile,
+            byte_range=byte_range,
+        )
+        # n_obj is the size of the object table
+        return None
+
+    def write_stat(self, stat_path, ifilepath, state, n_obj):
+        write_stat(stat_path, ifilepath, state, self._load_obj_table(ifilepath))
 
 
 def convert(
@@ -390,15 +653,22 @@ def convert(
         command,
         shell=True,
     )
-    if p.returncode == 0:
-        print(f"Converted trace is saved to {ofilepath}")
+    if p.returncode != 0:
+        raise RuntimeError(f"traceConv failed with return code {p.returncode}")
+    print(f"Converted trace is saved to {ofilepath}")
 
     return ofilepath
 
 
 if __name__ == "__main__":
     from argparse import ArgumentParser
-    from utils import post_process
+    from utils import (
+        add_compression_args,
+        compression_args,
+        open_lcs_writer,
+        post_process,
+    )
+    from pipeline import run_pipeline, DEFAULT_CHECKPOINT_BYTES
 
     DEFAULT_TRACECONV_PATH = BASEPATH + "/_build/bin/traceConv"
 
@@ -414,12 +684,34 @@ if __name__ == "__main__":
         "--traceconv-path", help="path to traceConv", default=DEFAULT_TRACECONV_PATH
     )
     p.add_argument("--ofilepath", help="output file path", default=None)
+    p.add_argument(
+        "--seekable-frame-rows",
+        type=int,
+        help="compress into a seekable trace with this many requests per zstd frame",
+        default=0,
+    )
     p.add_argument("--sample-ratio", help="sample ratio", type=float, default=1.0)
+    p.add_argument(
+        "--direct",
+        action="store_true",
+        help="write the lcs trace without the pre_lcs csv and traceConv, "
+        "next_access_vtime is not computed",
+        default=False,
+    )
+    p.add_argument(
+        "--checkpoint-bytes",
+        type=int,
+        help="checkpoint the conversion every this many input bytes, "
+        "an interrupted conversion resumes from the last checkpoint",
+        default=DEFAULT_CHECKPOINT_BYTES,
+    )
+    add_compression_args(p)
     args = p.parse_args()
+    compression = compression_args(args)
 
     if args.release_time is None:
         args.release_time = detect_release_time(args.ifilepath)
-    if not os.path.exists(args.traceconv_path):
+    if not args.direct and not os.path.exists(args.traceconv_path):
         raise RuntimeError(f"traceConv not found at {args.traceconv_path}")
 
     if args.ofilepath:
@@ -435,22 +727,52 @@ if __name__ == "__main__":
     stat_path = output_pathbase + ".stat"
 
     # try:
-    preprocess(
-        args.ifilepath,
-        args.release_time,
-        prelcs_path,
-        stat_path,
-        args.sample_ratio,
-    )
-    lcs_path = convert(
-        args.traceconv_path,
-        prelcs_path,
-        ofilepath=lcs_path,
-        ttl_col=settings_dict[args.release_time].get("ttl_col", -1),
-        tenant_col=settings_dict[args.release_time].get("tenant_col", -1),
-        n_feature=settings_dict[args.release_time]["n_feature"],
-    )
-    post_process(args.ifilepath, prelcs_path, stat_path, lcs_path)
+    if not args.direct:
+        run_pipeline(
+            args.ifilepath,
+            prelcs_path,
+            stat_path,
+            lcs_path,
+            Preprocessor(args.release_time, args.sample_ratio),
+            lambda: convert(
+                args.traceconv_path,
+                prelcs_path,
+                ofilepath=lcs_path,
+                ttl_col=settings_dict[args.release_time].get("ttl_col", -1),
+                tenant_col=settings_dict[args.release_time].get("tenant_col", -1),
+                n_feature=settings_dict[args.release_time]["n_feature"],
+            ),
+            seekable_frame_rows=args.seekable_frame_rows,
+            checkpoint_bytes=args.checkpoint_bytes,
+            **compression,
+        )
+    else:
+        # the same output format as convert
+        version = 3 + settings_dict[args.release_time]["n_feature"]
+        with open_lcs_writer(
+            lcs_path,
+            version,
+            args.seekable_frame_rows,
+            stat_path,
+            lcs_compression=compression["lcs_compression"],
+        ) as lcs_writer:
+            preprocess(
+                args.ifilepath,
+                args.release_time,
+                None,
+                stat_path,
+                args.sample_ratio,
+                lcs_writer,
+            )
+        print(f"Converted trace is saved to {lcs_path}.zst")
+        post_process(
+            args.ifilepath,
+            None,
+            stat_path,
+            lcs_path,
+            seekable_frame_rows=args.seekable_frame_rows,
+            **compression,
+        )
     # except Exception as e:
     #     print(e)
     #     with open(args.ifilepath + ".fail", "w") as f:
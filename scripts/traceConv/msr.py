@@ -1,13 +1,19 @@
 import os
 import sys
-from collections import defaultdict
 import subprocess
-import time
-from math import ceil
+from functools import partial
+import numpy as np
 
 CURRFILE_PATH = os.path.dirname(os.path.abspath(__file__))
 BASEPATH = os.path.join(CURRFILE_PATH, "..", "..")
 sys.path.append(BASEPATH)
+from utils import (
+    BlockSplitter,
+    CsvSpec,
+    ReorderBuffer,
+    iter_csv_chunks,
+    write_block_stat,
+)
 
 ######### trace format #########
 # the trace has sector size 512 bytes
@@ -21,75 +27,126 @@ sys.path.append(BASEPATH)
 # this is used to convert requests to multiple 4K blocks
 BLOCK_SIZE = 4096
 
+MSR_CSV_SPEC = CsvSpec(
+    names=["ts", "host", "disk", "op", "offset", "req_size", "rt"],
+    types={"ts": "int64", "op": "str", "offset": "int64", "req_size": "int64"},
+    header=False,
+)
 
-def preprocess(ifilepath, ofilepath, stat_path):
-    """preprocess the trace into a csv format with only necessary information
-    this step aims to normalize the trace format before converting it to lcs format
 
+def _trace_start_ts(ifilepath, reorder_window=0):
+    """the first timestamp of the trace, the origin of the timestamps in the lcs trace,
+    with a reorder window, the smallest timestamp of the first chunk
+    (the first request the ReorderBuffer emits)
     """
-    start_time = time.time()
 
-    if os.path.exists(stat_path):
-        return
+    for chunk in iter_csv_chunks(ifilepath, MSR_CSV_SPEC):
+        ts = chunk["ts"]
+        return int(ts.min()) if reorder_window > 0 else int(ts[0])
+
+    return 0
+
 
-    ifile = open(ifilepath, "r")
-    ofile = open(ofilepath, "w")
-    n_req, n_original_req, n_byte = 0, 0, 0
+def parse_range(
+    ifilepath, splitter, block_size=BLOCK_SIZE, byte_range=None, reorder_window=0
+):
+    """parse the requests in byte_range (default: the whole trace) and write their blocks
+    to splitter (BlockSplitter), this is the parse_range of utils.convert_sharded,
+    if reorder_window (in seconds) is positive, out-of-order requests are sorted
+    by timestamp with a ReorderBuffer of this window, requests are not moved across
+    byte ranges
+
+    Returns:
+        dict: n_original_req, n_read, n_write, n_delete, start_ts and end_ts in seconds
+    """
+
+    n_original_req = 0
     start_ts, end_ts = None, None
     n_read, n_write, n_delete = 0, 0, 0
-    block_cnt = defaultdict(int)
-
-    for line in ifile:
-        parts = line.strip().split(",")
-        if len(parts) != 7:
-            continue
-
-        # Timestamp(0.1us),Hostname,DiskNumber,Type,Offset,Size,ResponseTime
-        ts, host, disk, op, offset, req_size, rt = parts
-        ts = int(ts) / 10000000
-        if not start_ts:
-            start_ts = ts
-        end_ts = ts
-        n_original_req += 1
-
-        lba = int(offset)
-        lbn = lba // BLOCK_SIZE
-        req_size = int(req_size)
-        if op.lower() == "read":
-            n_read += 1
-        elif op.lower() == "write":
-            n_write += 1
-        elif op.lower() == "delete":
-            n_delete += 1
-        else:
-            print("Unknown operation: {}".format(op))
+    # Timestamp is in 0.1us, the requests are written relative to the start of the trace
+    trace_start_ts = _trace_start_ts(ifilepath, reorder_window)
+    reorder = ReorderBuffer(reorder_window * 10000000) if reorder_window > 0 else None
+
+    def _write(ts, lbn, req_size, op):
+        nonlocal start_ts, end_ts
+        if len(ts) == 0:
+            return
+        if start_ts is None:
+            start_ts = int(ts[0]) / 10000000
+        end_ts = int(ts[-1]) / 10000000
+        splitter.write((ts - trace_start_ts) / 10000000, lbn, req_size, op)
+
+    for chunk in iter_csv_chunks(ifilepath, MSR_CSV_SPEC, byte_range=byte_range):
+        ts = chunk["ts"]
+        n_original_req += len(ts)
+
+        op = chunk["op"]
+        op_lower = np.char.lower(op)
+        n_read += int(np.sum(op_lower == "read"))
+        n_write += int(np.sum(op_lower == "write"))
+        n_delete += int(np.sum(op_lower == "delete"))
+        for unknown_op in np.unique(
+            op[~np.isin(op_lower, ["read", "write", "delete"])]
+        ):
+            print("Unknown operation: {}".format(unknown_op))
+
+        lbn = chunk["offset"] // block_size
+        columns = (ts, lbn, chunk["req_size"], op)
+        _write(*(columns if reorder is None else reorder.push(*columns)))
+    if reorder is not None and len(reorder) > 0:
+        _write(*reorder.flush())
+
+    if reorder is not None:
+        print(
+            f"{reorder.n_out_of_order} out-of-order requests, "
+            f"{reorder.n_late} requests later than the reorder window"
+        )
+
+    return {
+        "n_original_req": n_original_req,
+        "n_read": n_read,
+        "n_write": n_write,
+        "n_delete": n_delete,
+        "start_ts": start_ts,
+        "end_ts": end_ts,
+    }
+
+
+def preprocess(
+    ifilepath,
+    ofilepath,
+    stat_path,
+    block_size=BLOCK_SIZE,
+    lcs_writer=None,
+    reorder_window=0,
+):
+    """preprocess the trace into a csv format with only necessary information
+    this step aims to normalize the trace format before converting it to lcs format
+    if lcs_writer is given (the --direct mode), the requests are written to it
+    and ofilepath is not used
+    returns False without preprocessing if stat_path exists (preprocessed before)
+    if reorder_window (in seconds) is positive, out-of-order requests are sorted
+    by timestamp with a ReorderBuffer of this window
 
-        for i in range(int(ceil(req_size / BLOCK_SIZE))):
-            ofile.write("{},{},{},{}\n".format(ts - start_ts, lbn + i, BLOCK_SIZE, op))
+    """
 
-            block_cnt[lbn + i] += 1
-            n_req += 1
-            n_byte += BLOCK_SIZE
+    if os.path.exists(stat_path):
+        return False
 
-    ifile.close()
-    ofile.close()
+    ofile = open(ofilepath, "w") if lcs_writer is None else None
+    splitter = BlockSplitter(ofile, block_size, lcs_writer)
+    stat = parse_range(ifilepath, splitter, block_size, reorder_window=reorder_window)
+    if ofile is not None:
+        ofile.close()
 
-    with open(stat_path, "w") as f:
-        f.write(ifilepath + "\n")
-        f.write("n_original_req: {}\n".format(n_original_req))
-        f.write("n_req:          {}\n".format(n_req))
-        f.write("n_obj:          {}\n".format(len(block_cnt)))
-        f.write("n_byte:         {}\n".format(n_byte))
-        f.write("n_uniq_byte:    {}\n".format(len(block_cnt) * BLOCK_SIZE))
-        f.write("n_read:         {}\n".format(n_read))
-        f.write("n_write:        {}\n".format(n_write))
-        f.write("n_delete:       {}\n".format(n_delete))
-        f.write("start_ts:       {}\n".format(start_ts))
-        f.write("end_ts:         {}\n".format(end_ts))
-        f.write("duration:       {}\n".format(end_ts - start_ts))
+    stat.update(
+        n_req=splitter.n_req, n_obj=len(splitter.block_cnt), n_byte=splitter.n_byte
+    )
+    write_block_stat(stat_path, ifilepath, stat, block_size)
+    if ofile is not None:
+        print(f"Preprocessed trace is saved to {ofilepath}")
 
-    print(open(stat_path, "r").read().strip("\n"))
-    print(f"Preprocessed trace is saved to {ofilepath}")
+    return True
 
 
 def convert(traceconv_path, ifilepath, ofilepath):
@@ -99,13 +156,20 @@ def convert(traceconv_path, ifilepath, ofilepath):
         f"{traceconv_path} {ifilepath} csv -t {csv_params} -o {ofilepath} --output-format lcs_v2",
         shell=True,
     )
-    if p.returncode == 0:
-        print(f"Converted trace is saved to {ofilepath}")
+    if p.returncode != 0:
+        raise RuntimeError(f"traceConv failed with return code {p.returncode}")
+    print(f"Converted trace is saved to {ofilepath}")
 
 
 if __name__ == "__main__":
     from argparse import ArgumentParser
-    from utils import post_process
+    from utils import (
+        add_compression_args,
+        compression_args,
+        open_lcs_writer,
+        post_process,
+    )
+    from pipeline import BlockPreprocessor, run_pipeline, DEFAULT_CHECKPOINT_BYTES
 
     DEFAULT_TRACECONV_PATH = BASEPATH + "/_build/bin/traceConv"
 
@@ -115,9 +179,40 @@ if __name__ == "__main__":
         "--traceconv-path", help="path to traceConv", default=DEFAULT_TRACECONV_PATH
     )
     p.add_argument("--ofilepath", help="output file path", default=None)
+    p.add_argument(
+        "--seekable-frame-rows",
+        type=int,
+        help="compress into a seekable trace with this many requests per zstd frame",
+        default=0,
+    )
+    p.add_argument(
+        "--block-size", type=int, help="split requests into blocks", default=BLOCK_SIZE
+    )
+    p.add_argument(
+        "--direct",
+        action="store_true",
+        help="write the lcs trace without the pre_lcs csv and traceConv, "
+        "next_access_vtime is not computed",
+        default=False,
+    )
+    p.add_argument(
+        "--reorder-window",
+        type=float,
+        help="sort out-of-order requests by timestamp within this many seconds",
+        default=0,
+    )
+    p.add_argument(
+        "--checkpoint-bytes",
+        type=int,
+        help="checkpoint the conversion every this many input bytes, "
+        "an interrupted conversion resumes from the last checkpoint",
+        default=DEFAULT_CHECKPOINT_BYTES,
+    )
+    add_compression_args(p)
     args = p.parse_args()
+    compression = compression_args(args)
 
-    if not os.path.exists(args.traceconv_path):
+    if not args.direct and not os.path.exists(args.traceconv_path):
         raise RuntimeError(f"traceConv not found at {args.traceconv_path}")
 
     if args.ofilepath:
@@ -130,10 +225,48 @@ if __name__ == "__main__":
         stat_path = args.ifilepath + ".stat"
 
     try:
-        preprocess(args.ifilepath, prelcs_path, stat_path)
-        convert(args.traceconv_path, prelcs_path, ofilepath=lcs_path)
-        post_process(args.ifilepath, prelcs_path, stat_path, lcs_path)
+        if not args.direct:
+            run_pipeline(
+                args.ifilepath,
+                prelcs_path,
+                stat_path,
+                lcs_path,
+                BlockPreprocessor(
+                    partial(parse_range, reorder_window=args.reorder_window),
+                    args.block_size,
+                ),
+                lambda: convert(args.traceconv_path, prelcs_path, ofilepath=lcs_path),
+                seekable_frame_rows=args.seekable_frame_rows,
+                checkpoint_bytes=args.checkpoint_bytes,
+                **compression,
+            )
+        else:
+            with open_lcs_writer(
+                lcs_path,
+                2,
+                args.seekable_frame_rows,
+                stat_path,
+                lcs_compression=compression["lcs_compression"],
+            ) as lcs_writer:
+                preprocess(
+                    args.ifilepath,
+                    None,
+                    stat_path,
+                    args.block_size,
+                    lcs_writer,
+                    args.reorder_window,
+                )
+            print(f"Converted trace is saved to {lcs_path}.zst")
+            post_process(
+                args.ifilepath,
+                None,
+                stat_path,
+                lcs_path,
+                seekable_frame_rows=args.seekable_frame_rows,
+                **compression,
+            )
     except Exception as e:
         print(e)
         with open(lcs_path.replace(".lcs", ".fail"), "w") as f:
             f.write(str(e))
+        sys.exit(1)
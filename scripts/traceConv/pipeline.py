@@ -0,0 +1,335 @@
+"""
+a resumable driver of the preprocess -> convert -> post_process flow of the converters
+
+the preprocess step parses the trace in segments of checkpoint_bytes with the preprocessor
+of the converter (see BlockPreprocessor), after each segment, the input offset,
+the size of the pre_lcs output, the state of the preprocessor (e.g., the partial stat)
+and the object ids seen in the segment are saved to lcs_path.ckpt and lcs_path.ckpt.blocks;
+if the conversion is interrupted, running the converter again truncates the pre_lcs output
+to the checkpoint and continues from the input offset,
+the original trace is compressed in the background while traceConv converts the pre_lcs trace,
+the convert and post_process steps are recorded in the checkpoint as well,
+a finished step is not run again, and the checkpoint is removed at the end
+
+a checkpoint is ignored if the size or the modification time of the input changes
+
+"""
+
+import os
+import json
+import numpy as np
+
+from utils import (
+    BackgroundCompressor,
+    BlockSplitter,
+    UniqueCounter,
+    DEFAULT_CHUNK_ROWS,
+    LCS_COMPRESSION,
+    TRACE_COMPRESSION,
+    next_line_start,
+    post_process,
+    write_block_stat,
+)
+
+# the number of input bytes parsed between two checkpoints
+DEFAULT_CHECKPOINT_BYTES = 1024 * 1024 * 1024
+
+_STAT_COUNTERS = ("n_original_req", "n_req", "n_byte", "n_read", "n_write", "n_delete")
+
+STAGES = ("preprocess", "convert", "post_process")
+
+
+class BlockPreprocessor:
+    """the preprocessor of run_pipeline for the block traces, each segment is parsed
+    by the parse_range of the converter (see utils.convert_sharded) into a BlockSplitter
+
+    a preprocessor of run_pipeline has the methods of this class, the state is a json dict
+    saved in the checkpoint after each segment, so a preprocessor must keep everything
+    it carries from one segment to the next in the state
+
+    Args:
+        parse_range (Callable): see utils.convert_sharded
+        block_size (int): the block size
+        record_size (int, optional): the record size of a binary trace,
+            the segments end at record boundaries instead of line boundaries
+    """
+
+    def __init__(self, parse_range, block_size, record_size=None):
+        self.parse_range = parse_range
+        self.block_size = block_size
+        self.record_size = record_size
+
+    def initial_state(self):
+        """the state before the first segment"""
+
+        stat = {name: 0 for name in _STAT_COUNTERS}
+        stat.update(start_ts=None, end_ts=None)
+        return stat
+
+    def segment_end(self, ifile, pos):
+        """the end of the segment that ends at or after pos in the binary file ifile"""
+
+        if self.record_size is None:
+            return next_line_start(ifile, pos)
+        return -(-pos // self.record_size) * self.record_size
+
+    def parse_segment(self, ifilepath, ofile, byte_range, state):
+        """parse the requests in byte_range, write them to ofile (the pre_lcs csv)
+        and update state
+
+        Returns:
+            np.ndarray: the unique object ids of the segment, they are counted as n_obj,
+                None if the preprocessor does not count the objects
+        """
+
+        splitter = BlockSplitter(ofile, self.block_size)
+        segment_stat = self.parse_range(
+            ifilepath, splitter, self.block_size, byte_range
+        )
+        segment_stat.update(n_req=splitter.n_req, n_byte=splitter.n_byte)
+
+        for name in _STAT_COUNTERS:
+            state[name] += segment_stat[name]
+        if segment_stat["start_ts"] is not None:
+            if state["start_ts"] is None:
+                state["start_ts"] = segment_stat["start_ts"]
+            state["end_ts"] = segment_stat["end_ts"]
+
+        return splitter.block_cnt.values()
+
+    def write_stat(self, stat_path, ifilepath, state, n_obj):
+        """write the stat of the trace after the last segment"""
+
+        write_block_stat(
+            stat_path, ifilepath, {**state, "n_obj": n_obj}, self.block_size
+        )
+
+
+class Checkpoint:
+    """the progress of converting one trace, saved as json next to the lcs trace"""
+
+    def __init__(self, ifilepath, lcs_path):
+        self.path = lcs_path + ".ckpt"
+        # the unique object ids of each finished segment, appended as int64
+        self.blocks_path = self.path + ".blocks"
+        if not os.path.exists(ifilepath):
+            # post_process removes the input after compressing it,
+            # an interrupted post_process is resumed without the input
+            self.input_id = None
+            self.state = self._load_post_process(ifilepath)
+            return
+
+        self.input_id = {
+            "ifilepath": os.path.abspath(ifilepath),
+            "input_size": os.path.getsize(ifilepath),
+            "input_mtime": os.path.getmtime(ifilepath),
+        }
+        self.state = self._load()
+
+    def _initial_state(self):
+        return {
+            **self.input_id,
+            "stage": STAGES[0],
+            "in_offset": 0,
+            "out_offset": 0,
+            "n_block_bytes": 0,
+            # the state of the preprocessor, set when preprocessing starts
+            "preprocess_state": None,
+        }
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return self._initial_state()
+
+        with open(self.path, "r") as f:
+            state = json.load(f)
+        if any(state.get(k) != v for k, v in self.input_id.items()):
+            print(f"{self.path} does not match the input, start over")
+            return self._initial_state()
+
+        return state
+
+    def _load_post_process(self, ifilepath):
+        state = None
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                state = json.load(f)
+        if (
+            state is None
+            or state.get("ifilepath") != os.path.abspath(ifilepath)
+            or state.get("stage") != "post_process"
+        ):
+            raise FileNotFoundError(f"{ifilepath} does not exist")
+
+        return state
+
+    def reset(self):
+        self.state = self._initial_state()
+
+    def save(self, **updates):
+        """update the state and save it atomically"""
+
+        self.state.update(updates)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        for path in (self.path, self.blocks_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _load_blocks(blocks_path, n_block_bytes):
+    """the UniqueCounter of the object ids of the finished segments"""
+
+    block_cnt = UniqueCounter()
+    if n_block_bytes > 0:
+        blocks = np.memmap(
+            blocks_path, dtype=np.int64, mode="r", shape=(n_block_bytes // 8,)
+        )
+        for start in range(0, len(blocks), DEFAULT_CHUNK_ROWS):
+            block_cnt.add(np.array(blocks[start : start + DEFAULT_CHUNK_ROWS]))
+        del blocks
+
+    return block_cnt
+
+
+def _can_resume(ckpt, prelcs_path):
+    state = ckpt.state
+    if state["in_offset"] == 0 or state.get("preprocess_state") is None:
+        return False
+
+    # the outputs must have at least the checkpointed bytes
+    return (
+        os.path.exists(prelcs_path)
+        and os.path.getsize(prelcs_path) >= state["out_offset"]
+        and os.path.exists(ckpt.blocks_path)
+        and os.path.getsize(ckpt.blocks_path) >= state["n_block_bytes"]
+    )
+
+
+def _preprocess(
+    ckpt, ifilepath, prelcs_path, stat_path, preprocessor, checkpoint_bytes
+):
+    if _can_resume(ckpt, prelcs_path):
+        print(f"resume preprocessing {ifilepath} from byte {ckpt.state['in_offset']}")
+    else:
+        ckpt.reset()
+        ckpt.state["preprocess_state"] = preprocessor.initial_state()
+    state = ckpt.state
+
+    # drop the output written after the checkpoint
+    with open(prelcs_path, "a") as f:
+        f.truncate(state["out_offset"])
+    with open(ckpt.blocks_path, "ab") as f:
+        f.truncate(state["n_block_bytes"])
+    block_cnt = _load_blocks(ckpt.blocks_path, state["n_block_bytes"])
+
+    preprocess_state = state["preprocess_state"]
+    file_size = os.path.getsize(ifilepath)
+    start = state["in_offset"]
+    with open(ifilepath, "rb") as ifile, open(prelcs_path, "a") as ofile, open(
+        ckpt.blocks_path, "ab"
+    ) as blocks_file:
+        while start < file_size:
+            end = min(
+                preprocessor.segment_end(ifile, start + checkpoint_bytes), file_size
+            )
+            blocks = preprocessor.parse_segment(
+                ifilepath, ofile, (start, end), preprocess_state
+            )
+
+            if blocks is not None:
+                block_cnt.add(blocks)
+                blocks_file.write(blocks.astype(np.int64).tobytes())
+            for f in (ofile, blocks_file):
+                f.flush()
+                os.fsync(f.fileno())
+
+            ckpt.save(
+                in_offset=end,
+                out_offset=ofile.tell(),
+                n_block_bytes=blocks_file.tell(),
+                preprocess_state=preprocess_state,
+            )
+            print(f"preprocessed {end / file_size:.2%} of {ifilepath}")
+            start = end
+
+    preprocessor.write_stat(stat_path, ifilepath, preprocess_state, len(block_cnt))
+    print(f"Preprocessed trace is saved to {prelcs_path}")
+
+
+def run_pipeline(
+    ifilepath,
+    prelcs_path,
+    stat_path,
+    lcs_path,
+    preprocessor,
+    convert,
+    seekable_frame_rows=0,
+    checkpoint_bytes=DEFAULT_CHECKPOINT_BYTES,
+    lcs_compression=LCS_COMPRESSION,
+    trace_compression=TRACE_COMPRESSION,
+    defer_compression=False,
+):
+    """preprocess, convert and post_process a trace, resuming from the checkpoint
+    of an interrupted run
+
+    Args:
+        preprocessor (BlockPreprocessor): parses the trace segment by segment,
+            BlockPreprocessor or an object with the same methods
+        convert (Callable): convert() converts prelcs_path to lcs_path with traceConv,
+            it must raise an exception if the conversion fails
+        seekable_frame_rows (int, optional): see utils.post_process
+        checkpoint_bytes (int, optional): the number of input bytes parsed between checkpoints
+        lcs_compression, trace_compression, defer_compression: see utils.post_process,
+            with defer_compression, the original trace is not compressed during convert()
+    """
+
+    ckpt = Checkpoint(ifilepath, lcs_path)
+    if ckpt.state["stage"] != STAGES[0]:
+        print(f"resume {ifilepath} from {ckpt.state['stage']}")
+
+    if ckpt.state["stage"] == "preprocess":
+        _preprocess(
+            ckpt,
+            ifilepath,
+            prelcs_path,
+            stat_path,
+            preprocessor,
+            checkpoint_bytes,
+        )
+        ckpt.save(stage="convert")
+
+    compressor = None if defer_compression else BackgroundCompressor()
+    try:
+        if ckpt.state["stage"] == "convert":
+            if compressor is not None:
+                # the original trace is not read after preprocess
+                compressor.submit(ifilepath, **trace_compression)
+            convert()
+            ckpt.save(stage="post_process")
+
+        # post_process skips the files it has moved or removed,
+        # so it is run again if it is interrupted
+        done = post_process(
+            ifilepath,
+            prelcs_path,
+            stat_path,
+            lcs_path,
+            seekable_frame_rows=seekable_frame_rows,
+            lcs_compression=lcs_compression,
+            trace_compression=trace_compression,
+            compressor=compressor,
+            defer_compression=defer_compression,
+        )
+    finally:
+        if compressor is not None:
+            compressor.close()
+    if done is not None:
+        done.result()
+    ckpt.remove()
@@ -1,26 +1,1212 @@
+import io
 import os
-import subprocess
+import json
+import math
+import tempfile
 import shutil
 import sys
+import threading
+from collections import namedtuple
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
 
+# the number of original requests parsed before splitting them into blocks
+DEFAULT_CHUNK_ROWS = 1024 * 1024
+# the number of bytes parsed at a time by iter_csv_chunks
+DEFAULT_CSV_BLOCK_SIZE = 64 * 1024 * 1024
+
+# the columns of a csv trace
+#   names: the names of all the columns in the file
+#   types: {name: type} of the columns to read, type is "int64", "uint64", "float64", "str"
+#       or "hex" (a hexadecimal string of at most 16 digits read as uint64)
+#   header: whether the first line is a header, None means detecting it from the first line
+CsvSpec = namedtuple("CsvSpec", ["names", "types", "header"], defaults=[None])
+
+# the op names in the pre_lcs csv and their op codes in libCacheSim,
+# traceConv matches the op name case-insensitively
+LCS_OP_CODES = {"get": 1, "set": 3, "delete": 9, "read": 12, "write": 13}
+
+# the zstd settings of the lcs trace and the original trace in post_process,
+# the same as `zstd -16 --long -T16` and `zstd -8 -T4`
+LCS_COMPRESSION = {"level": 16, "long_distance": True, "n_thread": 16}
+TRACE_COMPRESSION = {"level": 8, "long_distance": False, "n_thread": 4}
+# the window log of `zstd --long`, the largest window zstd decompresses by default
+ZSTD_LONG_WINDOW_LOG = 27
+# the compression left to the caller by post_process(defer_compression=True),
+# saved next to the original trace and run by run_compress_job
+COMPRESS_JOB_SUFFIX = ".compress"
+
+CompressStat = namedtuple(
+    "CompressStat", ["ifilepath", "ofilepath", "in_bytes", "out_bytes", "elapsed"]
+)
+
+
+def _import_pyarrow_csv():
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        raise RuntimeError(
+            "parsing csv traces needs pyarrow, install it with pip install pyarrow"
+        )
+
+    return pa, pa_csv
+
+
+def _has_header(ifilepath, spec):
+    """the first line is a header if a numeric column cannot be parsed as a number"""
+
+    with open(ifilepath, "r") as f:
+        parts = f.readline().strip().split(",")
+    if len(parts) != len(spec.names):
+        return False
+
+    for name, field in zip(spec.names, parts):
+        col_type = spec.types.get(name, "str")
+        if col_type != "str":
+            try:
+                int(field, 16) if col_type == "hex" else float(field)
+            except ValueError:
+                return True
+
+    return False
+
+
+# the value of each hex digit, 255 for the other characters
+_HEX_DIGITS = np.full(256, 255, dtype=np.uint8)
+for _i, _c in enumerate(b"0123456789abcdef"):
+    _HEX_DIGITS[_c] = _i
+for _i, _c in enumerate(b"ABCDEF"):
+    _HEX_DIGITS[_c] = 10 + _i
+
+
+def _hex_to_uint64(column):
+    """decode a pyarrow string array of hex numbers from its buffers, without python strings"""
+
+    n = len(column)
+    if column.null_count > 0:
+        raise ValueError("empty hex values")
+    _, offsets, data = column.buffers()
+    offsets = np.frombuffer(
+        offsets, dtype=np.int32, count=n + 1, offset=column.offset * 4
+    )
+    data = np.frombuffer(data, dtype=np.uint8)[offsets[0] : offsets[-1]]
+    lengths = np.diff(offsets)
+    if n > 0 and (lengths.min() < 1 or lengths.max() > 16):
+        raise ValueError("hex values must have 1 to 16 digits")
+    digits = _HEX_DIGITS[data]
+    if np.any(digits == 255):
+        raise ValueError("invalid hex digits")
+
+    # right-align the digits in 16 columns, then pack each two digits in a byte
+    # and read the 8 bytes of a row as a big-endian uint64
+    if n > 0 and lengths.min() == 16:
+        padded = digits.reshape(n, 16)
+    else:
+        starts = offsets[:-1] - offsets[0]
+        shift = np.repeat(np.arange(1, n + 1) * 16 - lengths - starts, lengths)
+        padded = np.zeros(n * 16, dtype=np.uint8)
+        padded[shift + np.arange(len(data))] = digits
+        padded = padded.reshape(n, 16)
+    packed = (padded[:, 0::2] << 4) | padded[:, 1::2]
+    values = packed.view(">u8").ravel().astype(np.uint64)
+
+    return values
+
+
+def _column_to_numpy(column, col_type):
+    if col_type == "hex":
+        return _hex_to_uint64(column)
+    if col_type != "str":
+        return column.to_numpy()
+
+    # decode each distinct string once, e.g., op has only a few values
+    column = column.dictionary_encode()
+    dictionary = np.array(column.dictionary.to_pylist(), dtype=str)
+    return dictionary[column.indices.to_numpy()]
+
+
+class _ByteRangeFile(io.RawIOBase):
+    """a read-only file object of the bytes [start, end) of a file"""
+
+    def __init__(self, ifilepath, start, end):
+        self._file = open(ifilepath, "rb")
+        self._file.seek(start)
+        self._n_remain = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._file.readinto(memoryview(b)[: min(len(b), self._n_remain)])
+        self._n_remain -= n
+        return n
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def next_line_start(f, pos):
+    """the offset of the first line that starts at or after pos in a binary file f"""
+
+    if pos <= 0:
+        return 0
+    f.seek(pos - 1)
+    f.readline()
+    return f.tell()
+
+
+def split_byte_ranges(ifilepath, n_range):
+    """split a text file into at most n_range byte ranges of similar sizes at line boundaries
+
+    Returns:
+        List[Tuple[int, int]]: the (start, end) of each range
+    """
+
+    file_size = os.path.getsize(ifilepath)
+    bounds = [0]
+    with open(ifilepath, "rb") as f:
+        for i in range(1, n_range):
+            pos = next_line_start(f, max(file_size * i // n_range, bounds[-1]))
+            bounds.append(min(pos, file_size))
+    bounds.append(file_size)
+
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if start < end]
+
+
+def iter_csv_chunks(
+    ifilepath, spec, block_size=DEFAULT_CSV_BLOCK_SIZE, byte_range=None
+):
+    """parse a csv trace in chunks of numpy columns with pyarrow,
+    lines with a wrong number of columns are skipped and counted,
+    a field that cannot be converted to its type raises an error
+
+    Args:
+        ifilepath (str): the path of the csv trace
+        spec (CsvSpec): the columns of the trace
+        block_size (int, optional): the number of bytes parsed at a time
+        byte_range (Tuple[int, int], optional): only parse the lines in [start, end),
+            see split_byte_ranges
+
+    Yields:
+        Dict[str, np.ndarray]: {name: values} of the columns in spec.types
+    """
+
+    pa, pa_csv = _import_pyarrow_csv()
+
+    header = spec.header
+    if header is None:
+        header = _has_header(ifilepath, spec)
+
+    source = ifilepath
+    if byte_range is not None:
+        # only the first range has the header
+        header = header and byte_range[0] == 0
+        source = io.BufferedReader(_ByteRangeFile(ifilepath, *byte_range))
+
+    n_skipped = [0]
+
+    def _skip_invalid_row(row):
+        n_skipped[0] += 1
+        if n_skipped[0] <= 8:
+            print(f"skip line {row.number}: {row.text}")
+        return "skip"
+
+    arrow_types = {
+        "int64": pa.int64(),
+        "uint64": pa.uint64(),
+        "float64": pa.float64(),
+        "str": pa.string(),
+        "hex": pa.string(),
+    }
+    reader = pa_csv.open_csv(
+        source,
+        read_options=pa_csv.ReadOptions(
+            column_names=spec.names,
+            skip_rows=1 if header else 0,
+            block_size=block_size,
+        ),
+        parse_options=pa_csv.ParseOptions(invalid_row_handler=_skip_invalid_row),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: arrow_types[t] for name, t in spec.types.items()},
+            include_columns=list(spec.types),
+        ),
+    )
+    for batch in reader:
+        if batch.num_rows == 0:
+            continue
+        yield {
+            name: _column_to_numpy(batch.column(name), col_type)
+            for name, col_type in spec.types.items()
+        }
+    if byte_range is not None:
+        source.close()
+
+    if n_skipped[0] > 0:
+        print(f"skipped {n_skipped[0]} malformed lines in {ifilepath}")
+
+
+def _sorted_unique(values):
+    """np.unique for integers, sorting is faster than the hash-based np.unique on large arrays"""
+
+    values = np.sort(values)
+    if len(values) == 0:
+        return values
+
+    keep = np.empty(len(values), dtype=bool)
+    keep[0] = True
+    np.not_equal(values[1:], values[:-1], out=keep[1:])
+    return values[keep]
+
+
+class UniqueCounter:
+    """count the number of unique integers (e.g., block ids) with 8 bytes per unique value,
+    values are deduplicated per batch and merged into a sorted array when the buffer grows
+    """
+
+    def __init__(self, min_merge_rows=16 * 1024 * 1024):
+        self.uniq = np.empty(0, dtype=np.int64)
+        self.buffered = []
+        self.n_buffered = 0
+        self.min_merge_rows = min_merge_rows
+
+    def add(self, values):
+        values = _sorted_unique(values)
+        self.buffered.append(values)
+        self.n_buffered += len(values)
+        # merging costs O(len(uniq)), so merge only when the buffer is comparable
+        if self.n_buffered > max(len(self.uniq), self.min_merge_rows):
+            self._merge()
+
+    def _merge(self):
+        if self.buffered:
+            self.uniq = _sorted_unique(np.concatenate([self.uniq] + self.buffered))
+            self.buffered = []
+            self.n_buffered = 0
+
+    def __len__(self):
+        self._merge()
+        return len(self.uniq)
+
+    def values(self):
+        """the sorted unique values"""
+
+        self._merge()
+        return self.uniq
+
+
+def write_csv_columns(ofile, columns):
+    """write numpy columns as csv lines to a text file, with pyarrow if it is installed
+
+    Args:
+        ofile (TextIO): the output
+        columns (List[Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]]): the columns,
+            a string column can be given as (values, codes) where codes index values
+    """
+
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        pa = None
+
+    if pa is None:
+        columns = [
+            col[0][col[1]].tolist() if isinstance(col, tuple) else col.tolist()
+            for col in columns
+        ]
+        line_fmt = ",".join(["%s"] * len(columns)) + "\n"
+        ofile.write("".join([line_fmt % line for line in zip(*columns)]))
+        return
+
+    arrays = []
+    for col in columns:
+        if isinstance(col, tuple):
+            values, codes = col
+            col = pa.DictionaryArray.from_arrays(
+                pa.array(codes.astype(np.int32)), pa.array(values.tolist())
+            ).cast(pa.string())
+        arrays.append(col)
+    table = pa.Table.from_arrays(arrays, names=[str(i) for i in range(len(arrays))])
+
+    buf = io.BytesIO()
+    pa_csv.write_csv(
+        table,
+        buf,
+        write_options=pa_csv.WriteOptions(include_header=False, quoting_style="none"),
+    )
+    ofile.write(buf.getvalue().decode())
+
+
+def op_codes(op):
+    """map op names (np.ndarray of str, or (values, codes) of the names) to libCacheSim op codes,
+    unknown names are mapped to 0 (OP_NOP)
+    """
+
+    values, codes = op if isinstance(op, tuple) else np.unique(op, return_inverse=True)
+    lut = np.array(
+        [LCS_OP_CODES.get(v.lower(), 0) for v in np.asarray(values).tolist()],
+        dtype=np.uint8,
+    )
+    return lut[codes]
+
+
+def _import_lcs_writer():
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    import lcs_writer
+
+    return lcs_writer
+
+
+def open_lcs_writer(
+    lcs_path,
+    version,
+    seekable_frame_rows=0,
+    stat_path=None,
+    lcs_compression=LCS_COMPRESSION,
+):
+    """open a LcsWriter that writes lcs_path.zst, used by the --direct mode of the converters,
+    which writes the lcs trace while parsing the original trace instead of writing
+    a pre_lcs csv and converting it with traceConv
+
+    Args:
+        lcs_path (str): the path of the lcs trace, the writer appends .zst
+        version (int): the lcs version, the same as --output-format of traceConv
+        seekable_frame_rows (int, optional): see post_process
+        stat_path (str, optional): the stat of the conversion, a stat left by an earlier run
+            is removed because the writer truncates the trace it describes,
+            otherwise preprocess would skip the conversion and leave an empty trace
+        lcs_compression (dict, optional): the zstd settings of the writer, see post_process
+    """
+
+    if stat_path is not None and os.path.exists(stat_path):
+        print(f"remove {stat_path} of an earlier run, the trace is converted again")
+        os.remove(stat_path)
+
+    return _import_lcs_writer().LcsWriter(
+        lcs_path + ".zst",
+        version=version,
+        level=lcs_compression["level"],
+        frame_rows=seekable_frame_rows,
+        n_thread=lcs_compression["n_thread"],
+        long_distance=lcs_compression["long_distance"],
+    )
+
+
+class BlockSplitter:
+    """split block IOs into fixed-size blocks and write one csv line per block
+
+    each IO of req_size bytes starting at logical block number lbn becomes
+    ceil(req_size / block_size) requests to blocks lbn, lbn + 1, ..., of block_size bytes,
+    a chunk of IOs is expanded with np.repeat and formatted at once
+
+    if lcs_writer is given, the blocks are written to it instead of ofile,
+    the other columns are named by columns (the same as op-col and tenant-col of traceConv),
+    clock_time is the timestamp truncated to an integer as traceConv does
+
+    usage:
+        splitter = BlockSplitter(ofile, block_size=4096)
+        splitter.write(ts, lbn, req_size, op)    # numpy arrays of a chunk of IOs
+        splitter.n_req, splitter.n_byte, len(splitter.block_cnt)
+    """
+
+    def __init__(self, ofile, block_size, lcs_writer=None, columns=("op", "tenant")):
+        self.ofile = ofile
+        self.block_size = block_size
+        self.lcs_writer = lcs_writer
+        self.columns = columns
+        self.n_req = 0
+        self.n_byte = 0
+        self.block_cnt = UniqueCounter()
+
+    def write(self, ts, lbn, req_size, *columns):
+        """write the blocks of a chunk of IOs
+
+        Args:
+            ts (np.ndarray): the timestamp of each IO
+            lbn (np.ndarray): the first logical block number (in block_size) of each IO
+            req_size (np.ndarray): the size of each IO in bytes
+            *columns (np.ndarray): other columns written after the block size, e.g., op,
+                a string column can be given as (values, codes) where codes index values
+        """
+
+        lbn = np.asarray(lbn, dtype=np.int64)
+        n_block = -(-np.asarray(req_size, dtype=np.int64) // self.block_size)
+        n_block = np.maximum(n_block, 0)
+        n_req = int(n_block.sum())
+        if n_req == 0:
+            return
+
+        # io_idx is the IO of each block, block_idx is the index of the block in the IO
+        io_idx = np.repeat(np.arange(len(lbn)), n_block)
+        first_block = np.cumsum(n_block) - n_block
+        block_idx = np.arange(n_req) - first_block[io_idx]
+        block_id = lbn[io_idx] + block_idx
+
+        out_columns = [
+            np.asarray(ts)[io_idx],
+            block_id,
+            np.full(n_req, self.block_size),
+        ]
+        for col in columns:
+            if isinstance(col, tuple):
+                values, codes = col
+                out_columns.append((np.asarray(values), np.asarray(codes)[io_idx]))
+                continue
+            col = np.asarray(col)
+            if col.dtype.kind == "U":
+                # repeat the codes of the strings instead of the strings
+                values, codes = np.unique(col, return_inverse=True)
+                out_columns.append((values, codes[io_idx]))
+            else:
+                out_columns.append(col[io_idx])
+
+        if self.lcs_writer is None:
+            write_csv_columns(self.ofile, out_columns)
+        else:
+            self.lcs_writer.write(
+                clock_time=out_columns[0].astype(np.int64),
+                obj_id=block_id,
+                obj_size=self.block_size,
+                **{
+                    name: op_codes(col) if name == "op" else col
+                    for name, col in zip(self.columns, out_columns[3:])
+                },
+            )
+
+        self.block_cnt.add(block_id)
+        self.n_req += n_req
+        self.n_byte += n_req * self.block_size
+
+
+class ReorderBuffer:
+    """repair slightly out-of-order timestamps with a bounded time window
+
+    the requests are buffered as arrays and sorted by timestamp (stably, so requests
+    with the same timestamp keep their order), a request is emitted once a request
+    that is window later has been seen, so the buffer only holds a window of requests;
+    a request that arrives after a later request has been emitted (i.e., it is more than
+    window late) is emitted with the timestamp of the last emitted request,
+    so the emitted timestamps are always monotonic
+
+    usage:
+        reorder = ReorderBuffer(window=300)
+        for ts, lbn, req_size, op in chunks:
+            splitter.write(*reorder.push(ts, lbn, req_size, op))
+        splitter.write(*reorder.flush())
+        reorder.n_out_of_order, reorder.n_late
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self._buf = None
+        self._last_in_ts = None
+        self.last_ts = None
+        self.max_ts = None
+        # the number of requests earlier than the previous request in the input
+        self.n_out_of_order = 0
+        # the number of requests whose timestamps are changed
+        self.n_late = 0
+
+    def __len__(self):
+        return 0 if self._buf is None else len(self._buf[0])
+
+    def push(self, ts, *columns):
+        """add a chunk of requests
+
+        Args:
+            ts (np.ndarray): the timestamp of each request
+            *columns (np.ndarray): other columns of the requests
+
+        Returns:
+            tuple: (ts, *columns) of the requests that are ready, sorted by ts, may be empty
+        """
+
+        ts = np.asarray(ts)
+        columns = [np.asarray(col) for col in columns]
+        if len(ts) == 0:
+            return (ts, *columns)
+
+        n_out_of_order = int(np.sum(ts[1:] < ts[:-1]))
+        if self._last_in_ts is not None and ts[0] < self._last_in_ts:
+            n_out_of_order += 1
+        self.n_out_of_order += n_out_of_order
+        self._last_in_ts = ts[-1]
+
+        if self.last_ts is not None:
+            late = ts < self.last_ts
+            if late.any():
+                self.n_late += int(late.sum())
+                ts = np.where(late, self.last_ts, ts)
+
+        chunk_max_ts = ts.max()
+        if self.max_ts is None or chunk_max_ts > self.max_ts:
+            self.max_ts = chunk_max_ts
+
+        if self._buf is not None:
+            ts = np.concatenate([self._buf[0], ts])
+            columns = [np.concatenate([b, c]) for b, c in zip(self._buf[1:], columns)]
+        if np.any(ts[1:] < ts[:-1]):
+            order = np.argsort(ts, kind="stable")
+            ts = ts[order]
+            columns = [col[order] for col in columns]
+
+        n_ready = int(np.searchsorted(ts, self.max_ts - self.window, side="right"))
+        self._buf = [ts[n_ready:]] + [col[n_ready:] for col in columns]
+        return self._emit(ts[:n_ready], [col[:n_ready] for col in columns])
+
+    def flush(self):
+        """emit all the buffered requests, an empty tuple if nothing has been pushed"""
+
+        if self._buf is None:
+            return ()
+        ts, *columns = self._buf
+        self._buf = None
+        return self._emit(ts, columns)
+
+    def _emit(self, ts, columns):
+        if len(ts) > 0:
+            self.last_ts = ts[-1]
+        return (ts, *columns)
+
+
+def write_block_stat(stat_path, ifilepath, stat, block_size):
+    """write the stat of a preprocessed block trace
+
+    Args:
+        stat (dict): n_original_req, n_req, n_obj, n_byte, n_read, n_write, n_delete,
+            start_ts and end_ts
+        block_size (int): the block size, n_uniq_byte is n_obj * block_size
+    """
+
+    with open(stat_path, "w") as f:
+        f.write(ifilepath + "\n")
+        f.write("n_original_req: {}\n".format(stat["n_original_req"]))
+        f.write("n_req:          {}\n".format(stat["n_req"]))
+        f.write("n_obj:          {}\n".format(stat["n_obj"]))
+        f.write("n_byte:         {}\n".format(stat["n_byte"]))
+        f.write("n_uniq_byte:    {}\n".format(stat["n_obj"] * block_size))
+        f.write("n_read:         {}\n".format(stat["n_read"]))
+        f.write("n_write:        {}\n".format(stat["n_write"]))
+        f.write("n_delete:       {}\n".format(stat["n_delete"]))
+        f.write("start_ts:       {}\n".format(stat["start_ts"]))
+        f.write("end_ts:         {}\n".format(stat["end_ts"]))
+        f.write("duration:       {}\n".format(stat["end_ts"] - stat["start_ts"]))
+
+    print(open(stat_path, "r").read().strip("\n"))
+
+
+class _ShardWriter:
+    """append packed lcs records (without header) to a shard file"""
+
+    def __init__(self, path, version):
+        self.pack_records = _import_lcs_writer().pack_records
+        self.version = version
+        self.file = open(path, "wb")
+
+    def write(self, **columns):
+        self.file.write(self.pack_records(self.version, **columns).tobytes())
+
+    def close(self):
+        self.file.close()
+
+
+def _convert_shard(parse_range, ifilepath, byte_range, shard_path, block_size, version):
+    """convert the requests in byte_range of the trace to a shard file"""
+
+    shard = _ShardWriter(shard_path, version)
+    splitter = BlockSplitter(None, block_size, shard)
+    stat = parse_range(ifilepath, splitter, block_size, byte_range)
+    shard.close()
+    stat.update(n_req=splitter.n_req, n_byte=splitter.n_byte)
+
+    return stat
+
+
+def _open_shards(shard_paths, raw_dtype):
+    return [
+        np.memmap(path, dtype=raw_dtype, mode="r")
+        for path in shard_paths
+        if os.path.getsize(path) > 0
+    ]
+
+
+def merge_shards(shard_paths, lcs_writer, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """k-way merge the records in shard files by clock_time and write them to lcs_writer,
+    records with the same clock_time are ordered by shard and then by their order in the shard,
+    so the shards of consecutive byte ranges of a trace ordered by time are merged
+    into the same order as converting the trace sequentially
+
+    Args:
+        shard_paths (List[str]): files of records with dtype LCS_RAW_DTYPE[lcs_writer.version]
+        lcs_writer (LcsWriter): the writer of the merged trace
+        chunk_rows (int, optional): the number of records read from each shard at a time
+    """
+
+    shards = _open_shards(shard_paths, lcs_writer.raw_dtype)
+    pos = [0] * len(shards)
+    while True:
+        active = [i for i in range(len(shards)) if pos[i] < len(shards[i])]
+        if not active:
+            break
+
+        bufs = {i: shards[i][pos[i] : pos[i] + chunk_rows] for i in active}
+        # the records after the buffer of shard i are not before (its last clock_time, i),
+        # so the records before the smallest of them (bound) are final
+        bound = min(
+            (
+                (int(bufs[i]["clock_time"][-1]), i)
+                for i in active
+                if pos[i] + len(bufs[i]) < len(shards[i])
+            ),
+            default=None,
+        )
+
+        pieces = []
+        for i in active:
+            buf = bufs[i]
+            n = len(buf)
+            if bound is not None and i != bound[1]:
+                # (clock_time, i) < bound
+                ts_bound = bound[0] + 1 if i < bound[1] else bound[0]
+                late = buf["clock_time"] >= ts_bound
+                if late.any():
+                    n = int(np.argmax(late))
+            pieces.append(buf[:n])
+            pos[i] += n
+
+        records = np.concatenate(pieces)
+        lcs_writer.write(records[np.argsort(records["clock_time"], kind="stable")])
+
+
+def _group_path(shard_path, group):
+    return f"{shard_path}.group{group}"
+
+
+def _split_shard(shard_path, version, n_group):
+    """split the records of a shard by vol_id % n_group into _group_path(shard_path, group)
+    and remove the shard, each group keeps the order of the shard
+    """
+
+    raw_dtype = _import_lcs_writer().LCS_RAW_DTYPE[version]
+    files = [open(_group_path(shard_path, group), "wb") for group in range(n_group)]
+    for shard in _open_shards([shard_path], raw_dtype):
+        for start in range(0, len(shard), DEFAULT_CHUNK_ROWS):
+            chunk = shard[start : start + DEFAULT_CHUNK_ROWS]
+            group = (chunk["op_tenant"] >> np.uint32(8)) % np.uint32(n_group)
+            order = np.argsort(group, kind="stable")
+            chunk, group = chunk[order], group[order]
+            bounds = np.searchsorted(group, np.arange(n_group + 1))
+            for g in range(n_group):
+                if bounds[g] < bounds[g + 1]:
+                    files[g].write(chunk[bounds[g] : bounds[g + 1]].tobytes())
+    for f in files:
+        f.close()
+    # the shard has been merged into the lcs trace before
+    os.remove(shard_path)
+
+
+def _write_volumes(shard_paths, version, group, pathbase, frame_rows, lcs_compression):
+    """write one lcs trace per volume (tenant) for the volumes in a group,
+    the records of the group have been split from each shard by _split_shard
+    """
+
+    lcs_writer = _import_lcs_writer()
+    raw_dtype = lcs_writer.LCS_RAW_DTYPE[version]
+
+    group_paths = [_group_path(path, group) for path in shard_paths]
+    shards = _open_shards(group_paths, raw_dtype)
+    if not shards:
+        return []
+
+    # the same order as merge_shards in each volume
+    records = np.concatenate(shards)
+    del shards
+    for path in group_paths:
+        if os.path.exists(path):
+            os.remove(path)
+    vol_id = records["op_tenant"] >> np.uint32(8)
+    order = np.lexsort((records["clock_time"], vol_id))
+    records, vol_id = records[order], vol_id[order]
+
+    paths = []
+    bounds = np.flatnonzero(np.diff(vol_id)) + 1
+    for vol_records in np.split(records, bounds):
+        if len(vol_records) == 0:
+            continue
+        path = f"{pathbase}.vol{vol_records['op_tenant'][0] >> 8}.lcs.zst"
+        with lcs_writer.LcsWriter(
+            path,
+            version=version,
+            level=lcs_compression["level"],
+            frame_rows=frame_rows,
+            n_thread=1,
+            long_distance=lcs_compression["long_distance"],
+        ) as writer:
+            writer.write(vol_records)
+        paths.append(path)
+        if frame_rows > 0:
+            paths.append(path + lcs_writer.LCS_FRAME_INDEX_SUFFIX)
+
+    return paths
+
+
+def convert_sharded(
+    ifilepath,
+    lcs_path,
+    stat_path,
+    parse_range,
+    block_size,
+    n_proc,
+    per_volume=False,
+    seekable_frame_rows=0,
+    version=2,
+    tmp_dir=None,
+    lcs_compression=LCS_COMPRESSION,
+):
+    """convert a csv block trace with multiple processes,
+    the trace is split into n_proc byte ranges, each process parses a range and writes
+    its blocks to a shard file, then the shards are merged by time (see merge_shards)
+    into lcs_path.zst, and with per_volume, also written to one lcs trace per volume
+
+    Args:
+        parse_range (Callable): parse_range(ifilepath, splitter, block_size, byte_range)
+            writes the blocks of the requests in byte_range to splitter (BlockSplitter)
+            and returns a dict of n_original_req, n_read, n_write, n_delete, start_ts, end_ts,
+            it is sent to the worker processes so it must be defined at module level
+        per_volume (bool, optional): also write lcs_path(without .lcs).vol{vol_id}.lcs.zst,
+            the tenant of the requests is the volume id
+        seekable_frame_rows (int, optional): see post_process
+        version (int, optional): the lcs version
+        tmp_dir (str, optional): the directory of the shard files (about the size of the
+            uncompressed lcs trace), default: the directory of lcs_path
+        lcs_compression (dict, optional): see open_lcs_writer, the per-volume traces
+            are compressed with the same settings and one thread each
+
+    Returns:
+        List[str]: the paths of the per-volume traces and their frame indexes
+    """
+
+    if n_proc <= 0:
+        n_proc = os.cpu_count()
+    if tmp_dir is None:
+        tmp_dir = os.path.dirname(os.path.abspath(lcs_path))
+    shard_dir = tempfile.mkdtemp(prefix="lcs_shard_", dir=tmp_dir)
+
+    ranges = split_byte_ranges(ifilepath, n_proc)
+    shard_paths = [os.path.join(shard_dir, f"shard{i}") for i in range(len(ranges))]
+    try:
+        with ProcessPoolExecutor(n_proc) as executor:
+            futures = [
+                executor.submit(
+                    _convert_shard,
+                    parse_range,
+                    ifilepath,
+                    byte_range,
+                    shard_path,
+                    block_size,
+                    version,
+                )
+                for byte_range, shard_path in zip(ranges, shard_paths)
+            ]
+            shard_stats = [f.result() for f in futures]
+
+        with open_lcs_writer(
+            lcs_path, version, seekable_frame_rows, lcs_compression=lcs_compression
+        ) as lcs_writer:
+            merge_shards(shard_paths, lcs_writer)
+
+        vol_paths = []
+        if per_volume:
+            lcs_pathbase = (
+                lcs_path[: -len(".lcs")] if lcs_path.endswith(".lcs") else lcs_path
+            )
+            # each group of volumes is loaded in memory at once
+            max_mem_rows = _import_lcs_writer().DEFAULT_MAX_MEM_ROWS
+            n_group = max(n_proc, math.ceil(lcs_writer.n_req / max_mem_rows))
+            with ProcessPoolExecutor(n_proc) as executor:
+                # each shard is read once to split its records into the groups
+                futures = [
+                    executor.submit(_split_shard, path, version, n_group)
+                    for path in shard_paths
+                ]
+                for f in futures:
+                    f.result()
+                futures = [
+                    executor.submit(
+                        _write_volumes,
+                        shard_paths,
+                        version,
+                        group,
+                        lcs_pathbase,
+                        seekable_frame_rows,
+                        lcs_compression,
+                    )
+                    for group in range(n_group)
+                ]
+                for f in futures:
+                    vol_paths += f.result()
+    finally:
+        # the shards and the groups split from them
+        for name in os.listdir(shard_dir):
+            os.remove(os.path.join(shard_dir, name))
+        os.rmdir(shard_dir)
+
+    shard_stats = [stat for stat in shard_stats if stat["start_ts"] is not None]
+    stat = {
+        name: sum(s[name] for s in shard_stats)
+        for name in (
+            "n_original_req",
+            "n_req",
+            "n_byte",
+            "n_read",
+            "n_write",
+            "n_delete",
+        )
+    }
+    stat["n_obj"] = lcs_writer.stat["n_obj"]
+    stat["start_ts"] = shard_stats[0]["start_ts"] if shard_stats else None
+    stat["end_ts"] = shard_stats[-1]["end_ts"] if shard_stats else None
+    write_block_stat(stat_path, ifilepath, stat, block_size)
+    print(f"Converted trace is saved to {lcs_path}.zst")
+    if per_volume:
+        n_vol = sum(path.endswith(".lcs.zst") for path in vol_paths)
+        print(f"{n_vol} per-volume traces are saved to {lcs_pathbase}.vol*.lcs.zst")
+
+    return vol_paths
+
+
+def compress_file(ifilepath, ofilepath=None, level=3, long_distance=False, n_thread=1):
+    """compress a file to .zst with zstandard in this process and print the compression ratio
+    and speed, the output is the same format as the zstd command line
+
+    Args:
+        ifilepath (str): the file to compress
+        ofilepath (str, optional): the output path, default: ifilepath + ".zst",
+            written to ofilepath + ".tmp" first and renamed when the compression finishes
+        level (int, optional): zstd compression level
+        long_distance (bool, optional): long-distance matching with a 128 MiB window,
+            i.e., `zstd --long`
+        n_thread (int, optional): the number of zstd worker threads
+
+    Returns:
+        CompressStat: the sizes and the time of the compression
+    """
+
+    import zstandard as zstd
+
+    if ofilepath is None:
+        ofilepath = ifilepath + ".zst"
+
+    start_time = time.time()
+    in_bytes = os.path.getsize(ifilepath)
+    params = zstd.ZstdCompressionParameters.from_level(
+        level,
+        source_size=in_bytes,
+        threads=n_thread,
+        enable_ldm=long_distance,
+        window_log=ZSTD_LONG_WINDOW_LOG if long_distance else 0,
+        write_checksum=True,
+    )
+    cctx = zstd.ZstdCompressor(compression_params=params)
+    # a partial output of an interrupted compression is never left under ofilepath
+    with open(ifilepath, "rb") as ifile, open(ofilepath + ".tmp", "wb") as ofile:
+        _, out_bytes = cctx.copy_stream(ifile, ofile, size=in_bytes)
+    os.replace(ofilepath + ".tmp", ofilepath)
+    elapsed = time.time() - start_time
+
+    print(
+        f"{ifilepath} is compressed to {ofilepath}: {in_bytes / 1e6:.1f} MB -> "
+        f"{out_bytes / 1e6:.1f} MB, ratio {in_bytes / max(out_bytes, 1):.2f}, "
+        f"{in_bytes / 1e6 / max(elapsed, 1e-6):.1f} MB/s"
+    )
+    return CompressStat(ifilepath, ofilepath, in_bytes, out_bytes, elapsed)
+
+
+class BackgroundCompressor:
+    """compress files with compress_file in background threads, zstandard releases the GIL
+    so that the conversion continues while a file is being compressed
+
+    Args:
+        n_worker (int, optional): the number of files compressed at the same time
+    """
+
+    def __init__(self, n_worker=2):
+        self._executor = ThreadPoolExecutor(max_workers=n_worker)
+        self._futures = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, ifilepath):
+        return ifilepath in self._futures
+
+    def submit(self, ifilepath, **compression):
+        """start compressing ifilepath, compression is the arguments of compress_file"""
+
+        self._futures[ifilepath] = self._executor.submit(
+            compress_file, ifilepath, **compression
+        )
+
+    def result(self, ifilepath):
+        """wait for the compression of ifilepath
+
+        Returns:
+            CompressStat: the stat of the compression
+        """
+
+        return self._futures.pop(ifilepath).result()
+
+    def when_done(self, ifilepaths, fn):
+        """run fn() once the compressions of ifilepaths finish, without waiting for them
+
+        Returns:
+            Future: the result of fn(), or the exception of a failed compression or fn()
+        """
+
+        futures = [self._futures.pop(ifilepath) for ifilepath in ifilepaths]
+        done = Future()
+        n_pending = [len(futures)]
+        lock = threading.Lock()
+
+        def finish():
+            try:
+                for future in futures:
+                    future.result()
+                done.set_result(fn())
+            except BaseException as e:
+                done.set_exception(e)
+
+        def on_done(_):
+            with lock:
+                n_pending[0] -= 1
+                if n_pending[0] > 0:
+                    return
+            finish()
+
+        if not futures:
+            finish()
+        for future in futures:
+            future.add_done_callback(on_done)
+
+        return done
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def _move_to_dir(path, dir_path):
+    """move path into dir_path, replacing a file with the same name, if path exists"""
+
+    if os.path.exists(path):
+        shutil.move(path, os.path.join(dir_path, os.path.basename(path)))
+
+
+def post_process(
+    ifilepath,
+    prelcs_path,
+    stat_path,
+    lcs_path,
+    seekable_frame_rows=0,
+    extra_lcs_paths=(),
+    lcs_compression=LCS_COMPRESSION,
+    trace_compression=TRACE_COMPRESSION,
+    compressor=None,
+    defer_compression=False,
+):
+    """move the stat, compress the lcs trace and the original trace
+
+    Args:
+        seekable_frame_rows (int, optional): if positive, compress the lcs trace into
+            independent frames of seekable_frame_rows requests with a frame index
+            (see lcs_writer.compress_seekable) so that it can be decoded in parallel
+            and accessed randomly. Defaults to 0, i.e., a single zstd stream.
+        lcs_compression (dict, optional): the arguments of compress_file for the lcs trace
+        trace_compression (dict, optional): the arguments of compress_file for the original trace
+        compressor (BackgroundCompressor, optional): the compressor to use, the original trace
+            may have been submitted to it before post_process (e.g., by pipeline.run_pipeline),
+            post_process returns without waiting for it so that the caller can convert
+            the next trace while this one is being compressed
+        defer_compression (bool, optional): do not compress the lcs trace and the original trace,
+            save the arguments to ifilepath + COMPRESS_JOB_SUFFIX instead,
+            the caller (e.g., batch.py) compresses them later with run_compress_job
+
+    Returns:
+        Future: done when the trace is compressed and moved, it is already done
+            if compressor is None, None if defer_compression
+
+    without a compressor, the lcs trace and the original trace are compressed at the same time
+    in this process, and post_process returns after they are compressed
+
+    in the --direct mode, prelcs_path is None and lcs_path.zst has been written
+    by open_lcs_writer, so it is only moved, extra_lcs_paths (e.g., per-volume traces)
+    are moved to the lcs directory as well
+
+    a file that is already moved or removed is skipped, so an interrupted post_process
+    can be run again
+    """
 
-def post_process(ifilepath, prelcs_path, stat_path, lcs_path):
     dir_path = os.path.dirname(ifilepath)
     if len(dir_path) > 0:
         dir_path += "/"
-    if not os.path.exists(dir_path + "stat"):
-        os.mkdir(dir_path + "stat")
-        os.mkdir(dir_path + "lcs")
-        os.mkdir(dir_path + "finished")
+    for sub_dir in ("stat", "lcs", "finished"):
+        os.makedirs(dir_path + sub_dir, exist_ok=True)
+
+    # a missing lcs trace means that the conversion failed, not that it has been moved
+    lcs_name = os.path.basename(lcs_path) + ".zst"
+    if not any(
+        os.path.exists(path)
+        for path in (lcs_path, f"{lcs_path}.zst", f"{dir_path}lcs/{lcs_name}")
+    ):
+        raise FileNotFoundError(f"{lcs_path} is not converted")
+
+    # every step checks its input, so an interrupted post_process can be run again,
+    # e.g., the original trace has been removed after it is compressed
+    _move_to_dir(stat_path, f"{dir_path}stat")
+
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from lcs_reader import LCS_FRAME_INDEX_SUFFIX
+
+    def move_lcs():
+        # the frame index exists if seekable_frame_rows > 0
+        _move_to_dir(f"{lcs_path}.zst{LCS_FRAME_INDEX_SUFFIX}", f"{dir_path}lcs")
+        _move_to_dir(f"{lcs_path}.zst", f"{dir_path}lcs")
+        for path in extra_lcs_paths:
+            _move_to_dir(path, f"{dir_path}lcs")
+
+    def finish():
+        move_lcs()
+        for path in (
+            ifilepath,
+            prelcs_path,
+            lcs_path if prelcs_path is not None else None,
+            ifilepath + COMPRESS_JOB_SUFFIX,
+        ):
+            if path is not None and os.path.exists(path):
+                os.remove(path)
+        _move_to_dir(ifilepath + ".zst", f"{dir_path}finished")
+
+    compress_lcs = prelcs_path is not None and os.path.exists(lcs_path)
+    if compress_lcs and seekable_frame_rows > 0:
+        from lcs_writer import compress_seekable
+
+        compress_seekable(
+            lcs_path,
+            frame_rows=seekable_frame_rows,
+            level=lcs_compression["level"],
+            n_thread=lcs_compression["n_thread"],
+            long_distance=lcs_compression["long_distance"],
+        )
+        os.remove(lcs_path)
+        compress_lcs = False
+
+    if defer_compression:
+        if not compress_lcs:
+            move_lcs()
+        job = {
+            "ifilepath": ifilepath,
+            "prelcs_path": prelcs_path,
+            "stat_path": stat_path,
+            "lcs_path": lcs_path,
+            "extra_lcs_paths": list(extra_lcs_paths),
+            "lcs_compression": lcs_compression,
+            "trace_compression": trace_compression,
+        }
+        job_path = ifilepath + COMPRESS_JOB_SUFFIX
+        with open(job_path + ".tmp", "w") as f:
+            json.dump(job, f)
+        os.replace(job_path + ".tmp", job_path)
+        print(f"the compression of {ifilepath} is saved to {job_path}")
+        return None
+
+    own_compressor = compressor is None
+    if own_compressor:
+        compressor = BackgroundCompressor()
+    try:
+        if os.path.exists(ifilepath) and ifilepath not in compressor:
+            compressor.submit(ifilepath, **trace_compression)
+        if compress_lcs:
+            compressor.submit(lcs_path, **lcs_compression)
+        done = compressor.when_done(
+            [path for path in (ifilepath, lcs_path) if path in compressor], finish
+        )
+    finally:
+        if own_compressor:
+            compressor.close()
+    if own_compressor:
+        done.result()
+
+    return done
+
+
+def run_compress_job(job_path, compressor=None):
+    """start the compression saved by post_process(defer_compression=True),
+    the job file is removed once the trace is compressed and moved
+
+    Args:
+        job_path (str): the job file, ifilepath + COMPRESS_JOB_SUFFIX
+        compressor (BackgroundCompressor, optional): see post_process
+
+    Returns:
+        Future: see post_process
+    """
+
+    with open(job_path, "r") as f:
+        job = json.load(f)
+
+    return post_process(**job, compressor=compressor)
+
+
+def add_compression_args(parser):
+    """add the zstd settings of post_process to the ArgumentParser of a converter"""
+
+    for name, default in (("lcs", LCS_COMPRESSION), ("trace", TRACE_COMPRESSION)):
+        parser.add_argument(
+            f"--{name}-zstd-level",
+            type=int,
+            help=f"zstd level of the {name} trace",
+            default=default["level"],
+        )
+        parser.add_argument(
+            f"--{name}-zstd-long",
+            type=int,
+            choices=(0, 1),
+            help=f"zstd long-distance matching of the {name} trace",
+            default=int(default["long_distance"]),
+        )
+        parser.add_argument(
+            f"--{name}-zstd-threads",
+            type=int,
+            help=f"zstd threads of the {name} trace",
+            default=default["n_thread"],
+        )
+    parser.add_argument(
+        "--defer-compression",
+        action="store_true",
+        help=f"save the compression to <trace>{COMPRESS_JOB_SUFFIX} instead of running it, "
+        "batch.py compresses it while converting the next trace",
+        default=False,
+    )
+
 
-    shutil.move(stat_path, f"{dir_path}stat/")
+def compression_args(args):
+    """the compression arguments of post_process from the arguments of add_compression_args
 
-    subprocess.run("zstd -16 --long -T16 " + lcs_path, shell=True)
-    shutil.move(f"{lcs_path}.zst", f"{dir_path}lcs/")
+    Returns:
+        dict: lcs_compression, trace_compression and defer_compression
+    """
 
-    subprocess.run("zstd -8 -T4 " + ifilepath, shell=True)
-    os.remove(ifilepath)
-    os.remove(prelcs_path)
-    os.remove(lcs_path)
+    compression = {"defer_compression": args.defer_compression}
+    for name in ("lcs", "trace"):
+        compression[f"{name}_compression"] = {
+            "level": getattr(args, f"{name}_zstd_level"),
+            "long_distance": bool(getattr(args, f"{name}_zstd_long")),
+            "n_thread": getattr(args, f"{name}_zstd_threads"),
+        }
 
-    shutil.move(ifilepath + ".zst", f"{dir_path}finished/")
+    return compression
@@ -0,0 +1,382 @@
+"""
+a typed binary format (npz) of the plot data of traceAnalyzer
+
+the text output of traceAnalyzer (e.g., trace.reuseWindow_w300_rt) is parsed line by line,
+which is slow for the per-window data with thousands of windows, so the same data
+can be saved as trace.reuseWindow_w300_rt.npz next to the text file,
+the npz has the arrays of the data and a json metadata (the kind of data, time window,
+time granularity, log base ...), the loaders in traceAnalysis use the npz when it exists,
+the arrays are compressed and the counts are saved with the smallest int type
+
+the per-window data have a different number of buckets in each window,
+they are saved as the concatenated counts (cnt) and the start of each window (offsets),
+i.e., the counts of window i are cnt[offsets[i] : offsets[i + 1]]
+
+lcs_analyzer.py writes the npz files together with the text files,
+the text files of the C++ traceAnalyzer can be converted once with
+    python3 utils/plot_data_utils.py trace.reuseWindow_w300_rt trace.sizeWindow_w300_req ...
+
+"""
+
+import os
+import re
+import json
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+PLOT_DATA_SUFFIX = ".npz"
+
+# the kinds of plot data and their arrays
+#   reuse: rtime_bucket, rtime_cnt, vtime_bucket, vtime_cnt
+#   reuseWindow: cnt, offsets
+#   sizeWindow: cnt, offsets
+#   popularityDecay: n_obj (the lower triangular matrix of window x create window)
+#   popularity: freq, n_obj (n_obj[i] objects are requested freq[i] times, freq is descending)
+PLOT_DATA_KINDS = (
+    "reuse",
+    "reuseWindow",
+    "sizeWindow",
+    "popularityDecay",
+    "popularity",
+)
+
+
+def _min_int_dtype(arr: np.ndarray) -> np.ndarray:
+    """the counts are saved with the smallest int type and loaded as int64"""
+
+    if arr.dtype.kind != "i" or arr.size == 0:
+        return arr
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= arr.min() and arr.max() <= info.max:
+            return arr.astype(dtype)
+    return arr
+
+
+def save_plot_data(path: str, kind: str, arrays: Dict[str, np.ndarray], **metadata):
+    """save plot data to a npz file
+
+    Args:
+        path (str): the path of the npz file, PLOT_DATA_SUFFIX is added if it does not end with it
+        kind (str): the kind of plot data, one of PLOT_DATA_KINDS
+        arrays (Dict[str, np.ndarray]): the arrays of the data
+        metadata: the parameters of the data, e.g., time_window, log_base
+    """
+
+    assert kind in PLOT_DATA_KINDS, "unknown plot data kind " + kind
+    assert "metadata" not in arrays, "metadata is reserved"
+    if not path.endswith(PLOT_DATA_SUFFIX):
+        path += PLOT_DATA_SUFFIX
+
+    metadata = dict(metadata, kind=kind)
+    arrays = {name: _min_int_dtype(np.asarray(arr)) for name, arr in arrays.items()}
+    # write to a temporary file so that a loader never sees a partial file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(f, metadata=np.array(json.dumps(metadata)), **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_plot_data(
+    path: str, kind: Optional[str] = None
+) -> Tuple[Dict[str, np.ndarray], dict]:
+    """load plot data from a npz file
+
+    Args:
+        path (str): the path of the npz file
+        kind (str, optional): the expected kind of plot data
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], dict]: arrays, metadata
+    """
+
+    with np.load(path, allow_pickle=False) as data:
+        metadata = json.loads(str(data["metadata"]))
+        arrays = {
+            name: (
+                data[name].astype(np.int64)
+                if data[name].dtype.kind == "i"
+                else data[name]
+            )
+            for name in data.files
+            if name != "metadata"
+        }
+
+    assert kind is None or metadata["kind"] == kind, (
+        f"the input file might not be {kind} data file, it is {metadata['kind']} data "
+        + path
+    )
+
+    return arrays, metadata
+
+
+def find_plot_data(datapath: str) -> Optional[str]:
+    """find the npz file of a text data file,
+    the npz is not used if the text file is newer (e.g., traceAnalyzer has been re-run)
+
+    Args:
+        datapath (str): the path of the text data file or the npz file
+
+    Returns:
+        Optional[str]: the path of the npz file, None if there is no npz file
+    """
+
+    if datapath.endswith(PLOT_DATA_SUFFIX):
+        return datapath
+
+    npz_path = datapath + PLOT_DATA_SUFFIX
+    if not os.path.exists(npz_path):
+        return None
+    if os.path.exists(datapath) and os.path.getmtime(datapath) > os.path.getmtime(
+        npz_path
+    ):
+        return None
+
+    return npz_path
+
+
+def rows_to_csr(rows: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    """concatenate the per-window counts
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: cnt, offsets
+    """
+
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=offsets[1:])
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.int64), offsets
+
+    return np.concatenate(rows).astype(np.int64, copy=False), offsets
+
+
+def csr_to_dense(cnt: np.ndarray, offsets: np.ndarray, dtype=None) -> np.ndarray:
+    """the per-window counts as a matrix of n_window x max number of buckets,
+    the buckets after the end of a window are 0
+    """
+
+    lengths = np.diff(offsets)
+    dim = int(lengths.max()) if len(lengths) > 0 else 0
+    dense = np.zeros((len(lengths), dim), dtype=dtype or cnt.dtype)
+    # the index of cnt[i] in the flattened matrix is i - offsets[w] + w * dim for window w
+    shift = np.arange(len(lengths), dtype=np.int64) * dim - offsets[:-1]
+    dense.ravel()[np.arange(len(cnt)) + np.repeat(shift, lengths)] = cnt
+
+    return dense
+
+
+def _read_header(ifile) -> str:
+    """skip the data line and return the desc line"""
+
+    _data_line = ifile.readline()
+    return ifile.readline()
+
+
+def _read_rows(ifile) -> Tuple[np.ndarray, np.ndarray]:
+    """read the rest of the file as comma-terminated rows of int, one row per line"""
+
+    lines = ifile.read().splitlines()
+    # every value is followed by a comma
+    cnt = np.fromstring("".join(lines), dtype=np.int64, sep=",")
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum([line.count(",") for line in lines], out=offsets[1:])
+    assert offsets[-1] == len(cnt), "the rows are not comma-terminated"
+
+    return cnt, offsets
+
+
+def _read_kv_section(lines: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    if not lines:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    kv = np.array([line.split(":") for line in lines], dtype=np.int64)
+    return kv[:, 0], kv[:, 1]
+
+
+def convert_reuse(datapath: str, ofilepath: str):
+    with open(datapath) as ifile:
+        desc_line = _read_header(ifile)
+        m = re.match(
+            r"# reuse real time: freq \(time granularity (?P<tg>\d+)\)", desc_line
+        )
+        assert m is not None, (
+            "the input file might not be reuse data file, desc line "
+            + desc_line
+            + " data "
+            + datapath
+        )
+        time_granularity = int(m.group("tg"))
+        log_base = 1.5
+
+        sections = [[], []]
+        curr = sections[0]
+        for line in ifile:
+            if line[0] == "#" and "virtual time" in line:
+                m = re.match(
+                    r"# reuse virtual time: freq \(log base (?P<lb>\d+\.?\d*)\)", line
+                )
+                assert m is not None, (
+                    "the input file might not be "
+                    f"reuse data file, desc line {line} data {datapath}"
+                )
+                log_base = float(m.group("lb"))
+                curr = sections[1]
+            elif line.strip():
+                curr.append(line)
+
+    rtime_bucket, rtime_cnt = _read_kv_section(sections[0])
+    vtime_bucket, vtime_cnt = _read_kv_section(sections[1])
+    save_plot_data(
+        ofilepath,
+        "reuse",
+        {
+            "rtime_bucket": rtime_bucket,
+            "rtime_cnt": rtime_cnt,
+            "vtime_bucket": vtime_bucket,
+            "vtime_cnt": vtime_cnt,
+        },
+        time_granularity=time_granularity,
+        log_base=log_base,
+    )
+
+
+def convert_reuse_window(datapath: str, ofilepath: str):
+    with open(datapath) as ifile:
+        desc_line = _read_header(ifile)
+        m = re.search(
+            r"# reuse (?P<time>real|virtual) time distribution per window "
+            r"\((time granularity (?P<tg>\d+)|log base (?P<lb>\d+\.?\d*)), time window (?P<tw>\d+)\)",
+            desc_line,
+        )
+        assert m is not None, (
+            "the input file might not be reuse heatmap data file, desc line "
+            + desc_line
+            + "data "
+            + datapath
+        )
+        cnt, offsets = _read_rows(ifile)
+
+    # time_granularity is for real time, log_base is for virtual time, the other one is 0
+    save_plot_data(
+        ofilepath,
+        "reuseWindow",
+        {"cnt": cnt, "offsets": offsets},
+        time=m.group("time"),
+        time_window=int(m.group("tw")),
+        time_granularity=int(m.group("tg") or 0),
+        log_base=float(m.group("lb") or 0),
+    )
+
+
+def convert_size_window(datapath: str, ofilepath: str):
+    with open(datapath) as ifile:
+        desc_line = _read_header(ifile)
+        m = re.search(
+            r"# (object_size): (?P<cnt>\w\w\w)_cnt \(time window (?P<tw>\d+), "
+            r"log_base (?P<logb>\d+\.?\d*), size_base (?P<sizeb>\d+)\)",
+            desc_line,
+        )
+        assert m is not None, (
+            "the input file might not be size heatmap data file, desc line "
+            + desc_line
+            + " data "
+            + datapath
+        )
+        cnt, offsets = _read_rows(ifile)
+
+    save_plot_data(
+        ofilepath,
+        "sizeWindow",
+        {"cnt": cnt, "offsets": offsets},
+        cnt=m.group("cnt"),
+        time_window=int(m.group("tw")),
+        log_base=float(m.group("logb")),
+        size_base=int(m.group("sizeb")),
+    )
+
+
+def convert_popularity_decay(datapath: str, ofilepath: str):
+    with open(datapath) as ifile:
+        desc_line = _read_header(ifile)
+        assert "cnt for new" in desc_line, (
+            "the input file might not be popularityDecay data file: " + datapath
+        )
+        time_window = int(desc_line.split()[11].strip("()"))
+        cnt, offsets = _read_rows(ifile)
+
+    # the first row is 0 and row i + 1 has i + 1 windows followed by 0
+    lengths = np.diff(offsets)
+    assert len(lengths) > 0 and lengths[0] == 1, (
+        "the first line should be 0, " + datapath
+    )
+    assert np.array_equal(lengths[1:], np.arange(2, len(lengths) + 1)), (
+        "data len is inconsistent " + datapath
+    )
+    assert np.all(cnt[offsets[1:] - 1] == 0), (
+        "the last element should be 0, " + datapath
+    )
+
+    n_obj = csr_to_dense(cnt, offsets)[1:, :-1]
+    save_plot_data(
+        ofilepath,
+        "popularityDecay",
+        {"n_obj": n_obj},
+        time_window=time_window,
+    )
+
+
+def convert_popularity(datapath: str, ofilepath: str):
+    with open(datapath) as ifile:
+        desc_line = _read_header(ifile)
+        assert "# freq (sorted):cnt" in desc_line, (
+            "the input file might not be popularity freq data file "
+            + "data "
+            + datapath
+        )
+        freq, n_obj = _read_kv_section([line for line in ifile if line.strip()])
+
+    save_plot_data(ofilepath, "popularity", {"freq": freq, "n_obj": n_obj})
+
+
+def convert_plot_data(datapath: str, ofilepath: Optional[str] = None) -> str:
+    """convert a text data file of traceAnalyzer to npz,
+    the kind of data is found from the file name
+
+    Args:
+        datapath (str): the path of the text data file
+        ofilepath (str, optional): the path of the npz file, defaults to datapath + PLOT_DATA_SUFFIX
+
+    Returns:
+        str: the path of the npz file
+    """
+
+    if ofilepath is None:
+        ofilepath = datapath + PLOT_DATA_SUFFIX
+
+    name = os.path.basename(datapath)
+    if ".reuseWindow" in name:
+        convert_reuse_window(datapath, ofilepath)
+    elif ".sizeWindow" in name:
+        convert_size_window(datapath, ofilepath)
+    elif ".popularityDecay" in name:
+        convert_popularity_decay(datapath, ofilepath)
+    elif name.endswith(".reuse"):
+        convert_reuse(datapath, ofilepath)
+    elif name.endswith(".popularity"):
+        convert_popularity(datapath, ofilepath)
+    else:
+        raise RuntimeError("unknown plot data " + datapath)
+
+    return ofilepath
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(
+        description="convert the text output of traceAnalyzer to npz"
+    )
+    ap.add_argument("datapath", type=str, nargs="+", help="data path")
+    p = ap.parse_args()
+
+    for datapath in p.datapath:
+        print(convert_plot_data(datapath))
@@ -21,6 +21,7 @@ def extract_dataname(datapath: str) -> str:
         ".csv",
         ".txt",
         ".gz",
+        ".npz",
     ]
     l2 = ["_w300", "_w60", "_obj", "_req"]
     l3 = [